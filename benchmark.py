@@ -0,0 +1,445 @@
+"""
+Benchmarks del conversor y del survey sobre datos sintéticos (benchmark_data).
+Mide el tiempo (mejor y mediana de varias repeticiones) y el pico de memoria
+(tracemalloc, en una corrida aparte) de cada caso a cada escala, cada uno en un
+proceso nuevo, guarda los resultados en JSON y los compara contra una base guardada.
+
+Ejemplos:
+    python benchmark.py                                    # 1k, 10k y 100k
+    python benchmark.py -n 1000 10000 -o base.json         # guardar una base
+    python benchmark.py -n 1000 10000 --base base.json     # comparar (sale con 1 si hay regresiones)
+    python benchmark.py --solo export_to_kml map_fast --umbral 0.25
+    python benchmark.py --importacion                      # tiempo de importación (sale con 2 si se pasa)
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: sin memoria máxima del proceso
+    resource = None
+
+# Códigos de salida
+SALIDA_OK = 0
+SALIDA_CON_REGRESIONES = 1
+SALIDA_FUERA_DE_PRESUPUESTO = 2
+
+ESCALAS = [1000, 10000, 100000]
+UMBRAL = 0.2
+# Escala máxima por defecto de los casos que la app no usa con proyectos grandes
+# (el mapa clásico solo se dibuja hasta FAST_MAP_THRESHOLD elementos)
+ESCALA_MAXIMA = {'map_classic': 1000}
+
+# Presupuesto de importación: módulo -> (ms máximos, módulos pesados que no debe cargar).
+# El núcleo se importa sin NumPy/pandas/simplekml; solo geo y conversion los necesitan.
+_PESADOS = ('numpy', 'pandas', 'simplekml', 'streamlit', 'folium')
+PRESUPUESTO_IMPORTACION = {
+    'kml_core': (25, _PESADOS),
+    'kml_core.columnas': (25, _PESADOS),
+    'kml_core.connections': (25, _PESADOS),
+    'kml_core.project_store': (25, _PESADOS),
+    'kml_core.survey_kml': (25, _PESADOS),
+    'kml_core.plant_import': (40, _PESADOS),
+    'kml_core.geo': (250, ('pandas', 'simplekml', 'streamlit', 'folium')),
+    'kml_core.descripciones': (700, ('simplekml', 'streamlit', 'folium')),
+    'kml_core.conversion': (900, ('streamlit', 'folium')),
+    'location_kml_cli': (60, _PESADOS),
+    'tile_proxy': (60, _PESADOS),
+}
+_MEDIR_IMPORTACION = (
+    "import json, sys, time\n"
+    "inicio = time.perf_counter()\n"
+    "import {modulo}\n"
+    "print(json.dumps({{'ms': (time.perf_counter() - inicio) * 1000, 'modulos': sorted(sys.modules)}}))"
+)
+
+
+class Caso:
+    """
+    Un benchmark: 'preparar(escala, opciones)' genera los datos (fuera de la
+    medición) y 'ejecutar(datos)' es lo que se mide.
+    """
+
+    def __init__(self, nombre, preparar, ejecutar, descripcion):
+        self.nombre = nombre
+        self.preparar = preparar
+        self.ejecutar = ejecutar
+        self.descripcion = descripcion
+
+
+# Conversor
+def _preparar_csv(escala, opciones):
+    import pandas as pd
+    from benchmark_data import generar_csv
+
+    archivo_csv = os.path.join(opciones['directorio'], f"puntos_{escala}.csv")
+    if not os.path.exists(archivo_csv):
+        df = generar_csv(escala, opciones['profundidad'], opciones['columnas_extra'], opciones['filas_malas'], opciones['semilla'])
+        df.to_csv(archivo_csv, index=False)
+    # Como la app: el DataFrame sale de read_csv
+    return {'csv': archivo_csv, 'df': pd.read_csv(archivo_csv), 'salida': os.path.join(opciones['directorio'], 'salida.kml')}
+
+
+def _crear_kml(datos):
+    from kml_core.conversion import crear_kml_desde_dataframe
+    crear_kml_desde_dataframe(datos['df'], datos['salida'])
+
+
+def _convertir_streaming(datos):
+    from kml_core.conversion import convertir_csv_en_streaming
+    convertir_csv_en_streaming(datos['csv'], datos['salida'])
+
+
+def _preparar_descripciones(escala, opciones):
+    from kml_core.columnas import encontrar_columnas
+
+    datos = _preparar_csv(escala, opciones)
+    columnas, _ = encontrar_columnas(datos['df'])
+    return {'df': datos['df'], 'columnas': columnas}
+
+
+def _crear_descripciones(datos):
+    from kml_core.descripciones import PlantillaDescripcion
+    # Como la conversión: la plantilla se compila una vez y renderiza todas las filas
+    PlantillaDescripcion(datos['df'].columns.tolist(), datos['columnas']).renderizar(datos['df'])
+
+
+# Survey
+def _preparar_proyecto(escala, opciones, modo_conexion='sequential'):
+    from benchmark_data import generar_proyecto
+    from photo_store import PhotoStore
+
+    photos = PhotoStore(os.path.join(opciones['directorio'], 'fotos'))
+    store = generar_proyecto(escala, modo_conexion, opciones['fotos'], opciones['fotos_distintas'],
+                             opciones['tamano_foto'], photos, opciones['semilla'])
+    photos.wait()
+    return {'store': store, 'photos': photos}
+
+
+def _exportar_kml(datos):
+    from kml_core.survey_kml import export_to_kml
+    export_to_kml(datos['store'], datos['photos'])
+
+
+def _calcular_distancias(datos):
+    from kml_core.connections import calculate_distance
+    store = datos['store']
+    for conn in store.connections:
+        elem_a, elem_b = store.endpoints(conn)
+        calculate_distance(elem_a['lat'], elem_a['lon'], elem_b['lat'], elem_b['lon'])
+
+
+def _reconectar(modo):
+    def ejecutar(datos):
+        from kml_core.connections import build_connections, reconnect_pairs
+        store = datos['store']
+        store.set_connections(build_connections(store.elements, reconnect_pairs(store.elements, modo)))
+    return ejecutar
+
+
+# Cambios que otra cuadrilla hace entre dos pulls
+CAMBIOS_POR_PULL = 50
+
+
+def _preparar_compartido(escala, opciones):
+    from project_db import ProjectDB
+    datos = _preparar_proyecto(escala, opciones)
+    db = ProjectDB(os.path.join(opciones['directorio'], f'compartido_{escala}.db'))
+    project_id = db.create_project(f'Benchmark {escala}')
+    db.save_snapshot(datos['store'], project_id)
+    db.attach(datos['store'], project_id)
+    datos['otra_sesion'] = db.open(project_id)
+    return datos
+
+
+def _traer_cambios(datos):
+    store = datos['store']
+    for elem in store.elements[:CAMBIOS_POR_PULL]:
+        store.update_element(elem['name'], {'lat': elem['lat'] + 1e-6})
+    datos['otra_sesion'].listener.pull()
+
+
+def _mapa_base():
+    import folium
+    m = folium.Map(location=[31.6904, -106.4245], zoom_start=18, prefer_canvas=True)
+    folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', attr='Google', name='Híbrido').add_to(m)
+    return m
+
+
+def _mapa_clasico(datos):
+    from map_layers import add_element_markers, add_connection_lines
+    m = _mapa_base()
+    add_element_markers(m, datos['store'].elements)
+    add_connection_lines(m, datos['store'])
+    # st_folium envía el HTML del mapa: el render es parte del costo
+    m.get_root().render()
+
+
+def _mapa_agrupado(datos):
+    from map_layers import get_element_style, element_rows, connection_layers, add_clustered_elements, add_connection_layers
+    store = datos['store']
+    m = _mapa_base()
+    add_connection_layers(m, connection_layers(store))
+    add_clustered_elements(m, element_rows(store.elements, get_element_style))
+    m.get_root().render()
+
+
+CASOS = [
+    Caso('crear_kml_desde_dataframe', _preparar_csv, _crear_kml, "Conversor: DataFrame a KML con simplekml"),
+    Caso('convertir_csv_en_streaming', _preparar_csv, _convertir_streaming, "Conversor: CSV a KML por bloques"),
+    Caso('descripciones_html', _preparar_descripciones, _crear_descripciones, "Conversor: HTML de la descripción de todas las filas"),
+    Caso('export_to_kml', _preparar_proyecto, _exportar_kml, "Survey: exportación KML con fotos embebidas"),
+    Caso('calculate_distance', _preparar_proyecto, _calcular_distancias, "Survey: distancia de cada conexión (escalar)"),
+    Caso('reconnect_sequential', lambda e, o: _preparar_proyecto(e, o, None), _reconectar('sequential'), "Survey: reconectar en orden de captura"),
+    Caso('reconnect_nearest', lambda e, o: _preparar_proyecto(e, o, None), _reconectar('nearest'), "Survey: reconectar al vecino más cercano"),
+    Caso('reconnect_mst', lambda e, o: _preparar_proyecto(e, o, None), _reconectar('mst'), "Survey: reconectar como árbol mínimo"),
+    Caso('sync_pull', _preparar_compartido, _traer_cambios, f"Survey: {CAMBIOS_POR_PULL} cambios de una cuadrilla y pull de otra sesión"),
+    Caso('map_classic', _preparar_proyecto, _mapa_clasico, "Survey: mapa folium con un marcador por elemento"),
+    Caso('map_fast', _preparar_proyecto, _mapa_agrupado, "Survey: mapa folium agrupado (FastMarkerCluster + GeoJSON)"),
+]
+
+
+def medir(caso, datos, repeticiones, tiempo_max, memoria=True):
+    """
+    Tiempos de hasta 'repeticiones' corridas (se corta al pasar tiempo_max
+    segundos acumulados) y el pico de memoria de una corrida más con tracemalloc
+    """
+    tiempos = []
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        caso.ejecutar(datos)
+        tiempos.append(time.perf_counter() - inicio)
+        if sum(tiempos) >= tiempo_max:
+            break
+    resultado = {
+        'segundos': round(min(tiempos), 4),
+        'mediana': round(statistics.median(tiempos), 4),
+        'repeticiones': len(tiempos)
+    }
+    if memoria:
+        tracemalloc.start()
+        try:
+            caso.ejecutar(datos)
+            resultado['memoria_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return resultado
+
+
+def _medir_en_proceso(nombre, escala, opciones, repeticiones, tiempo_max, memoria):
+    caso = next(c for c in CASOS if c.nombre == nombre)
+    datos = caso.preparar(escala, opciones)
+    resultado = medir(caso, datos, repeticiones, tiempo_max, memoria)
+    if resource is not None:
+        # ru_maxrss está en KB en Linux (incluye los datos generados)
+        resultado['rss_max_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return resultado
+
+
+def correr(casos, escalas, opciones, repeticiones=3, tiempo_max=30.0, memoria=True, sin_limites=False):
+    """
+    Resultados {caso: {escala: medición}} de cada caso a cada escala. Cada
+    medición corre en un proceso propio: la memoria de un caso no afecta al
+    siguiente y un proceso que muere (p. ej. sin memoria) queda como error.
+    """
+    resultados = {}
+    for caso in casos:
+        for escala in escalas:
+            if not sin_limites and escala > ESCALA_MAXIMA.get(caso.nombre, escala):
+                logging.info("%s a %d: omitido (escala máxima %d)", caso.nombre, escala, ESCALA_MAXIMA[caso.nombre])
+                continue
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                futuro = pool.submit(_medir_en_proceso, caso.nombre, escala, opciones, repeticiones, tiempo_max, memoria)
+                try:
+                    medicion = futuro.result()
+                except Exception as e:
+                    medicion = {'error': f"{type(e).__name__}: {e}"}
+            resultados.setdefault(caso.nombre, {})[str(escala)] = medicion
+            if 'error' in medicion:
+                logging.error("%s a %d: %s", caso.nombre, escala, medicion['error'])
+            else:
+                logging.info("%s a %d: %.3f s, %s MB", caso.nombre, escala, medicion['segundos'], medicion.get('memoria_mb', '-'))
+    return resultados
+
+
+def medir_importacion(presupuesto=None, repeticiones=5):
+    """
+    Tiempo de importación (mejor de varias corridas, cada una en un intérprete
+    nuevo) de cada módulo del presupuesto, los módulos pesados que cargó y si
+    cumple el presupuesto
+    """
+    presupuesto = presupuesto or PRESUPUESTO_IMPORTACION
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    resultados = {}
+    for modulo, (limite_ms, prohibidos) in presupuesto.items():
+        tiempos = []
+        cargados = []
+        try:
+            for _ in range(repeticiones):
+                salida = subprocess.run([sys.executable, '-c', _MEDIR_IMPORTACION.format(modulo=modulo)], cwd=directorio,
+                                        capture_output=True, text=True, check=True)
+                medicion = json.loads(salida.stdout)
+                tiempos.append(medicion['ms'])
+                cargados = [m for m in prohibidos if m in medicion['modulos']]
+        except subprocess.CalledProcessError as e:
+            resultados[modulo] = {'error': e.stderr.strip().splitlines()[-1] if e.stderr.strip() else str(e), 'cumple': False}
+            continue
+        ms = round(min(tiempos), 1)
+        resultados[modulo] = {'ms': ms, 'limite_ms': limite_ms, 'pesados': cargados,
+                              'cumple': ms <= limite_ms and not cargados}
+    return resultados
+
+
+def imprimir_importacion(resultados):
+    print(f"{'módulo':<28} {'ms':>8} {'límite':>8}  pesados")
+    for modulo, medicion in resultados.items():
+        marca = "" if medicion['cumple'] else "  FUERA DE PRESUPUESTO"
+        if 'error' in medicion:
+            print(f"{modulo:<28} {medicion['error']}{marca}")
+            continue
+        print(f"{modulo:<28} {medicion['ms']:>8} {medicion['limite_ms']:>8}  {', '.join(medicion['pesados']) or '-'}{marca}")
+
+
+def comparar(actual, base, umbral=UMBRAL):
+    """
+    Filas de comparación por caso, escala y métrica; 'regresion' es True si el
+    valor actual supera al de la base en más de la fracción umbral o si el caso
+    falló ahora y no en la base
+    """
+    filas = []
+    for nombre, escalas in actual['resultados'].items():
+        for escala, medicion in escalas.items():
+            anterior = base['resultados'].get(nombre, {}).get(escala)
+            if anterior is None:
+                continue
+            if 'error' in medicion:
+                filas.append({'caso': nombre, 'escala': int(escala), 'metrica': 'error', 'base': anterior.get('error', 'ok'),
+                              'actual': medicion['error'], 'cambio': None, 'regresion': 'error' not in anterior})
+                continue
+            for metrica in ('segundos', 'memoria_mb'):
+                if metrica not in medicion or not anterior.get(metrica):
+                    continue
+                cambio = medicion[metrica] / anterior[metrica] - 1
+                filas.append({
+                    'caso': nombre,
+                    'escala': int(escala),
+                    'metrica': metrica,
+                    'base': anterior[metrica],
+                    'actual': medicion[metrica],
+                    'cambio': round(cambio, 4),
+                    'regresion': cambio > umbral
+                })
+    return filas
+
+
+def imprimir_comparacion(filas):
+    print(f"{'caso':<28} {'escala':>7} {'métrica':<11} {'base':>10} {'actual':>10} {'cambio':>8}")
+    for fila in filas:
+        marca = "  REGRESIÓN" if fila['regresion'] else ""
+        if fila['cambio'] is None:
+            print(f"{fila['caso']:<28} {fila['escala']:>7} {fila['metrica']:<11} {fila['actual']}{marca}")
+            continue
+        print(f"{fila['caso']:<28} {fila['escala']:>7} {fila['metrica']:<11} {fila['base']:>10} {fila['actual']:>10} {fila['cambio']:>+8.1%}{marca}")
+
+
+def _tamano(texto):
+    ancho, alto = texto.lower().split('x')
+    return int(ancho), int(alto)
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks del conversor CSV a KML y del survey")
+    parser.add_argument('-n', '--escalas', type=int, nargs='+', default=ESCALAS, help="Filas/elementos por caso")
+    parser.add_argument('--solo', nargs='+', choices=[c.nombre for c in CASOS], help="Correr solo estos casos")
+    parser.add_argument('-o', '--salida', help="Archivo JSON para los resultados (por defecto, salida estándar)")
+    parser.add_argument('--base', help="Resultados JSON anteriores contra los cuales comparar")
+    parser.add_argument('--umbral', type=float, default=UMBRAL, help="Aumento relativo que cuenta como regresión (0.2 = 20%%)")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Corridas por caso (se toma la mejor)")
+    parser.add_argument('--tiempo-max', type=float, default=30.0, help="Segundos acumulados tras los que no se repite más")
+    parser.add_argument('--sin-memoria', action='store_true', help="No medir el pico de memoria (tracemalloc)")
+    parser.add_argument('--importacion', action='store_true', help="Medir solo el tiempo de importación contra PRESUPUESTO_IMPORTACION")
+    parser.add_argument('--sin-limites', action='store_true', help="Correr también los casos por encima de su escala máxima")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla de los datos sintéticos")
+    parser.add_argument('--profundidad', type=int, default=2, help="Niveles de folder en los CSV")
+    parser.add_argument('--columnas-extra', type=int, default=3, help="Columnas adicionales en los CSV")
+    parser.add_argument('--filas-malas', type=float, default=0.01, help="Fracción de filas inválidas en los CSV")
+    parser.add_argument('--fotos', type=float, default=0.01, help="Fracción de elementos con foto en los proyectos")
+    parser.add_argument('--fotos-distintas', type=int, default=20, help="Fotos distintas repartidas entre los elementos")
+    parser.add_argument('--tamano-foto', type=_tamano, default=(640, 480), metavar='ANCHOxALTO', help="Tamaño de las fotos en píxeles")
+    parser.add_argument('-v', '--verbose', action='count', default=1, help="Más detalle en el log")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING - 10 * min(args.verbose, 2),
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    if args.importacion:
+        importacion = medir_importacion(repeticiones=max(args.repeticiones, 5))
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                json.dump({'fecha': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                           'importacion': importacion}, f, ensure_ascii=False, indent=2)
+        imprimir_importacion(importacion)
+        return SALIDA_OK if all(m['cumple'] for m in importacion.values()) else SALIDA_FUERA_DE_PRESUPUESTO
+
+    casos = [c for c in CASOS if not args.solo or c.nombre in args.solo]
+    parametros = {
+        'semilla': args.semilla,
+        'profundidad': args.profundidad,
+        'columnas_extra': args.columnas_extra,
+        'filas_malas': args.filas_malas,
+        'fotos': args.fotos,
+        'fotos_distintas': args.fotos_distintas,
+        'tamano_foto': list(args.tamano_foto)
+    }
+    directorio = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        opciones = dict(parametros, tamano_foto=args.tamano_foto, directorio=directorio)
+        resultados = correr(casos, sorted(args.escalas), opciones, args.repeticiones, args.tiempo_max,
+                            not args.sin_memoria, args.sin_limites)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    actual = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': parametros,
+        'resultados': resultados
+    }
+    texto = json.dumps(actual, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+    elif not args.base:
+        print(texto)
+
+    if not args.base:
+        return SALIDA_OK
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    if base.get('parametros') != parametros:
+        logging.warning("La base se generó con otros parámetros: la comparación no es directa")
+    filas = comparar(actual, base, args.umbral)
+    imprimir_comparacion(filas)
+    return SALIDA_CON_REGRESIONES if any(f['regresion'] for f in filas) else SALIDA_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
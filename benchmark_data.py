@@ -0,0 +1,125 @@
+"""
+Datos sintéticos reproducibles para los benchmarks (misma semilla, mismos datos):
+CSV del conversor y proyectos del survey.
+"""
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from kml_core.connections import build_connections, reconnect_pairs
+from kml_core.plant_import import ELEMENT_PREFIXES
+from kml_core.project_store import ProjectStore
+
+try:
+    from PIL import Image
+except ImportError:  # Sin Pillow las fotos son bytes aleatorios con cabecera JPEG
+    Image = None
+
+CENTRO = (31.6904, -106.4245)
+COLORES = ['ff0000ff', 'ff00ff00', 'ffff0000', 'ff00ffff', 'ffff00ff']
+TIPOS_ELEMENTO = list(ELEMENT_PREFIXES)
+PROPORCION_TIPOS = [0.6, 0.25, 0.1, 0.05]
+DUENOS = ["CFE", "ATC", "Flo Networks", "Maxcom", "XC Networks", "Municipio", "Parque Industrial", "Privado"]
+
+
+def generar_csv(filas, profundidad_folders=2, columnas_extra=3, tasa_filas_malas=0.01, semilla=0):
+    """
+    DataFrame con el formato que acepta el conversor: Nombre, Latitud, Longitud,
+    Folder (con profundidad_folders niveles), Color, Descripcion y columnas_extra
+    columnas adicionales. Una fracción tasa_filas_malas de las filas queda sin
+    nombre, con latitud no numérica o con longitud fuera de rango.
+    """
+    rng = np.random.default_rng(semilla)
+    latitudes = (CENTRO[0] + rng.normal(0, 0.05, filas)).round(6).astype(object)
+    longitudes = (CENTRO[1] + rng.normal(0, 0.05, filas)).round(6).astype(object)
+    nombres = np.array([f"PT_{i:07d}" for i in range(filas)], dtype=object)
+
+    datos = {'Nombre': nombres, 'Latitud': latitudes, 'Longitud': longitudes}
+    if profundidad_folders:
+        niveles = [rng.integers(0, 5, filas) for _ in range(profundidad_folders)]
+        datos['Folder'] = ['/'.join(f"Nivel{d + 1}_{nivel[i]}" for d, nivel in enumerate(niveles)) for i in range(filas)]
+    datos['Color'] = np.array(COLORES, dtype=object)[rng.integers(0, len(COLORES), filas)]
+    datos['Descripcion'] = [f"Punto {i} <revisar> & medir" if i % 7 == 0 else f"Punto {i}" for i in range(filas)]
+    for c in range(columnas_extra):
+        if c % 2 == 0:
+            valores = rng.normal(100, 30, filas).round(2).astype(object)
+        else:
+            valores = np.array([f"Valor {v}" for v in rng.integers(0, 1000, filas)], dtype=object)
+        valores[rng.random(filas) < 0.1] = np.nan
+        datos[f"Campo_{c + 1}"] = valores
+
+    malas = np.flatnonzero(rng.random(filas) < tasa_filas_malas)
+    nombres[malas[0::3]] = np.nan
+    latitudes[malas[1::3]] = 'sin dato'
+    longitudes[malas[2::3]] = 500.0
+    return pd.DataFrame(datos)
+
+
+def _foto(rng, tamano_foto):
+    ancho, alto = tamano_foto
+    if Image is None:
+        return b'\xff\xd8\xff\xe0' + rng.bytes(ancho * alto // 4)
+    # Ruido de baja frecuencia ampliado: se comprime como una foto real, no como ruido puro
+    pixeles = rng.integers(0, 256, (alto // 16 + 1, ancho // 16 + 1, 3), dtype=np.uint8)
+    imagen = Image.fromarray(pixeles, 'RGB').resize((ancho, alto), Image.BILINEAR)
+    buffer = BytesIO()
+    imagen.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def generar_proyecto(elementos, modo_conexion='sequential', proporcion_con_foto=0.0, fotos_distintas=20,
+                     tamano_foto=(640, 480), photo_store=None, semilla=0, nombre='BENCH'):
+    """
+    ProjectStore con 'elementos' elementos a lo largo de un recorrido (como una
+    captura en campo), con los atributos del formulario del survey y conectados
+    según modo_conexion ('sequential', 'nearest', 'mst' o None).
+    Con un photo_store, una proporción de los elementos referencia una de
+    fotos_distintas fotos de tamano_foto (ancho, alto) píxeles.
+    """
+    rng = np.random.default_rng(semilla)
+    pasos = rng.normal(0, 0.0004, (elementos, 2))
+    latitudes = CENTRO[0] + np.cumsum(pasos[:, 0])
+    longitudes = CENTRO[1] + np.cumsum(pasos[:, 1])
+    tipos = rng.choice(len(TIPOS_ELEMENTO), elementos, p=PROPORCION_TIPOS)
+
+    refs = []
+    if photo_store is not None and proporcion_con_foto:
+        refs = [photo_store.put(_foto(rng, tamano_foto)) for _ in range(fotos_distintas)]
+    con_foto = rng.random(elementos) < proporcion_con_foto if refs else np.zeros(elementos, dtype=bool)
+
+    inicio = datetime(2025, 1, 1, 8, 0, 0)
+    contadores = dict.fromkeys(ELEMENT_PREFIXES.values(), 0)
+    lista = []
+    for i in range(elementos):
+        tipo = TIPOS_ELEMENTO[tipos[i]]
+        prefijo = ELEMENT_PREFIXES[tipo]
+        contadores[prefijo] += 1
+        elem = {
+            'type': tipo,
+            'name': f"{nombre}_{prefijo}{contadores[prefijo]:03d}",
+            'lat': float(latitudes[i]),
+            'lon': float(longitudes[i]),
+            'timestamp': (inicio + timedelta(seconds=45 * i)).strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if tipo == 'Poste':
+            elem.update({'dueño': DUENOS[i % len(DUENOS)], 'altura': 6 + i % 10, 'id_cfe': f"CFE-{i:06d}",
+                         'usado_por': ["Flo Networks"], 'material': "Concreto", 'tipo_construccion': "Poste nuevo"})
+        elif tipo == 'Handhole':
+            elem.update({'dueño': DUENOS[i % len(DUENOS)], 'dimensiones': "24x36x24",
+                         'usado_por': ["Flo Networks"], 'instalado_en': "Banqueta"})
+        elif tipo == 'Cierre de Empalme':
+            elem.update({'estado': "Nuevo", 'nombre_cierre': f"CE-{i}"})
+        else:
+            elem.update({'direccion': f"Calle {i} #{i % 300}", 'nombre_edificio': f"Edificio {i}", 'piso': str(i % 12),
+                         'suite': '', 'datos_adicionales': ''})
+        if con_foto[i]:
+            elem['photo_ref'] = refs[i % len(refs)]
+        lista.append(elem)
+
+    store = ProjectStore()
+    store.add_elements(lista)
+    if modo_conexion:
+        store.add_connections(build_connections(store.elements, reconnect_pairs(store.elements, modo_conexion)))
+    return store
@@ -0,0 +1,64 @@
+import threading
+
+
+class ExportJob:
+    def __init__(self, revision):
+        self.revision = revision
+        self.state = 'running'
+        self.progress = 0.0
+        self.data = None
+        self.error = None
+
+
+class ExportJobs:
+    """
+    Exportaciones generadas al pedirlas y guardadas según la revisión del proyecto:
+    descargar un proyecto sin cambios reutiliza el último resultado. Las funciones
+    que las generan reciben un callback de progreso (0..1) y pueden correr en un
+    hilo aparte.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def job(self, kind, revision):
+        """Trabajo de este tipo para la revisión (None si nunca se pidió o quedó desactualizado)"""
+        with self._lock:
+            job = self._jobs.get(kind)
+        if job is None or job.revision != revision:
+            return None
+        return job
+
+    def running(self):
+        with self._lock:
+            return any(job.state == 'running' for job in self._jobs.values())
+
+    def run(self, kind, revision, builder):
+        """Genera la exportación en el hilo que llama"""
+        job = self._replace(kind, revision)
+        self._build(job, builder)
+        return job
+
+    def start(self, kind, revision, builder):
+        """Genera la exportación en un hilo aparte (un trabajo desactualizado en curso simplemente se descarta)"""
+        job = self._replace(kind, revision)
+        threading.Thread(target=self._build, args=(job, builder), name=f"export-{kind}", daemon=True).start()
+        return job
+
+    def _replace(self, kind, revision):
+        job = ExportJob(revision)
+        with self._lock:
+            self._jobs[kind] = job
+        return job
+
+    def _build(self, job, builder):
+        def progress(fraction):
+            job.progress = min(max(float(fraction), 0.0), 1.0)
+        try:
+            job.data = builder(progress)
+            job.progress = 1.0
+            job.state = 'ready'
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = 'error'
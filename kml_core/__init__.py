@@ -0,0 +1,38 @@
+"""
+Lógica de conversión CSV → KML y del survey sin dependencias de la interfaz:
+identificación de columnas, construcción de KML/KMZ, distancias y conexiones.
+Las apps de Streamlit y la CLI solo leen entradas y muestran resultados.
+
+Importar el paquete no carga NumPy, pandas ni simplekml: cada nombre se importa
+de su submódulo la primera vez que se usa (kml_core.convertir_csv, etc.).
+"""
+from importlib import import_module
+
+_EXPORTS = {
+    'columnas': ['normalizar_nombre_columna', 'encontrar_columnas', 'columnas_popup'],
+    'conversion': ['FILAS_POR_BLOQUE', 'MOTIVOS', 'ReporteValidacion', 'crear_kml_desde_dataframe',
+                   'convertir_csv_en_streaming', 'convertir_csv_en_teselas', 'convertir_csv'],
+    'descripciones': ['CSS_DESCRIPCION', 'PlantillaDescripcion', 'RenderizadorDescripciones', 'crear_descripcion_html'],
+    'estilos': ['RegistroEstilos', 'TablaEstilosTexto'],
+    'geo': ['haversine', 'GridIndex', 'close_pairs', 'duplicate_of'],
+    'connections': ['RECONNECT_MODES', 'calculate_distance', 'suggest_construction_type', 'build_connections', 'reconnect_pairs'],
+    'project_store': ['ProjectStore'],
+    'plant_import': ['ELEMENT_PREFIXES', 'import_plant'],
+    'survey_kml': ['KML_ELEMENT_STYLES', 'KML_CONNECTION_STYLES', 'export_to_kml', 'export_to_kmz', 'build_export'],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,101 @@
+"""
+Identificación de las columnas de un CSV (nombre, latitud, longitud y
+opcionales) por nombres flexibles. No importa pandas: solo usa df.columns.
+"""
+
+def normalizar_nombre_columna(nombre_columna):
+    """
+    Normaliza nombres de columnas para hacer coincidencias flexibles
+    """
+    nombre = str(nombre_columna).lower().strip()
+    
+    # Mapeo de nombres equivalentes
+    mapeo = {
+        # Nombre
+        'nombre': 'nombre',
+        'name': 'nombre',
+        'nombres': 'nombre',
+        'names': 'nombre',
+        'punto': 'nombre',
+        'point': 'nombre',
+        'label': 'nombre',
+        'etiqueta': 'nombre',
+        
+        # Latitud
+        'latitud': 'latitud', 
+        'latitude': 'latitud',
+        'lat': 'latitud',
+        'latitudine': 'latitud',
+        
+        # Longitud
+        'longitud': 'longitud',
+        'longitude': 'longitud',
+        'lon': 'longitud',
+        'lng': 'longitud',
+        'long': 'longitud',
+        
+        # Folder
+        'folder': 'folder',
+        'carpeta': 'folder',
+        'categoría': 'folder',
+        'categoria': 'folder',
+        'category': 'folder',
+        'categorie': 'folder',
+        
+        # Descripción
+        'descripcion': 'descripcion',
+        'description': 'descripcion',
+        'descripción': 'descripcion',
+        'desc': 'descripcion',
+        'detail': 'descripcion',
+        'detalle': 'descripcion',
+        
+        # Color
+        'color': 'color',
+        'colour': 'color',
+        'colore': 'color',
+        'colorhex': 'color',
+        'hexcolor': 'color',
+        
+        # Icono
+        'icono': 'icono',
+        'icon': 'icono',
+        'icone': 'icono',
+        'symbol': 'icono',
+        'simbolo': 'icono',
+        'símbolo': 'icono',
+        'marker': 'icono'
+    }
+    
+    return mapeo.get(nombre, nombre)
+
+def encontrar_columnas(df):
+    """
+    Encuentra las columnas relevantes en el DataFrame
+    """
+    columnas_normalizadas = {normalizar_nombre_columna(col): col for col in df.columns}
+    
+    columnas_encontradas = {}
+    
+    # Buscar columnas requeridas
+    for col_requerida in ['nombre', 'latitud', 'longitud']:
+        if col_requerida in columnas_normalizadas:
+            columnas_encontradas[col_requerida] = columnas_normalizadas[col_requerida]
+        else:
+            return None, f"No se encontró la columna: {col_requerida}"
+    
+    # Buscar columnas opcionales (incluyendo color y folder para funcionalidad)
+    for col_opcional in ['folder', 'descripcion', 'color', 'icono']:
+        if col_opcional in columnas_normalizadas:
+            columnas_encontradas[col_opcional] = columnas_normalizadas[col_opcional]
+    
+    return columnas_encontradas, None
+
+def columnas_popup(todas_las_columnas, columnas_mapeadas):
+    """
+    Columnas que se muestran en el popup y las que se ocultan (color y folder se
+    usan para el estilo y la estructura, no se muestran)
+    """
+    ocultas = [columnas_mapeadas[clave] for clave in ('color', 'folder') if clave in columnas_mapeadas]
+    mostradas = [col for col in todas_las_columnas if col not in ocultas]
+    return mostradas, ocultas
@@ -0,0 +1,105 @@
+"""
+Distancias y conexiones entre elementos del survey, sin Streamlit, para que la
+app, la importación de planta y los benchmarks compartan la misma lógica.
+NumPy (a través de geo) solo se importa en las funciones que trabajan con muchos
+elementos.
+"""
+import math
+
+RECONNECT_MODES = ('sequential', 'nearest', 'mst')
+# Pares de tipos que no se conectan entre sí: un edificio recibe la acometida desde
+# la red (poste, registro o cierre), no desde otro edificio
+NON_CONNECTABLE_TYPES = {frozenset({'Edificio'})}
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    R = 6371000
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
+
+
+def suggest_construction_type(elem_a_type, elem_b_type):
+    if elem_a_type == 'Handhole' and elem_b_type == 'Handhole':
+        return 'Ducto'
+    elif elem_a_type == 'Poste' and elem_b_type == 'Poste':
+        return 'Aerial Route'
+    elif ('Poste' in [elem_a_type, elem_b_type] and 'Handhole' in [elem_a_type, elem_b_type]):
+        return 'Ducto'
+    elif ('Edificio' in [elem_a_type, elem_b_type] and 'Handhole' in [elem_a_type, elem_b_type]):
+        return 'Ducto'
+    return 'Aerial Route'
+
+
+def can_connect(type_a, type_b):
+    return frozenset((type_a, type_b)) not in NON_CONNECTABLE_TYPES
+
+
+def element_types(elements):
+    import numpy as np
+    return np.array([e['type'] for e in elements], dtype=object)
+
+
+def eligible_neighbors(types):
+    """
+    Predicado eligible(i, candidates) para geo.nearest_neighbor_pairs y
+    geo.minimum_spanning_tree: máscara de los candidatos con los que el elemento i
+    se puede conectar, según 'types' (arreglo de tipos alineado con el índice)
+    """
+    import numpy as np
+
+    names, codes = np.unique(types.astype(str), return_inverse=True)
+    allowed = np.array([[can_connect(a, b) for b in names] for a in names], dtype=bool)
+    return lambda i, candidates: allowed[codes[i], codes[candidates]]
+
+
+def eligible_for(element_type, types):
+    """accept(idx) de GridIndex.nearest para un elemento nuevo de element_type (None si todos sirven)"""
+    import numpy as np
+
+    blocked = [t for t in set(types.tolist()) if not can_connect(element_type, t)]
+    if not blocked:
+        return None
+    return lambda idx: ~np.isin(types[idx], blocked)
+
+
+def element_coordinates(elements):
+    import numpy as np
+    return np.array([e['lat'] for e in elements], dtype=float), np.array([e['lon'] for e in elements], dtype=float)
+
+
+def build_connections(elements, pairs):
+    """Conexiones para pares (i, j) de índices, con todas las distancias en un solo cálculo"""
+    if not pairs:
+        return []
+    from .geo import pair_distances
+
+    lats, lons = element_coordinates(elements)
+    distances = pair_distances(lats, lons, pairs)
+    return [{
+        'element_a': elements[i]['name'],
+        'element_b': elements[j]['name'],
+        'construction_type': suggest_construction_type(elements[i]['type'], elements[j]['type']),
+        'infraestructura': 'Nuevo',
+        'distance': float(d)
+    } for (i, j), d in zip(pairs, distances)]
+
+
+def reconnect_pairs(elements, mode):
+    """
+    Pares (i, j) que unen los elementos en orden de captura, con su vecino elegible más
+    cercano o como MST de las conexiones elegibles (can_connect)
+    """
+    if mode == 'sequential':
+        return [(i, i + 1) for i in range(len(elements) - 1)]
+    from .geo import GridIndex, nearest_neighbor_pairs, minimum_spanning_tree
+
+    index = GridIndex(*element_coordinates(elements))
+    eligible = eligible_neighbors(element_types(elements))
+    if mode == 'nearest':
+        return nearest_neighbor_pairs(index, eligible)
+    return minimum_spanning_tree(index, eligible=eligible)
@@ -0,0 +1,749 @@
+import math
+import os
+import shutil
+import tempfile
+import zipfile
+from array import array
+from collections import OrderedDict
+from io import TextIOWrapper
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import simplekml
+
+from .columnas import encontrar_columnas
+from .descripciones import GLOBO_DESCRIPCION, PlantillaDescripcion, RenderizadorDescripciones, crear_descripcion_html
+from .estilos import RegistroEstilos, TablaEstilosTexto
+from .geo import duplicate_of
+
+COLOR_POR_DEFECTO = 'ff0000ff'  # Azul por defecto
+ICONO_POR_DEFECTO = 'http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png'
+
+def _texto_sin_espacios(serie):
+    """
+    Quita espacios a los valores de texto de una columna sin tocar los demás valores
+    """
+    if serie.dtype != object:
+        return serie
+    texto = serie.str.strip()
+    return texto.where(texto.notna(), serie)
+
+def _texto_opcional(df, columnas, clave):
+    """
+    Convierte una columna opcional a texto limpio ('' donde no hay valor)
+    """
+    if clave not in columnas:
+        return None
+    serie = df[columnas[clave]]
+    texto = serie.astype(str).str.strip()
+    return texto.where(serie.notna(), '')
+
+def preparar_columnas(df, columnas):
+    """
+    Valida y convierte por columnas nombre, coordenadas, folder, color e icono.
+    Devuelve un diccionario de arreglos alineados con las filas del DataFrame.
+    """
+    serie_nombre = df[columnas['nombre']]
+    serie_lat = df[columnas['latitud']]
+    serie_lon = df[columnas['longitud']]
+    
+    # Filas sin nombre o sin coordenadas
+    faltantes = (serie_nombre.isna() | serie_lat.isna() | serie_lon.isna()).to_numpy()
+    
+    # Coordenadas que existen pero no son numéricas
+    latitudes = pd.to_numeric(_texto_sin_espacios(serie_lat), errors='coerce').to_numpy(dtype=float)
+    longitudes = pd.to_numeric(_texto_sin_espacios(serie_lon), errors='coerce').to_numpy(dtype=float)
+    invalidas = ~faltantes & (np.isnan(latitudes) | np.isnan(longitudes))
+    
+    validas = ~faltantes & ~invalidas
+    
+    # Coordenadas fuera de rango (se conservan, solo se avisa)
+    with np.errstate(invalid='ignore'):
+        fuera_de_rango = validas & ((np.abs(latitudes) > 90) | (np.abs(longitudes) > 180))
+    
+    nombres = serie_nombre.astype(str).str.strip().to_numpy(dtype=object)
+    
+    # Folder (para estructura de folders)
+    folders = _texto_opcional(df, columnas, 'folder')
+    folders = folders.to_numpy(dtype=object) if folders is not None else np.full(len(df), '', dtype=object)
+    
+    # Color (para estilo de íconos)
+    colores = _texto_opcional(df, columnas, 'color')
+    if colores is not None:
+        colores = colores.mask(colores == '', COLOR_POR_DEFECTO)
+        colores = colores.mask(colores.str.startswith('#'), colores.str[1:]).to_numpy(dtype=object)
+    else:
+        colores = np.full(len(df), COLOR_POR_DEFECTO, dtype=object)
+    
+    # Ícono
+    iconos = _texto_opcional(df, columnas, 'icono')
+    if iconos is not None:
+        iconos = iconos.mask(iconos == '', ICONO_POR_DEFECTO).to_numpy(dtype=object)
+    else:
+        iconos = np.full(len(df), ICONO_POR_DEFECTO, dtype=object)
+    
+    return {
+        'faltantes': faltantes,
+        'invalidas': invalidas,
+        'validas': validas,
+        'fuera_de_rango': fuera_de_rango,
+        'nombres': nombres,
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'folders': folders,
+        'colores': colores,
+        'iconos': iconos
+    }
+
+# Motivos de rechazo/aviso del reporte de validación
+MOTIVOS = {
+    'faltan_datos': 'Faltan datos requeridos',
+    'coordenadas_invalidas': 'Coordenadas inválidas',
+    'fuera_de_rango': 'Coordenadas fuera de rango',
+    'error_fila': 'Error al crear el punto',
+    'duplicado': 'Punto duplicado cercano',
+    'duplicado_fusionado': 'Duplicado fusionado con otro punto'
+}
+# Motivos que solo avisan: la fila sí se convierte
+MOTIVOS_AVISO = {'fuera_de_rango', 'duplicado'}
+
+class ReporteValidacion:
+    """
+    Reporte de validación de una conversión.
+    Guarda fila, columna, motivo y valor original en arreglos por bloque
+    en lugar de emitir un mensaje por cada fila.
+    """
+    COLUMNAS = ['fila', 'columna', 'motivo', 'valor']
+    
+    def __init__(self):
+        self._filas = []
+        self._columnas = []
+        self._motivos = []
+        self._valores = []
+        self._conteos = {}
+    
+    def agregar(self, filas, columnas, motivo, valores):
+        """Agrega un bloque de entradas con el mismo motivo"""
+        filas = np.asarray(filas)
+        n = len(filas)
+        if n == 0:
+            return
+        self._filas.append(filas)
+        self._columnas.append(np.broadcast_to(np.asarray(columnas, dtype=object), (n,)))
+        self._motivos.append(np.full(n, motivo, dtype=object))
+        self._valores.append(np.broadcast_to(np.asarray(valores, dtype=object), (n,)))
+        self._conteos[motivo] = self._conteos.get(motivo, 0) + n
+    
+    def conteos(self):
+        """Cantidad de entradas por motivo"""
+        return dict(self._conteos)
+    
+    def rechazadas(self):
+        """Cantidad de filas que no se convirtieron"""
+        return sum(n for motivo, n in self._conteos.items() if motivo not in MOTIVOS_AVISO)
+    
+    def __len__(self):
+        return sum(self._conteos.values())
+    
+    def a_dataframe(self):
+        """Devuelve el reporte como DataFrame ordenado por fila"""
+        if not self._filas:
+            return pd.DataFrame(columns=self.COLUMNAS + ['descripcion'])
+        df = pd.DataFrame({
+            'fila': np.concatenate(self._filas),
+            'columna': np.concatenate(self._columnas),
+            'motivo': np.concatenate(self._motivos),
+            'valor': np.concatenate(self._valores)
+        })
+        df['descripcion'] = df['motivo'].map(MOTIVOS)
+        return df.sort_values('fila', kind='stable').reset_index(drop=True)
+    
+    def a_csv(self):
+        """Devuelve el reporte como texto CSV"""
+        return self.a_dataframe().to_csv(index=False)
+
+def registrar_validacion(reporte, df, columnas, datos, inicio=0):
+    """
+    Agrega al reporte las filas rechazadas y los avisos detectados por preparar_columnas.
+    Las filas se numeran por posición (inicio = filas del archivo antes de df), no por el índice de df
+    """
+    filas = np.arange(len(df)) + inicio + 1
+    cols_requeridas = [columnas['nombre'], columnas['latitud'], columnas['longitud']]
+    
+    # Faltan datos: se informa la primera columna requerida vacía
+    pos = np.flatnonzero(datos['faltantes'])
+    if len(pos):
+        columna_vacia = np.full(len(pos), '', dtype=object)
+        for col in reversed(cols_requeridas):
+            columna_vacia[df[col].isna().to_numpy()[pos]] = col
+        reporte.agregar(filas[pos], columna_vacia, 'faltan_datos', '')
+    
+    lat_crudas = df[columnas['latitud']].to_numpy(dtype=object)
+    lon_crudas = df[columnas['longitud']].to_numpy(dtype=object)
+    
+    # Coordenadas no numéricas
+    pos = np.flatnonzero(datos['invalidas'])
+    if len(pos):
+        lat_mala = np.isnan(datos['latitudes'][pos])
+        reporte.agregar(
+            filas[pos],
+            np.where(lat_mala, columnas['latitud'], columnas['longitud']).astype(object),
+            'coordenadas_invalidas',
+            np.where(lat_mala, lat_crudas[pos], lon_crudas[pos])
+        )
+    
+    # Coordenadas fuera de rango (solo aviso)
+    pos = np.flatnonzero(datos['fuera_de_rango'])
+    if len(pos):
+        lat_mala = np.abs(datos['latitudes'][pos]) > 90
+        reporte.agregar(
+            filas[pos],
+            np.where(lat_mala, columnas['latitud'], columnas['longitud']).astype(object),
+            'fuera_de_rango',
+            np.where(lat_mala, lat_crudas[pos], lon_crudas[pos])
+        )
+
+def _rebobinar(archivo_csv):
+    # Los archivos subidos (objetos tipo archivo) se leen más de una vez
+    if hasattr(archivo_csv, 'seek'):
+        archivo_csv.seek(0)
+
+def _leer_cabecera(archivo_csv):
+    """
+    Nombres de columnas del CSV y sus columnas identificadas (o el error), sin leer
+    filas: un CSV solo con encabezado se valida igual que uno con datos
+    """
+    cabecera = pd.read_csv(archivo_csv, nrows=0).columns.tolist()
+    _rebobinar(archivo_csv)
+    columnas, error = encontrar_columnas(pd.DataFrame(columns=cabecera))
+    return cabecera, columnas, error
+
+class Duplicados:
+    """
+    Puntos a menos de radio_m metros de un punto anterior del archivo, buscados con
+    una grilla (geo.duplicate_of) en O(n). Se avisan en el reporte o, con
+    fusionar=True, se omiten indicando el punto con el que se fusionan.
+    Se comparan todas las filas del archivo, así que nombre y coordenadas de cada
+    fila válida quedan en memoria (O(n), unos 300 bytes por fila): con radio, la
+    conversión en streaming deja de tener memoria constante.
+    """
+    def __init__(self, radio_m, fusionar=False):
+        self.radio_m = radio_m
+        self.fusionar = fusionar
+        # Etiqueta de la fila duplicada -> nombre del punto que se conserva
+        self.original = {}
+    
+    def analizar(self, etiquetas, latitudes, longitudes, nombres):
+        """Busca los duplicados entre filas válidas (arreglos alineados)"""
+        anterior = duplicate_of(latitudes, longitudes, self.radio_m)
+        pos = np.flatnonzero(anterior >= 0)
+        self.original = dict(zip(np.asarray(etiquetas)[pos].tolist(), np.asarray(nombres)[anterior[pos]].tolist()))
+    
+    def analizar_csv(self, archivo_csv, filas_por_bloque):
+        """Primera pasada por el CSV leyendo solo nombre y coordenadas; devuelve un error o None"""
+        _, columnas, error = _leer_cabecera(archivo_csv)
+        if error:
+            return error
+        requeridas = {clave: columnas[clave] for clave in ('nombre', 'latitud', 'longitud')}
+        etiquetas, latitudes, longitudes, nombres = [], [], [], []
+        inicio = 0
+        for bloque in pd.read_csv(archivo_csv, chunksize=filas_por_bloque, usecols=list(requeridas.values())):
+            datos = preparar_columnas(bloque, requeridas)
+            validas = datos['validas']
+            etiquetas.append((np.arange(len(bloque)) + inicio)[validas])
+            inicio += len(bloque)
+            latitudes.append(datos['latitudes'][validas])
+            longitudes.append(datos['longitudes'][validas])
+            nombres.append(datos['nombres'][validas])
+        _rebobinar(archivo_csv)
+        if etiquetas:
+            self.analizar(np.concatenate(etiquetas), np.concatenate(latitudes), np.concatenate(longitudes), np.concatenate(nombres))
+        return None
+    
+    def registrar(self, reporte, etiquetas, columna_nombre):
+        """Agrega al reporte los duplicados del bloque y devuelve la máscara de filas a omitir"""
+        originales = [self.original.get(etiqueta) for etiqueta in etiquetas.tolist()]
+        duplicadas = np.array([original is not None for original in originales], dtype=bool)
+        pos = np.flatnonzero(duplicadas)
+        if len(pos):
+            motivo = 'duplicado_fusionado' if self.fusionar else 'duplicado'
+            reporte.agregar(etiquetas[pos] + 1, columna_nombre, motivo, np.array(originales, dtype=object)[pos])
+        return duplicadas if self.fusionar else np.zeros(len(etiquetas), dtype=bool)
+
+def obtener_folder(kml, folders, estructura_folder):
+    """
+    Devuelve el folder (anidado) para una ruta 'A/B/C', creándolo si no existe
+    """
+    partes_folder = [part.strip() for part in estructura_folder.split('/') if part.strip()] if estructura_folder else []
+    
+    folder_actual = kml
+    ruta_actual = []
+    
+    for parte in partes_folder:
+        ruta_actual.append(parte)
+        ruta_key = '/'.join(ruta_actual)
+        
+        if ruta_key not in folders:
+            new_folder = folder_actual.newfolder(name=parte)
+            folders[ruta_key] = new_folder
+            new_folder.visibility = 0
+        
+        folder_actual = folders[ruta_key]
+    
+    return folder_actual
+
+def crear_kml_desde_dataframe(df, archivo_kml, reporte=None, radio_duplicados=None, fusionar_duplicados=False, workers=None):
+    """
+    Crea un KML desde un DataFrame con nombres de columnas flexibles.
+    Si se pasa un ReporteValidacion, se llena con las filas rechazadas y los avisos.
+    Con radio_duplicados (metros) se avisan o fusionan los puntos casi duplicados.
+    'workers' son los procesos para las descripciones (None o 1 = sin procesos).
+    """
+    if reporte is None:
+        reporte = ReporteValidacion()
+    kml = simplekml.Kml()
+    folders = {}
+    estilos = RegistroEstilos(globo=GLOBO_DESCRIPCION)
+    
+    # Encontrar columnas
+    columnas, error = encontrar_columnas(df)
+    if error:
+        return 0, 0, error
+    
+    # Obtener todas las columnas originales para mostrar en el popup
+    todas_las_columnas = df.columns.tolist()
+    
+    # Validar y convertir columnas completas de una sola vez
+    datos = preparar_columnas(df, columnas)
+    # Posición de cada fila (el índice de df puede no ser numérico)
+    etiquetas = np.arange(len(df))
+    registrar_validacion(reporte, df, columnas, datos)
+    
+    errores = int(datos['faltantes'].sum() + datos['invalidas'].sum())
+    puntos_procesados = 0
+    
+    validas = datos['validas']
+    if radio_duplicados:
+        duplicados = Duplicados(radio_duplicados, fusionar_duplicados)
+        duplicados.analizar(etiquetas[validas], datos['latitudes'][validas], datos['longitudes'][validas], datos['nombres'][validas])
+        omitidas = duplicados.registrar(reporte, etiquetas, columnas['nombre'])
+        validas = validas & ~omitidas
+        errores += int(omitidas.sum())
+    
+    # Descripciones de las filas válidas con la plantilla de estas columnas (TODAS EXCEPTO color y folder)
+    posiciones = np.flatnonzero(validas)
+    renderizador = RenderizadorDescripciones(workers)
+    descripciones = renderizador.iterar(PlantillaDescripcion(todas_las_columnas, columnas), df.iloc[posiciones])
+    
+    # Contenedor (kml o folder) ya resuelto para cada ruta de folder
+    contenedores = {}
+    
+    for pos, descripcion_html in zip(posiciones, descripciones):
+        try:
+            nombre = datos['nombres'][pos]
+            estructura_folder = datos['folders'][pos]
+            color = datos['colores'][pos]
+            icono = datos['iconos'][pos]
+            
+            contenedor = contenedores.get(estructura_folder)
+            if contenedor is None:
+                contenedor = obtener_folder(kml, folders, estructura_folder)
+                contenedores[estructura_folder] = contenedor
+            
+            # Crear el punto
+            punto = contenedor.newpoint(name=nombre)
+            
+            # Configurar coordenadas
+            punto.coords = [(float(datos['longitudes'][pos]), float(datos['latitudes'][pos]))]
+            
+            # Configurar estilo compartido (usa color pero no lo muestra en popup)
+            estilos.aplicar_icono(punto, icono, color, 1.0)
+            
+            punto.description = descripcion_html
+            
+            # Deseleccionar por defecto
+            punto.visibility = 0
+            
+            puntos_procesados += 1
+            
+        except Exception as e:
+            reporte.agregar([etiquetas[pos]+1], '', 'error_fila', str(e))
+            errores += 1
+    renderizador.cerrar()
+    
+    # Guardar archivo KML
+    kml.save(archivo_kml)
+    
+    return puntos_procesados, errores, None
+
+FILAS_POR_BLOQUE = 50000
+FOLDERS_ABIERTOS_MAX = 64
+
+def crear_placemark_kml(nombre, latitud, longitud, id_estilo, descripcion):
+    """
+    Genera el texto KML de un Placemark con el mismo contenido que crear_kml_desde_dataframe
+    """
+    return (
+        "<Placemark>"
+        f"<name>{escape(nombre)}</name>"
+        "<visibility>0</visibility>"
+        f"<description>{escape(descripcion)}</description>"
+        f"<styleUrl>#{escape(id_estilo)}</styleUrl>"
+        f"<Point><coordinates>{longitud!r},{latitud!r},0.0</coordinates></Point>"
+        "</Placemark>\n"
+    )
+
+def _placemarks_de_bloque(bloque, columnas, estilos, reporte, duplicados=None, plantilla=None, renderizador=None, inicio=0):
+    """
+    Valida un bloque del CSV (los rechazos quedan en el reporte) y genera
+    (folder, latitud, longitud, placemark) por cada fila válida.
+    inicio es la cantidad de filas del archivo antes del bloque
+    """
+    if plantilla is None:
+        plantilla = PlantillaDescripcion(bloque.columns.tolist(), columnas)
+    datos = preparar_columnas(bloque, columnas)
+    etiquetas = np.arange(len(bloque)) + inicio
+    registrar_validacion(reporte, bloque, columnas, datos, inicio)
+    
+    validas = datos['validas']
+    if duplicados is not None:
+        validas = validas & ~duplicados.registrar(reporte, etiquetas, columnas['nombre'])
+    posiciones = np.flatnonzero(validas)
+    renderizador = renderizador or RenderizadorDescripciones(workers=1)
+    for pos, descripcion in zip(posiciones, renderizador.iterar(plantilla, bloque.iloc[posiciones])):
+        try:
+            latitud = float(datos['latitudes'][pos])
+            longitud = float(datos['longitudes'][pos])
+            placemark = crear_placemark_kml(
+                datos['nombres'][pos],
+                latitud,
+                longitud,
+                estilos.id_icono(datos['iconos'][pos], datos['colores'][pos], 1.0),
+                descripcion
+            )
+        except Exception as e:
+            reporte.agregar([etiquetas[pos]+1], '', 'error_fila', str(e))
+            continue
+        yield datos['folders'][pos], latitud, longitud, placemark
+
+def _nodo_folder(raiz, estructura_folder):
+    """Nodo del árbol de folders para una ruta 'A/B/C' (lo crea si no existe)"""
+    nodo = raiz
+    for parte in [part.strip() for part in estructura_folder.split('/') if part.strip()]:
+        if parte not in nodo['hijos']:
+            nodo['hijos'][parte] = {'nombre': parte, 'hijos': {}, 'archivo': None}
+        nodo = nodo['hijos'][parte]
+    return nodo
+
+class _SpoolFolders:
+    """
+    Guarda en disco los Placemarks de cada folder mientras llegan los bloques del CSV,
+    para luego escribir los folders anidados aunque sus filas estén dispersas.
+    """
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.raiz = {'nombre': None, 'hijos': {}, 'archivo': None}
+        self.abiertos = OrderedDict()
+        self.total_archivos = 0
+    
+    def agregar(self, estructura_folder, placemark):
+        nodo = _nodo_folder(self.raiz, estructura_folder)
+        if nodo['archivo'] is None:
+            self.total_archivos += 1
+            nodo['archivo'] = os.path.join(self.directorio, f"{self.total_archivos}.kml")
+        
+        archivo = self.abiertos.pop(nodo['archivo'], None)
+        if archivo is None:
+            if len(self.abiertos) >= FOLDERS_ABIERTOS_MAX:
+                _, viejo = self.abiertos.popitem(last=False)
+                viejo.close()
+            archivo = open(nodo['archivo'], 'a', encoding='utf-8')
+        self.abiertos[nodo['archivo']] = archivo
+        archivo.write(placemark)
+    
+    def cerrar(self):
+        for archivo in self.abiertos.values():
+            archivo.close()
+        self.abiertos.clear()
+    
+    def escribir(self, destino, nodo=None):
+        nodo = nodo or self.raiz
+        if nodo['nombre'] is not None:
+            destino.write(f"<Folder><name>{escape(nodo['nombre'])}</name><visibility>0</visibility>\n")
+        for hijo in nodo['hijos'].values():
+            self.escribir(destino, hijo)
+        if nodo['archivo'] is not None:
+            with open(nodo['archivo'], 'r', encoding='utf-8') as origen:
+                shutil.copyfileobj(origen, destino)
+        if nodo['nombre'] is not None:
+            destino.write("</Folder>\n")
+
+def convertir_csv_en_streaming(archivo_csv, archivo_salida, kmz=False, filas_por_bloque=FILAS_POR_BLOQUE, reporte=None,
+                               radio_duplicados=None, fusionar_duplicados=False, workers=None):
+    """
+    Convierte un CSV a KML (o KMZ) leyendo por bloques, con memoria acotada
+    """
+    if reporte is None:
+        reporte = ReporteValidacion()
+    puntos_procesados = 0
+    cabecera, columnas, error = _leer_cabecera(archivo_csv)
+    if error:
+        return 0, 0, error
+    plantilla = PlantillaDescripcion(cabecera, columnas)
+    duplicados = None
+    if radio_duplicados:
+        duplicados = Duplicados(radio_duplicados, fusionar_duplicados)
+        error = duplicados.analizar_csv(archivo_csv, filas_por_bloque)
+        if error:
+            return 0, 0, error
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        spool = _SpoolFolders(directorio)
+        estilos = TablaEstilosTexto(globo=GLOBO_DESCRIPCION)
+        renderizador = RenderizadorDescripciones(workers)
+        rechazadas_antes = reporte.rechazadas()
+        inicio = 0
+        try:
+            for bloque in pd.read_csv(archivo_csv, chunksize=filas_por_bloque):
+                for folder, _, _, placemark in _placemarks_de_bloque(bloque, columnas, estilos, reporte, duplicados, plantilla, renderizador, inicio):
+                    spool.agregar(folder, placemark)
+                    puntos_procesados += 1
+                inicio += len(bloque)
+        finally:
+            spool.cerrar()
+            renderizador.cerrar()
+        errores = reporte.rechazadas() - rechazadas_antes
+        
+        # Escribir el documento final (opcionalmente comprimido como KMZ)
+        if kmz:
+            with zipfile.ZipFile(archivo_salida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                with zf.open('doc.kml', 'w') as crudo:
+                    with TextIOWrapper(crudo, encoding='utf-8') as destino:
+                        _escribir_documento(destino, spool, estilos)
+        else:
+            with open(archivo_salida, 'w', encoding='utf-8') as destino:
+                _escribir_documento(destino, spool, estilos)
+    
+    return puntos_procesados, errores, None
+
+def _escribir_documento(destino, spool, estilos):
+    destino.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    destino.write('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n')
+    destino.write('<Document>\n')
+    destino.write(estilos.kml())
+    spool.escribir(destino)
+    destino.write('</Document>\n')
+    destino.write('</kml>\n')
+
+# Modo teselas: pirámide de documentos con Region/Lod enlazados por NetworkLinks
+PUNTOS_POR_TESELA = 2000
+PROFUNDIDAD_MAX_TESELAS = 12
+LOD_MIN_PIXELES = 128
+
+class _SpoolTeselas:
+    """
+    Guarda los Placemarks en un archivo temporal y sus coordenadas, posición en
+    el archivo y folder en arreglos compactos, para repartirlos después por teselas.
+    """
+    def __init__(self, ruta):
+        self.archivo = open(ruta, 'w+b')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.inicios = array('q')
+        self.largos = array('l')
+        self.folders = array('l')
+        self.nombres_folder = []
+        self._ids_folder = {}
+        self._posicion = 0
+    
+    def agregar(self, estructura_folder, latitud, longitud, placemark):
+        id_folder = self._ids_folder.get(estructura_folder)
+        if id_folder is None:
+            id_folder = self._ids_folder[estructura_folder] = len(self.nombres_folder)
+            self.nombres_folder.append(estructura_folder)
+        datos = placemark.encode('utf-8')
+        self.archivo.write(datos)
+        self.latitudes.append(latitud)
+        self.longitudes.append(longitud)
+        self.inicios.append(self._posicion)
+        self.largos.append(len(datos))
+        self.folders.append(id_folder)
+        self._posicion += len(datos)
+    
+    def __len__(self):
+        return len(self.latitudes)
+    
+    def leer(self, indice):
+        self.archivo.seek(self.inicios[indice])
+        return self.archivo.read(self.largos[indice]).decode('utf-8')
+    
+    def cerrar(self):
+        self.archivo.close()
+
+def _dividir_teselas(latitudes, longitudes, indices, caja, capacidad, profundidad=0, clave='r'):
+    """
+    Quadtree por lat/lon. Una tesela con más puntos que su capacidad se queda con
+    una muestra repartida en su área (un punto por celda de una grilla) y reparte
+    el resto entre sus cuatro cuadrantes, que se cargan al acercarse.
+    """
+    nodo = {'clave': clave, 'caja': caja, 'indices': indices, 'hijos': []}
+    if len(indices) <= capacidad or profundidad >= PROFUNDIDAD_MAX_TESELAS:
+        return nodo
+    
+    sur, oeste, norte, este = caja
+    lado = int(math.ceil(math.sqrt(capacidad)))
+    filas = np.clip(((latitudes[indices] - sur) / (norte - sur) * lado).astype(np.int64), 0, lado - 1)
+    columnas = np.clip(((longitudes[indices] - oeste) / (este - oeste) * lado).astype(np.int64), 0, lado - 1)
+    _, primeros = np.unique(filas * lado + columnas, return_index=True)
+    muestra = np.sort(primeros)[:capacidad]
+    nodo['indices'] = indices[muestra]
+    resto = np.delete(indices, muestra)
+    
+    medio_lat = (sur + norte) / 2
+    medio_lon = (oeste + este) / 2
+    al_norte = latitudes[resto] >= medio_lat
+    al_este = longitudes[resto] >= medio_lon
+    cuadrantes = [
+        (~al_norte & ~al_este, (sur, oeste, medio_lat, medio_lon)),
+        (~al_norte & al_este, (sur, medio_lon, medio_lat, este)),
+        (al_norte & ~al_este, (medio_lat, oeste, norte, medio_lon)),
+        (al_norte & al_este, (medio_lat, medio_lon, norte, este))
+    ]
+    for i, (mascara, sub_caja) in enumerate(cuadrantes):
+        if mascara.any():
+            nodo['hijos'].append(
+                _dividir_teselas(latitudes, longitudes, resto[mascara], sub_caja, capacidad, profundidad + 1, f"{clave}{i}")
+            )
+    return nodo
+
+def _archivo_tesela(nodo):
+    return 'doc.kml' if nodo['clave'] == 'r' else f"{nodo['clave']}.kml"
+
+def _region_kml(nodo):
+    sur, oeste, norte, este = nodo['caja']
+    # Los puntos fuera de rango se conservan, pero la Region debe ser válida
+    sur, norte = max(sur, -90.0), min(norte, 90.0)
+    oeste, este = max(oeste, -180.0), min(este, 180.0)
+    # La tesela raíz se ve siempre; las demás solo al ocupar suficientes píxeles en pantalla
+    min_pixeles = 0 if nodo['clave'] == 'r' else LOD_MIN_PIXELES
+    return (
+        "<Region><LatLonAltBox>"
+        f"<north>{norte!r}</north><south>{sur!r}</south><east>{este!r}</east><west>{oeste!r}</west>"
+        "</LatLonAltBox>"
+        f"<Lod><minLodPixels>{min_pixeles}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod>"
+        "</Region>\n"
+    )
+
+def _escribir_tesela(destino, nodo, spool, estilos, nombre_documento):
+    destino.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    destino.write('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n')
+    destino.write(f"<Document><name>{escape(nombre_documento)}</name>\n")
+    destino.write(_region_kml(nodo))
+    destino.write(estilos.kml())
+    
+    # Estructura de folders de los puntos de esta tesela
+    raiz = {'nombre': None, 'hijos': {}, 'archivo': None}
+    for indice in nodo['indices']:
+        hoja = _nodo_folder(raiz, spool.nombres_folder[spool.folders[indice]])
+        if hoja['archivo'] is None:
+            hoja['archivo'] = []
+        hoja['archivo'].append(int(indice))
+    _escribir_folders_tesela(destino, raiz, spool)
+    
+    for hijo in nodo['hijos']:
+        destino.write(
+            f"<NetworkLink><name>{escape(hijo['clave'])}</name>"
+            f"{_region_kml(hijo)}"
+            f"<Link><href>{_archivo_tesela(hijo)}</href><viewRefreshMode>onRegion</viewRefreshMode></Link>"
+            "</NetworkLink>\n"
+        )
+    destino.write('</Document>\n')
+    destino.write('</kml>\n')
+
+def _escribir_folders_tesela(destino, nodo, spool):
+    # Como _SpoolFolders.escribir, con los índices de los Placemarks en lugar de un archivo por folder
+    if nodo['nombre'] is not None:
+        destino.write(f"<Folder><name>{escape(nodo['nombre'])}</name><visibility>0</visibility>\n")
+    for hijo in nodo['hijos'].values():
+        _escribir_folders_tesela(destino, hijo, spool)
+    for indice in nodo['archivo'] or []:
+        destino.write(spool.leer(indice))
+    if nodo['nombre'] is not None:
+        destino.write("</Folder>\n")
+
+def _recorrer_teselas(nodo):
+    yield nodo
+    for hijo in nodo['hijos']:
+        yield from _recorrer_teselas(hijo)
+
+def convertir_csv_en_teselas(archivo_csv, archivo_salida, puntos_por_tesela=PUNTOS_POR_TESELA, filas_por_bloque=FILAS_POR_BLOQUE, reporte=None,
+                             radio_duplicados=None, fusionar_duplicados=False, workers=None):
+    """
+    Convierte un CSV a un KMZ de teselas (quadtree) con Region/Lod enlazadas por
+    NetworkLinks: los visores cargan solo las teselas visibles al nivel de zoom
+    actual. Cada tesela conserva la estructura de folders de sus puntos.
+    """
+    if reporte is None:
+        reporte = ReporteValidacion()
+    cabecera, columnas, error = _leer_cabecera(archivo_csv)
+    if error:
+        return 0, 0, error
+    plantilla = PlantillaDescripcion(cabecera, columnas)
+    duplicados = None
+    if radio_duplicados:
+        duplicados = Duplicados(radio_duplicados, fusionar_duplicados)
+        error = duplicados.analizar_csv(archivo_csv, filas_por_bloque)
+        if error:
+            return 0, 0, error
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        spool = _SpoolTeselas(os.path.join(directorio, 'placemarks.kml'))
+        estilos = TablaEstilosTexto(globo=GLOBO_DESCRIPCION)
+        renderizador = RenderizadorDescripciones(workers)
+        rechazadas_antes = reporte.rechazadas()
+        inicio = 0
+        try:
+            for bloque in pd.read_csv(archivo_csv, chunksize=filas_por_bloque):
+                for folder, latitud, longitud, placemark in _placemarks_de_bloque(bloque, columnas, estilos, reporte, duplicados, plantilla, renderizador, inicio):
+                    spool.agregar(folder, latitud, longitud, placemark)
+                inicio += len(bloque)
+            errores = reporte.rechazadas() - rechazadas_antes
+            
+            latitudes = np.frombuffer(spool.latitudes, dtype=float) if len(spool) else np.empty(0)
+            longitudes = np.frombuffer(spool.longitudes, dtype=float) if len(spool) else np.empty(0)
+            if len(spool):
+                # Margen mínimo para que la caja nunca tenga ancho o alto cero
+                caja = (float(latitudes.min()) - 1e-6, float(longitudes.min()) - 1e-6,
+                        float(latitudes.max()) + 1e-6, float(longitudes.max()) + 1e-6)
+            else:
+                caja = (0.0, 0.0, 0.0, 0.0)
+            raiz = _dividir_teselas(latitudes, longitudes, np.arange(len(spool)), caja, puntos_por_tesela)
+            
+            nombre = os.path.splitext(os.path.basename(str(getattr(archivo_csv, 'name', archivo_csv))))[0]
+            with zipfile.ZipFile(archivo_salida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for nodo in _recorrer_teselas(raiz):
+                    with zf.open(_archivo_tesela(nodo), 'w') as crudo:
+                        with TextIOWrapper(crudo, encoding='utf-8') as destino:
+                            _escribir_tesela(destino, nodo, spool, estilos, nombre if nodo['clave'] == 'r' else nodo['clave'])
+        finally:
+            spool.cerrar()
+            renderizador.cerrar()
+    
+    return len(spool), errores, None
+
+def convertir_csv(archivo_csv, archivo_salida, kmz=False, streaming=False, teselas=False, reporte=None, df=None,
+                  radio_duplicados=None, fusionar_duplicados=False, workers=None):
+    """
+    Convierte un CSV con el modo pedido: teselas Region/LOD, streaming por bloques
+    (KML o KMZ) o DataFrame completo (df si ya se leyó, si no se lee el CSV).
+    Devuelve (puntos, errores, error) como cada conversión.
+    """
+    opciones = {'radio_duplicados': radio_duplicados, 'fusionar_duplicados': fusionar_duplicados, 'workers': workers}
+    if teselas:
+        return convertir_csv_en_teselas(archivo_csv, archivo_salida, reporte=reporte, **opciones)
+    if streaming or kmz:
+        return convertir_csv_en_streaming(archivo_csv, archivo_salida, kmz=kmz, reporte=reporte, **opciones)
+    if df is None:
+        df = pd.read_csv(archivo_csv)
+    return crear_kml_desde_dataframe(df, archivo_salida, reporte=reporte, **opciones)
@@ -0,0 +1,190 @@
+"""
+Descripciones HTML (popups) de los Placemarks del conversor.
+La plantilla se compila una vez por disposición de columnas y cada columna se
+escapa y formatea de una sola vez (operaciones de texto de pandas; los números
+se convierten una vez por valor distinto).
+El estilo va en el BalloonStyle compartido (GLOBO_DESCRIPCION), no en cada fila.
+"""
+import html
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .columnas import columnas_popup
+
+CSS_DESCRIPCION = (
+    ".kc{font-family:Arial,sans-serif;max-width:400px}"
+    ".kc h3{color:#1f77b4;margin-bottom:10px}"
+    ".kc table{width:100%;border-collapse:collapse}"
+    ".kc td{padding:4px 8px;border-bottom:1px solid #ddd;vertical-align:top;width:70%}"
+    ".kc td.k{font-weight:bold;width:30%}"
+)
+# Texto del BalloonStyle: el CSS una vez por estilo y la descripción de cada Placemark
+GLOBO_DESCRIPCION = f"<style>{CSS_DESCRIPCION}</style>$[description]"
+
+# Filas que se renderizan juntas: acota la memoria de las descripciones pendientes
+FILAS_POR_PARTE = 5000
+# Bloques más chicos no se reparten entre procesos: enviar los datos cuesta más que renderizarlos
+FILAS_MIN_PARALELO = 20000
+WORKERS_MAX = 8
+# Partes enviadas al pool y aún sin consumir, por proceso: acota la memoria con streaming
+PARTES_EN_VUELO = 2
+
+_INICIO = "<div class='kc'>"
+_TABLA = "<table>"
+_FIN = "</table></div>"
+_COORDENADAS = "<tr><td class='k'>Coordenadas:</td><td>"
+_FIN_CELDA = "</td></tr>"
+
+
+# Mismos reemplazos que html.escape ('&' primero)
+_ENTIDADES = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;')]
+
+
+def _es_numerica(serie):
+    return serie.dtype.kind in 'biuf'
+
+
+def _escapar(texto):
+    """html.escape de toda una columna de texto; solo se reemplaza en las filas que lo necesitan"""
+    necesitan = texto.str.contains('[&<>"\']', regex=True, na=False)
+    if not necesitan.any():
+        return texto
+    escapado = texto[necesitan]
+    for caracter, entidad in _ENTIDADES:
+        escapado = escapado.str.replace(caracter, entidad, regex=False)
+    return texto.where(~necesitan, escapado)
+
+
+def _celdas(serie, prefijo, sufijo, en_blanco=False):
+    """
+    prefijo + valor escapado + sufijo en cada fila con valor ('' en las demás).
+    Los valores en blanco se omiten salvo con en_blanco. Los números no se escapan
+    y cada valor distinto se convierte a texto una sola vez.
+    """
+    celdas = np.full(len(serie), '', dtype=object)
+    if _es_numerica(serie):
+        codigos, unicos = pd.factorize(serie)
+        presentes = codigos >= 0
+        textos = np.array([prefijo + str(valor) + sufijo for valor in unicos.to_numpy()], dtype=object)
+        celdas[presentes] = textos[codigos[presentes]]
+        return celdas
+    texto = serie.astype(str)
+    presentes = serie.notna()
+    if not en_blanco:
+        presentes &= texto.str.strip() != ''
+    presentes = presentes.to_numpy()
+    celdas[presentes] = prefijo + _escapar(texto[presentes]).to_numpy(dtype=object) + sufijo
+    return celdas
+
+
+def _numero(serie):
+    if not _es_numerica(serie):
+        serie = serie.astype(str).str.strip().where(serie.notna())
+    return pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+
+
+class PlantillaDescripcion:
+    """
+    Descripción HTML compilada para una disposición de columnas: título con el
+    nombre, una fila de tabla por columna del popup (sin color ni folder) y las
+    coordenadas. renderizar(df) produce las descripciones de todas las filas.
+    """
+
+    def __init__(self, todas_las_columnas, columnas_mapeadas):
+        mostradas, _ = columnas_popup(todas_las_columnas, columnas_mapeadas)
+        self.nombre = columnas_mapeadas['nombre']
+        self.latitud = columnas_mapeadas['latitud']
+        self.longitud = columnas_mapeadas['longitud']
+        self.celdas = [(col, f"<tr><td class='k'>{html.escape(str(col))}:</td><td>") for col in mostradas]
+        self.columnas_usadas = list(dict.fromkeys([self.nombre, self.latitud, self.longitud] + mostradas))
+
+    def renderizar(self, df):
+        """Lista con la descripción de cada fila de df, en el mismo orden"""
+        if len(df) == 0:
+            return []
+        partes = [_INICIO + _celdas(df[self.nombre], "<h3>", "</h3>", en_blanco=True) + _TABLA]
+        partes.extend(_celdas(df[col], prefijo, _FIN_CELDA) for col, prefijo in self.celdas)
+        partes.append(self._coordenadas(df[self.latitud], df[self.longitud]))
+        return ["".join(fila) + _FIN for fila in zip(*partes)]
+
+    @staticmethod
+    def _coordenadas(serie_lat, serie_lon):
+        coordenadas = np.full(len(serie_lat), '', dtype=object)
+        ambas = (serie_lat.notna() & serie_lon.notna()).to_numpy()
+        latitudes = _numero(serie_lat)
+        longitudes = _numero(serie_lon)
+        numericas = ambas & ~np.isnan(latitudes) & ~np.isnan(longitudes)
+        if numericas.any():
+            coordenadas[numericas] = [f"{_COORDENADAS}{latitud:.6f}, {longitud:.6f}{_FIN_CELDA}"
+                                      for latitud, longitud in zip(latitudes[numericas].tolist(), longitudes[numericas].tolist())]
+        # Coordenadas que no son números: se muestra el valor original
+        for pos in np.flatnonzero(ambas & ~numericas):
+            coordenadas[pos] = f"{_COORDENADAS}{html.escape(f'{serie_lat.iat[pos]}, {serie_lon.iat[pos]}')}{_FIN_CELDA}"
+        return coordenadas
+
+
+@lru_cache(maxsize=32)
+def _plantilla(todas_las_columnas, columnas_mapeadas):
+    return PlantillaDescripcion(list(todas_las_columnas), dict(columnas_mapeadas))
+
+
+def crear_descripcion_html(fila, todas_las_columnas, columnas_mapeadas):
+    """
+    Crea una descripción HTML con todas las columnas del CSV EXCEPTO color y folder
+    (una fila; para muchas filas usar PlantillaDescripcion.renderizar)
+    """
+    plantilla = _plantilla(tuple(todas_las_columnas), tuple(sorted(columnas_mapeadas.items())))
+    df = pd.DataFrame([[fila.get(col) for col in plantilla.columnas_usadas]], columns=plantilla.columnas_usadas)
+    return plantilla.renderizar(df)[0]
+
+
+class RenderizadorDescripciones:
+    """
+    Renderiza bloques con una plantilla por partes de filas_por_parte filas; con
+    workers > 1 los bloques grandes reparten las partes entre procesos, con a lo
+    sumo PARTES_EN_VUELO partes por proceso pendientes a la vez. Las descripciones
+    salen en el orden de las filas. El pool se crea con el primer bloque que lo
+    necesita y se reutiliza para los siguientes.
+    workers=None o 1 no usa procesos (la app de Streamlit); la CLI pide más (hasta WORKERS_MAX).
+    """
+
+    def __init__(self, workers=None, filas_por_parte=FILAS_POR_PARTE):
+        self.workers = min(workers or 1, WORKERS_MAX)
+        self.filas_por_parte = filas_por_parte
+        self._pool = None
+
+    def iterar(self, plantilla, df):
+        """Genera la descripción de cada fila de df, en orden"""
+        if self.workers <= 1 or len(df) < FILAS_MIN_PARALELO:
+            for inicio in range(0, len(df), self.filas_por_parte):
+                yield from plantilla.renderizar(df.iloc[inicio:inicio + self.filas_por_parte])
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Solo las columnas que usa la plantilla viajan a los procesos
+        df = df[plantilla.columnas_usadas]
+        pendientes = deque()
+        for inicio in range(0, len(df), self.filas_por_parte):
+            if len(pendientes) >= self.workers * PARTES_EN_VUELO:
+                yield from pendientes.popleft().result()
+            pendientes.append(self._pool.submit(plantilla.renderizar, df.iloc[inicio:inicio + self.filas_por_parte]))
+        while pendientes:
+            yield from pendientes.popleft().result()
+
+    def renderizar(self, plantilla, df):
+        return list(self.iterar(plantilla, df))
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
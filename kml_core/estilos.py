@@ -0,0 +1,104 @@
+import simplekml
+from xml.sax.saxutils import escape
+
+
+class RegistroEstilos:
+    """
+    Registro de estilos compartidos para simplekml.
+    Cada combinación (ícono, color, escala, grosor de línea) se crea una sola vez
+    y los Placemarks la referencian con styleUrl en lugar de llevar su propio <Style>.
+    Con 'globo' cada estilo lleva ese texto de BalloonStyle (p. ej. el CSS de las descripciones).
+    """
+
+    def __init__(self, globo=None):
+        self.globo = globo
+        self._estilos = {}
+        self._mapas = {}
+
+    def estilo(self, href=None, color=None, escala=None, ancho=None):
+        """Devuelve el estilo compartido para la combinación indicada"""
+        clave = (href, color, escala, ancho)
+        estilo = self._estilos.get(clave)
+        if estilo is None:
+            estilo = simplekml.Style()
+            if ancho is None:
+                # Estilo de ícono
+                if href is not None:
+                    estilo.iconstyle.icon.href = href
+                if color is not None:
+                    estilo.iconstyle.color = color
+                if escala is not None:
+                    estilo.iconstyle.scale = escala
+            else:
+                # Estilo de línea
+                estilo.linestyle.width = ancho
+                if color is not None:
+                    estilo.linestyle.color = color
+            if self.globo is not None:
+                estilo.balloonstyle.text = self.globo
+            self._estilos[clave] = estilo
+        return estilo
+
+    def mapa_estilos(self, normal, resaltado):
+        """Devuelve el StyleMap compartido para un par (normal, resaltado) de claves de estilo"""
+        clave = (normal, resaltado)
+        mapa = self._mapas.get(clave)
+        if mapa is None:
+            mapa = simplekml.StyleMap(normalstyle=self.estilo(*normal), highlightstyle=self.estilo(*resaltado))
+            self._mapas[clave] = mapa
+        return mapa
+
+    def aplicar_icono(self, feature, href, color, escala=1.0, escala_resaltado=None):
+        """Asigna a un punto el estilo de ícono compartido (con StyleMap si hay escala de resaltado)"""
+        if escala_resaltado is None:
+            feature.style = self.estilo(href, color, escala)
+        else:
+            feature.stylemap = self.mapa_estilos((href, color, escala, None), (href, color, escala_resaltado, None))
+
+    def aplicar_linea(self, feature, color, ancho, ancho_resaltado=None):
+        """Asigna a una línea el estilo de línea compartido (con StyleMap si hay grosor de resaltado)"""
+        if ancho_resaltado is None:
+            feature.style = self.estilo(color=color, ancho=ancho)
+        else:
+            feature.stylemap = self.mapa_estilos((None, color, None, ancho), (None, color, None, ancho_resaltado))
+
+    def __len__(self):
+        return len(self._estilos)
+
+
+class TablaEstilosTexto:
+    """
+    Equivalente de RegistroEstilos para KML escrito como texto (modo streaming).
+    Asigna un id por combinación de ícono, color y escala y genera los <Style> al final.
+    """
+
+    def __init__(self, prefijo='estilo', globo=None):
+        self.prefijo = prefijo
+        self.globo = globo
+        self._ids = {}
+
+    def id_icono(self, href, color, escala=1.0):
+        """Devuelve el id del estilo compartido, registrándolo si es nuevo"""
+        clave = (href, color, escala)
+        id_estilo = self._ids.get(clave)
+        if id_estilo is None:
+            id_estilo = f"{self.prefijo}{len(self._ids) + 1}"
+            self._ids[clave] = id_estilo
+        return id_estilo
+
+    def kml(self):
+        """Genera los elementos <Style> de todos los estilos registrados"""
+        partes = []
+        globo = f"<BalloonStyle><text>{escape(self.globo)}</text></BalloonStyle>" if self.globo is not None else ""
+        for (href, color, escala), id_estilo in self._ids.items():
+            partes.append(
+                f'<Style id="{escape(id_estilo)}"><IconStyle>'
+                f"<color>{escape(color)}</color>"
+                f"<scale>{escala}</scale>"
+                f"<Icon><href>{escape(href)}</href></Icon>"
+                f"</IconStyle>{globo}</Style>\n"
+            )
+        return "".join(partes)
+
+    def __len__(self):
+        return len(self._ids)
@@ -0,0 +1,350 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distancia de círculo máximo en metros; acepta escalares o arreglos de NumPy (broadcast)"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def pair_distances(lats, lons, pairs):
+    """Distancias en metros de un arreglo (m, 2) de pares de índices"""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    return haversine(lats[pairs[:, 0]], lons[pairs[:, 0]], lats[pairs[:, 1]], lons[pairs[:, 1]])
+
+
+class GridIndex:
+    """
+    Grilla uniforme sobre coordenadas proyectadas localmente (metros). Cada celda
+    guarda los índices de sus puntos, así que las búsquedas por radio y de vecinos
+    más cercanos solo revisan las celdas alrededor de la consulta y no todos los puntos.
+    """
+
+    def __init__(self, lats, lons, cell_size_m=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        n = len(self.lats)
+        self.lat0 = math.radians(float(np.mean(self.lats))) if n else 0.0
+        self.x, self.y = self.project(self.lats, self.lons)
+
+        if cell_size_m is None:
+            # Unos pocos puntos por celda en promedio
+            if n > 1:
+                area = max(float(np.ptp(self.x)) * float(np.ptp(self.y)), 1.0)
+                cell_size_m = max(math.sqrt(area / n) * 2, 1.0)
+            else:
+                cell_size_m = 100.0
+        self.cell = float(cell_size_m)
+
+        self.cx = np.floor(self.x / self.cell).astype(np.int64)
+        self.cy = np.floor(self.y / self.cell).astype(np.int64)
+        self.cells = {}
+        if n:
+            order = np.lexsort((self.cy, self.cx))
+            keys = np.stack([self.cx[order], self.cy[order]], axis=1)
+            starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+            bounds = np.concatenate([[0], starts, [n]])
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                self.cells[(int(keys[start, 0]), int(keys[start, 1]))] = order[start:end]
+            self.extent = (int(self.cx.min()), int(self.cx.max()), int(self.cy.min()), int(self.cy.max()))
+        else:
+            self.extent = (0, 0, 0, 0)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def project(self, lats, lons):
+        """Proyección equirectangular alrededor de la latitud media (metros)"""
+        x = np.radians(lons) * EARTH_RADIUS_M * math.cos(self.lat0)
+        y = np.radians(lats) * EARTH_RADIUS_M
+        return x, y
+
+    def _ring(self, cx, cy, r):
+        # Solo las celdas del anillo dentro de la extensión de la grilla: lejos de los
+        # puntos, un anillo enorme cuesta lo mismo que la grilla y no r celdas
+        if r == 0:
+            cell = self.cells.get((cx, cy))
+            return [cell] if cell is not None else []
+        xmin, xmax, ymin, ymax = self.extent
+        x_from, x_to = max(cx - r, xmin), min(cx + r, xmax)
+        y_from, y_to = max(cy - r + 1, ymin), min(cy + r - 1, ymax)
+        found = []
+        for y in (cy - r, cy + r):
+            if ymin <= y <= ymax:
+                for x in range(x_from, x_to + 1):
+                    cell = self.cells.get((x, y))
+                    if cell is not None:
+                        found.append(cell)
+        for x in (cx - r, cx + r):
+            if xmin <= x <= xmax:
+                for y in range(y_from, y_to + 1):
+                    cell = self.cells.get((x, y))
+                    if cell is not None:
+                        found.append(cell)
+        return found
+
+    def _min_ring(self, cx, cy):
+        # Los anillos menores no tocan la grilla: no tienen puntos
+        xmin, xmax, ymin, ymax = self.extent
+        return max(xmin - cx, cx - xmax, ymin - cy, cy - ymax, 0)
+
+    def _max_ring(self, cx, cy):
+        xmin, xmax, ymin, ymax = self.extent
+        return max(abs(cx - xmin), abs(cx - xmax), abs(cy - ymin), abs(cy - ymax))
+
+    def query_radius(self, lat, lon, radius_m):
+        """Índices de los puntos a menos de radius_m metros de (lat, lon)"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        x, y = self.project(lat, lon)
+        cx, cy = int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+        reach = int(math.ceil(radius_m / self.cell))
+        candidates = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                cell = self.cells.get((cx + dx, cy + dy))
+                if cell is not None:
+                    candidates.append(cell)
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        idx = np.concatenate(candidates)
+        d = haversine(lat, lon, self.lats[idx], self.lons[idx])
+        return idx[d <= radius_m]
+
+    def nearest(self, lat, lon, k=1, accept=None, max_distance=None):
+        """
+        Índices y distancias (metros) de los k puntos más cercanos a (lat, lon).
+        'accept' filtra arreglos de índices candidatos (devuelve una máscara booleana).
+        Con max_distance (metros proyectados) la búsqueda se detiene pasada esa distancia.
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        if not len(self):
+            return empty
+        x, y = self.project(lat, lon)
+        cx, cy = int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+        max_ring = self._max_ring(cx, cy)
+        best_idx, best_d = empty
+        r = self._min_ring(cx, cy)
+        while r <= max_ring:
+            # Los puntos del anillo r están al menos a (r - 1) celdas de distancia
+            if max_distance is not None and (r - 1) * self.cell > max_distance:
+                break
+            cells = self._ring(cx, cy, r)
+            if cells:
+                idx = np.concatenate(cells)
+                if accept is not None:
+                    idx = idx[accept(idx)]
+                if len(idx):
+                    d = np.hypot(self.x[idx] - x, self.y[idx] - y)
+                    best_idx = np.concatenate([best_idx, idx])
+                    best_d = np.concatenate([best_d, d])
+                    order = np.argsort(best_d, kind='stable')[:k]
+                    best_idx, best_d = best_idx[order], best_d[order]
+            # Los puntos fuera del anillo r están a más de r celdas de distancia
+            if len(best_idx) >= k and best_d[-1] <= r * self.cell:
+                break
+            r += 1
+        if not len(best_idx):
+            return empty
+        return best_idx, haversine(lat, lon, self.lats[best_idx], self.lons[best_idx])
+
+
+def nearest_neighbor_pairs(index, eligible=None):
+    """
+    Pares (i, j) que unen cada punto con su vecino elegible más cercano (j != i).
+    'eligible(i, candidates)' devuelve una máscara booleana; los pares repetidos se descartan.
+    """
+    pairs = set()
+    for i in range(len(index)):
+        if eligible is None:
+            accept = lambda idx, i=i: idx != i
+        else:
+            accept = lambda idx, i=i: (idx != i) & eligible(i, idx)
+        found, _ = index.nearest(index.lats[i], index.lons[i], k=1, accept=accept)
+        if len(found):
+            j = int(found[0])
+            pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, a):
+        while self.parent[a] != a:
+            self.parent[a] = self.parent[self.parent[a]]
+            a = self.parent[a]
+        return a
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        self.parent[rb] = ra
+        return True
+
+
+def minimum_spanning_tree(index, k=8, eligible=None):
+    """
+    Árbol de expansión mínima euclidiano (lista de pares (i, j)) de los puntos indexados.
+    Las aristas candidatas salen de los k vecinos más cercanos de cada punto (Kruskal);
+    las componentes que quedan separadas se unen luego por su par más cercano.
+    Con 'eligible(i, candidates)' (como en nearest_neighbor_pairs) solo se usan las
+    aristas permitidas; si alguna componente no tiene ninguna, el resultado es un bosque.
+    """
+    n = len(index)
+    if n < 2:
+        return []
+    k = min(k, n - 1)
+    edges_i, edges_j, edges_d = [], [], []
+    for i in range(n):
+        if eligible is None:
+            accept = lambda idx, i=i: idx != i
+        else:
+            accept = lambda idx, i=i: (idx != i) & eligible(i, idx)
+        found, _ = index.nearest(index.lats[i], index.lons[i], k=k, accept=accept)
+        edges_i.append(np.full(len(found), i))
+        edges_j.append(found)
+        edges_d.append(np.hypot(index.x[found] - index.x[i], index.y[found] - index.y[i]))
+    edges_i = np.concatenate(edges_i)
+    edges_j = np.concatenate(edges_j)
+    edges_d = np.concatenate(edges_d)
+
+    uf = _UnionFind(n)
+    tree = []
+    for e in np.argsort(edges_d, kind='stable'):
+        i, j = int(edges_i[e]), int(edges_j[e])
+        if uf.union(i, j):
+            tree.append((min(i, j), max(i, j)))
+            if len(tree) == n - 1:
+                return tree
+
+    # Componentes separadas: unir cada una con su punto externo más cercano (Borůvka)
+    while len(tree) < n - 1:
+        labels = np.array([uf.find(i) for i in range(n)])
+        best = {}
+        for i in range(n):
+            # Solo interesa un punto externo más cercano que el mejor ya encontrado para la componente
+            limit = best[labels[i]][0] if labels[i] in best else None
+            if eligible is None:
+                accept = lambda idx, c=labels[i]: labels[idx] != c
+            else:
+                accept = lambda idx, c=labels[i], i=i: (labels[idx] != c) & eligible(i, idx)
+            found, _ = index.nearest(index.lats[i], index.lons[i], k=1, accept=accept, max_distance=limit)
+            if len(found):
+                j = int(found[0])
+                d = math.hypot(index.x[j] - index.x[i], index.y[j] - index.y[i])
+                if labels[i] not in best or d < best[labels[i]][0]:
+                    best[labels[i]] = (d, i, j)
+        if not best:
+            break
+        for d, i, j in sorted(best.values()):
+            if uf.union(i, j):
+                tree.append((min(i, j), max(i, j)))
+    return tree
+
+
+def _cells(lats, lons, size_m):
+    """Celda (cx, cy) de cada punto en una grilla de size_m metros"""
+    # Proyección a la latitud más alejada del ecuador: las distancias en x nunca se
+    # sobreestiman, así que dos puntos cercanos siempre caen en celdas vecinas
+    lat_ref = math.radians(min(float(np.max(np.abs(lats))), 89.0))
+    x = np.radians(lons) * EARTH_RADIUS_M * math.cos(lat_ref)
+    y = np.radians(lats) * EARTH_RADIUS_M
+    return np.floor(x / size_m).astype(np.int64), np.floor(y / size_m).astype(np.int64)
+
+
+def close_pairs(lats, lons, radius_m):
+    """
+    Pares (i, j) (i < j) de puntos a menos de radius_m metros, como arreglo (m, 2).
+    Los puntos se reparten en celdas de radius_m, así que solo se comparan los de la
+    misma celda o de celdas vecinas.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = len(lats)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    cx, cy = _cells(lats, lons, radius_m)
+    cx -= cx.min()
+    cy -= cy.min() - 1
+    width = int(cy.max()) + 2
+    keys = cx * width + cy
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pairs = []
+    # La misma celda y las cuatro vecinas "hacia adelante": cada par de celdas se compara una vez
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        target = sorted_keys + dx * width + dy
+        lo = np.searchsorted(sorted_keys, target, side='left')
+        hi = np.searchsorted(sorted_keys, target, side='right')
+        if dx == 0 and dy == 0:
+            lo = np.maximum(lo, np.arange(n) + 1)
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        if not total:
+            continue
+        first = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = np.repeat(lo, counts) + offsets
+        i, j = order[first], order[second]
+        near = haversine(lats[i], lons[i], lats[j], lons[j]) <= radius_m
+        pairs.append(np.stack([np.minimum(i[near], j[near]), np.maximum(i[near], j[near])], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(pairs)
+
+
+def duplicate_of(lats, lons, radius_m):
+    """
+    Para cada punto, el índice del punto conservado del que es duplicado (-1 si se
+    conserva). Los puntos se recorren en orden de índice: un punto a menos de radius_m
+    metros de un punto anterior conservado es duplicado del primero de ellos; si no,
+    se conserva. Cada duplicado queda a menos de radius_m de su punto conservado (las
+    cadenas de puntos cercanos no se unen en un solo grupo).
+    Cada punto se compara solo con los conservados de su celda y las vecinas, y los
+    conservados están a más de radius_m entre sí: unos pocos por celda aunque haya
+    miles de puntos en el mismo lugar, así que el tiempo y la memoria son O(n).
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = len(lats)
+    result = np.full(n, -1, dtype=np.int64)
+    if n < 2:
+        return result
+    cx, cy = _cells(lats, lons, radius_m)
+    phi = np.radians(lats)
+    cos_phi = np.cos(phi).tolist()
+    phi = phi.tolist()
+    lam = np.radians(lons).tolist()
+    # Haversine sin la raíz ni el arcoseno: d <= radius_m  <=>  a <= sin²(radius_m / 2R)
+    a_max = math.sin(radius_m / (2 * EARTH_RADIUS_M)) ** 2
+    sin = math.sin
+    kept = {}
+    for k, (x, y) in enumerate(zip(cx.tolist(), cy.tolist())):
+        best = -1
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                # Cada celda guarda sus conservados en orden de índice
+                for i in kept.get((x + dx, y + dy), ()):
+                    if best != -1 and i > best:
+                        break
+                    a = sin((phi[k] - phi[i]) / 2) ** 2 + cos_phi[k] * cos_phi[i] * sin((lam[k] - lam[i]) / 2) ** 2
+                    if a <= a_max:
+                        best = i
+                        break
+        if best == -1:
+            kept.setdefault((x, y), []).append(k)
+        else:
+            result[k] = best
+    return result
@@ -0,0 +1,313 @@
+"""
+Importación de planta existente (KML/KMZ as-built o CSV con el formato del
+conversor) a un proyecto del survey. Los archivos se leen como flujo: los
+Placemarks del KML salen del árbol apenas se leen y los CSV se leen por bloques.
+"""
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+ELEMENT_PREFIXES = {'Poste': 'P', 'Handhole': 'HH', 'Cierre de Empalme': 'CE', 'Edificio': 'BLD'}
+PREFIX_TYPES = {prefix: element_type for element_type, prefix in ELEMENT_PREFIXES.items()}
+# Nombres generados por el survey: <proyecto>_P001, <proyecto>_HH012...
+NAME_PATTERN = re.compile(r'(?:^|_)(P|HH|CE|BLD)(\d+)$')
+
+# Palabras en folders/nombres que indican el tipo (en este orden)
+TYPE_KEYWORDS = [
+    ('Handhole', re.compile(r'handhole|registro|\bhh', re.IGNORECASE)),
+    ('Cierre de Empalme', re.compile(r'cierre|empalme|splice|closure', re.IGNORECASE)),
+    ('Edificio', re.compile(r'edificio|building|\bbld', re.IGNORECASE)),
+    ('Poste', re.compile(r'poste|pole', re.IGNORECASE)),
+]
+CONNECTION_KEYWORDS = [
+    ('ADSS', re.compile(r'adss', re.IGNORECASE)),
+    ('Ducto', re.compile(r'duct', re.IGNORECASE)),
+    ('Aerial Route', re.compile(r'aerial|a[eé]re', re.IGNORECASE)),
+]
+# Íconos usados por export_to_kml del survey (el pushpin amarillo de los postes
+# es también el ícono por defecto del conversor, así que no indica el tipo)
+ICON_TYPES = {
+    'placemark_square': 'Handhole',
+    'target': 'Cierre de Empalme',
+    'homegardenbusiness': 'Edificio',
+}
+# Contenedores de los Style y StyleMap compartidos (referenciados con styleUrl)
+SHARED_STYLE_PARENTS = {'kml', 'Document', 'Folder'}
+# Distancia máxima (m) entre el extremo de una línea y el elemento al que se conecta
+SNAP_DISTANCE_M = 2.0
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(elem, path):
+    """Hijo directo (o ruta 'Icon/href') de elem, en el mismo namespace que elem"""
+    namespace = elem.tag[:elem.tag.index('}') + 1] if elem.tag.startswith('{') else ''
+    return elem.find('/'.join(namespace + name for name in path.split('/')))
+
+
+def _text(elem, name):
+    child = _child(elem, name)
+    return child.text.strip() if child is not None and child.text else ''
+
+
+def _coordinates(text):
+    coords = []
+    for item in text.split():
+        parts = item.split(',')
+        if len(parts) >= 2:
+            coords.append((float(parts[0]), float(parts[1])))
+    return coords
+
+
+def _style_value(style):
+    """href del ícono o color de la línea de un Style ('' si no tiene ninguno)"""
+    icon = _child(style, 'IconStyle')
+    if icon is not None:
+        return _text(icon, 'Icon/href')
+    line = _child(style, 'LineStyle')
+    return _text(line, 'color') if line is not None else ''
+
+
+def _geometry(placemark):
+    # Point o LineString del Placemark, o el primero dentro de su MultiGeometry
+    for container in (placemark, _child(placemark, 'MultiGeometry')):
+        if container is None:
+            continue
+        for kind, tag in (('point', 'Point'), ('line', 'LineString')):
+            geometry = _child(container, tag)
+            if geometry is not None:
+                return kind, geometry
+    return None, None
+
+
+def iter_kml_placemarks(source):
+    """
+    Placemarks de un archivo KML como diccionarios: name, kind ('point' o 'line'),
+    coords [(lon, lat), ...], style (href del ícono o color de la línea) y folders.
+    Cada Placemark, Folder y Style compartido se quita del árbol una vez leído; los
+    Style dentro de un Placemark o de un StyleMap se leen junto con su contenedor.
+    """
+    styles = {}
+    style_maps = {}
+    folders = []
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = _local(elem.tag)
+        if event == 'start':
+            stack.append(elem)
+            if tag == 'Folder':
+                folders.append('')
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if tag == 'name' and parent is not None and _local(parent.tag) == 'Folder':
+            folders[-1] = (elem.text or '').strip()
+            continue
+        if tag in ('Style', 'StyleMap') and parent is not None and _local(parent.tag) not in SHARED_STYLE_PARENTS:
+            continue
+        if tag == 'Style':
+            styles[elem.get('id')] = _style_value(elem)
+        elif tag == 'StyleMap':
+            for pair in elem:
+                if _text(pair, 'key') == 'normal':
+                    inline = _child(pair, 'Style')
+                    if inline is not None:
+                        styles[elem.get('id')] = _style_value(inline)
+                    else:
+                        style_maps[elem.get('id')] = _text(pair, 'styleUrl').lstrip('#')
+        elif tag == 'Placemark':
+            kind, geometry = _geometry(elem)
+            if geometry is not None:
+                coords = _coordinates(_text(geometry, 'coordinates'))
+                if coords:
+                    inline = _child(elem, 'Style')
+                    if inline is not None:
+                        style = _style_value(inline)
+                    else:
+                        style_id = _text(elem, 'styleUrl').lstrip('#')
+                        style = styles.get(style_maps.get(style_id, style_id), '')
+                    yield {
+                        'name': _text(elem, 'name'),
+                        'kind': kind,
+                        'coords': coords,
+                        'style': style,
+                        'folders': [f for f in folders if f]
+                    }
+        elif tag == 'Folder':
+            folders.pop()
+        else:
+            continue
+        if parent is not None:
+            parent.remove(elem)
+
+
+def iter_csv_placemarks(source, filas_por_bloque=None):
+    """Puntos de un CSV con el formato del conversor (nombre, latitud, longitud, folder), leído por bloques"""
+    import numpy as np
+    import pandas as pd
+    from .conversion import FILAS_POR_BLOQUE, encontrar_columnas, preparar_columnas
+
+    columnas = None
+    for df in pd.read_csv(source, chunksize=filas_por_bloque or FILAS_POR_BLOQUE):
+        if columnas is None:
+            columnas, error = encontrar_columnas(df)
+            if error:
+                raise ValueError(error)
+        datos = preparar_columnas(df, columnas)
+        for i in np.flatnonzero(datos['validas']):
+            folder = datos['folders'][i]
+            yield {
+                'name': datos['nombres'][i],
+                'kind': 'point',
+                'coords': [(float(datos['longitudes'][i]), float(datos['latitudes'][i]))],
+                'style': datos['iconos'][i],
+                'folders': [f for f in folder.split('/') if f] if folder else []
+            }
+
+
+def iter_placemarks(source, filename):
+    """Placemarks de un archivo KML, KMZ o CSV (según la extensión)"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        yield from iter_csv_placemarks(source)
+    elif extension == '.kmz':
+        with zipfile.ZipFile(source) as kmz:
+            kml_files = [n for n in kmz.namelist() if n.lower().endswith('.kml')]
+            if not kml_files:
+                raise ValueError("El KMZ no contiene ningún archivo KML")
+            main = 'doc.kml' if 'doc.kml' in kml_files else kml_files[0]
+            with kmz.open(main) as kml:
+                yield from iter_kml_placemarks(kml)
+    elif extension == '.kml':
+        yield from iter_kml_placemarks(source)
+    else:
+        raise ValueError(f"Formato no soportado: {extension}")
+
+
+def infer_element_type(placemark, default_type):
+    """Tipo de elemento según los nombres de los folders, el patrón de nombres del survey o el ícono"""
+    for folder in reversed(placemark['folders']):
+        for element_type, pattern in TYPE_KEYWORDS:
+            if pattern.search(folder):
+                return element_type
+    match = NAME_PATTERN.search(placemark['name'])
+    if match:
+        return PREFIX_TYPES[match.group(1)]
+    for element_type, pattern in TYPE_KEYWORDS:
+        if pattern.search(placemark['name']):
+            return element_type
+    style = placemark['style']
+    for icon, element_type in ICON_TYPES.items():
+        if icon in style:
+            return element_type
+    return default_type
+
+
+def infer_construction_type(placemark, line_styles):
+    """Tipo de construcción según el color de la línea, los folders o el nombre (None si no se reconoce)"""
+    if placemark['style'].lower() in line_styles:
+        return line_styles[placemark['style'].lower()]
+    for text in list(reversed(placemark['folders'])) + [placemark['name']]:
+        for construction_type, pattern in CONNECTION_KEYWORDS:
+            if pattern.search(text):
+                return construction_type
+    return None
+
+
+def line_length(coords):
+    import numpy as np
+    from .geo import haversine
+
+    lons, lats = np.array(coords, dtype=float).T
+    return float(np.sum(haversine(lats[:-1], lons[:-1], lats[1:], lons[1:])))
+
+
+def update_counters(counters, names):
+    """Sube el contador de cada prefijo al mayor número usado en los nombres; devuelve los prefijos que cambiaron"""
+    changed = {}
+    for name in names:
+        match = NAME_PATTERN.search(name)
+        if match:
+            prefix, number = match.group(1), int(match.group(2))
+            if number > counters.get(prefix, 0):
+                counters[prefix] = number
+                changed[prefix] = number
+    return changed
+
+
+def import_plant(source, filename, store, default_type='Poste', next_name=None, line_styles=None,
+                 suggest_type=None, snap_m=SNAP_DISTANCE_M):
+    """
+    Agrega los puntos del archivo como elementos y sus líneas como conexiones entre
+    los elementos de ambos extremos (por nombre 'A - B' o a menos de snap_m metros).
+    Devuelve un diccionario de resumen con los conteos.
+    """
+    from .geo import GridIndex
+
+    line_styles = {color.lower(): construction_type for color, construction_type in (line_styles or {}).items()}
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    elements = []
+    names = set()
+    lines = []
+    skipped = 0
+    for placemark in iter_placemarks(source, filename):
+        if placemark['kind'] == 'line':
+            if len(placemark['coords']) >= 2:
+                lines.append((placemark['name'], placemark['coords'][0], placemark['coords'][-1],
+                              line_length(placemark['coords']), infer_construction_type(placemark, line_styles)))
+            continue
+        element_type = infer_element_type(placemark, default_type)
+        name = placemark['name'] or (next_name(element_type) if next_name else '')
+        if not name or name in store or name in names:
+            skipped += 1
+            continue
+        lon, lat = placemark['coords'][0]
+        names.add(name)
+        elements.append({'type': element_type, 'name': name, 'lat': lat, 'lon': lon, 'timestamp': timestamp})
+    store.add_elements(elements)
+
+    connections = []
+    unmatched = 0
+    if lines and store.elements:
+        index = GridIndex([e['lat'] for e in store.elements], [e['lon'] for e in store.elements])
+
+        def endpoint(lon, lat):
+            found, meters = index.nearest(lat, lon, k=1, max_distance=snap_m)
+            if len(found) and meters[0] <= snap_m:
+                return store.elements[int(found[0])]
+            return None
+
+        for name, start, end, length, construction_type in lines:
+            ends = name.split(' - ')
+            if len(ends) == 2 and ends[0] in store and ends[1] in store:
+                elem_a, elem_b = store.get(ends[0]), store.get(ends[1])
+            else:
+                elem_a, elem_b = endpoint(*start), endpoint(*end)
+            if elem_a is None or elem_b is None or elem_a is elem_b:
+                unmatched += 1
+                continue
+            if construction_type is None:
+                construction_type = suggest_type(elem_a['type'], elem_b['type']) if suggest_type else 'Aerial Route'
+            connections.append({
+                'element_a': elem_a['name'],
+                'element_b': elem_b['name'],
+                'construction_type': construction_type,
+                'infraestructura': 'Existente',
+                'distance': length
+            })
+        store.add_connections(connections)
+    else:
+        unmatched = len(lines)
+
+    return {
+        'elements': len(elements),
+        'connections': len(connections),
+        'skipped': skipped,
+        'unmatched_lines': unmatched,
+        'names': [e['name'] for e in elements]
+    }
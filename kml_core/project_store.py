@@ -0,0 +1,203 @@
+class ProjectStore:
+    """
+    Elementos y conexiones de un proyecto del survey con un índice por nombre y un
+    índice de adyacencia (nombre del elemento -> sus conexiones), que se mantienen
+    al agregar, editar, renombrar y borrar para que las búsquedas no recorran todo
+    el proyecto. 'revision' aumenta con cada cambio para poder cachear datos
+    derivados contra ella; 'type_revisions' y 'connections_revision' hacen lo mismo
+    por tipo de elemento y solo para las conexiones.
+    Un listener opcional (p. ej. project_db.ProjectWriter) recibe cada cambio.
+    """
+
+    def __init__(self, elements=None, connections=None):
+        self.elements = []
+        self.connections = []
+        self.revision = 0
+        self.type_revisions = {}
+        self.connections_revision = 0
+        self.listener = None
+        self._by_name = {}
+        self._adjacency = {}
+        for elem in elements or []:
+            self.add_element(elem)
+        for conn in connections or []:
+            self.add_connection(conn)
+
+    # Elementos
+    def __len__(self):
+        return len(self.elements)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def names(self):
+        return [e['name'] for e in self.elements]
+
+    def by_type(self, element_type):
+        return [e for e in self.elements if e['type'] == element_type]
+
+    def type_revision(self, element_type):
+        return self.type_revisions.get(element_type, 0)
+
+    def add_element(self, elem):
+        if elem['name'] in self._by_name:
+            raise ValueError(f"Element already exists: {elem['name']}")
+        self.elements.append(elem)
+        self._by_name[elem['name']] = elem
+        self._adjacency.setdefault(elem['name'], [])
+        self._changed(elem['type'])
+        self._notify('element_added', elem)
+        return elem
+
+    def add_elements(self, elems):
+        """Agrega muchos elementos (p. ej. una importación) con una sola notificación"""
+        elems = list(elems)
+        names = set()
+        for elem in elems:
+            if elem['name'] in self._by_name or elem['name'] in names:
+                raise ValueError(f"Element already exists: {elem['name']}")
+            names.add(elem['name'])
+        for elem in elems:
+            self.elements.append(elem)
+            self._by_name[elem['name']] = elem
+            self._adjacency.setdefault(elem['name'], [])
+        for element_type in {elem['type'] for elem in elems}:
+            self._changed(element_type)
+        self._notify('elements_added', elems)
+        return elems
+
+    def update_element(self, name, changes):
+        """Aplica cambios de columnas a un elemento; un 'name' distinto se trata como renombre"""
+        elem = self._by_name[name]
+        old_type = elem['type']
+        new_name = changes.get('name', name)
+        if new_name != name:
+            self.rename_element(name, new_name)
+        for key, value in changes.items():
+            if key != 'name':
+                elem[key] = value
+        if elem['type'] != old_type:
+            self._changed(old_type)
+        self._changed(elem['type'])
+        self._notify('element_updated', elem)
+        return elem
+
+    def rename_element(self, old_name, new_name):
+        if new_name == old_name:
+            return
+        if new_name in self._by_name:
+            raise ValueError(f"Element already exists: {new_name}")
+        elem = self._by_name.pop(old_name)
+        elem['name'] = new_name
+        self._by_name[new_name] = elem
+        conns = self._adjacency.pop(old_name, [])
+        for conn in conns:
+            if conn['element_a'] == old_name:
+                conn['element_a'] = new_name
+            if conn['element_b'] == old_name:
+                conn['element_b'] = new_name
+        self._adjacency[new_name] = conns
+        self._changed(elem['type'], connections=bool(conns))
+        self._notify('element_renamed', old_name, new_name)
+
+    def delete_element(self, name):
+        """Quita un elemento y todas las conexiones que lo usan"""
+        elem = self._by_name.pop(name, None)
+        if elem is None:
+            return None
+        self.elements = [e for e in self.elements if e is not elem]
+        removed = self._adjacency.pop(name, [])
+        if removed:
+            removed_ids = {id(c) for c in removed}
+            self.connections = [c for c in self.connections if id(c) not in removed_ids]
+            for conn in removed:
+                other = conn['element_b'] if conn['element_a'] == name else conn['element_a']
+                if other in self._adjacency:
+                    self._adjacency[other] = [c for c in self._adjacency[other] if c is not conn]
+        self._changed(elem['type'], connections=bool(removed))
+        self._notify('element_deleted', name)
+        return elem
+
+    # Conexiones
+    def add_connection(self, conn):
+        self.connections.append(conn)
+        self._link(conn)
+        self._changed(connections=True)
+        self._notify('connection_added', conn)
+        return conn
+
+    def add_connections(self, conns):
+        conns = list(conns)
+        self.connections.extend(conns)
+        for conn in conns:
+            self._link(conn)
+        self._changed(connections=True)
+        self._notify('connections_added', conns)
+        return conns
+
+    def update_connection(self, conn, changes):
+        """Aplica cambios de columnas a una conexión y la vuelve a indexar si cambian sus extremos"""
+        ends_changed = any(key in changes for key in ('element_a', 'element_b'))
+        if ends_changed:
+            self._unlink(conn)
+        conn.update(changes)
+        if ends_changed:
+            self._link(conn)
+        self._changed(connections=True)
+        self._notify('connection_updated', conn)
+        return conn
+
+    def delete_connection(self, conn):
+        self.connections = [c for c in self.connections if c is not conn]
+        self._unlink(conn)
+        self._changed(connections=True)
+        self._notify('connection_deleted', conn)
+
+    def _link(self, conn):
+        self._adjacency.setdefault(conn['element_a'], []).append(conn)
+        if conn['element_b'] != conn['element_a']:
+            self._adjacency.setdefault(conn['element_b'], []).append(conn)
+
+    def _unlink(self, conn):
+        for name in (conn['element_a'], conn['element_b']):
+            if name in self._adjacency:
+                self._adjacency[name] = [c for c in self._adjacency[name] if c is not conn]
+
+    def set_connections(self, connections):
+        """Reemplaza todas las conexiones (p. ej. después de 'Reconectar Todo')"""
+        self.connections = list(connections)
+        self._adjacency = {name: [] for name in self._by_name}
+        for conn in self.connections:
+            self._link(conn)
+        self._changed(connections=True)
+        self._notify('connections_replaced', self.connections)
+
+    def clear_connections(self):
+        self.set_connections([])
+
+    def connections_of(self, name):
+        return list(self._adjacency.get(name, []))
+
+    def endpoints(self, conn):
+        """Elementos de ambos extremos de una conexión (None en el extremo que falta)"""
+        return self._by_name.get(conn['element_a']), self._by_name.get(conn['element_b'])
+
+    def snapshot(self):
+        """Copia de los elementos y conexiones (p. ej. para exportar desde otro hilo)"""
+        copy = ProjectStore([dict(e) for e in self.elements], [dict(c) for c in self.connections])
+        copy.revision = self.revision
+        return copy
+
+    def _changed(self, element_type=None, connections=False):
+        self.revision += 1
+        if element_type is not None:
+            self.type_revisions[element_type] = self.type_revisions.get(element_type, 0) + 1
+        if connections:
+            self.connections_revision += 1
+
+    def _notify(self, event, *args):
+        if self.listener is not None:
+            getattr(self.listener, event)(*args)
@@ -0,0 +1,155 @@
+"""
+Exportaciones KML y KMZ de un proyecto del survey. Nada aquí usa st.session_state,
+así que las exportaciones pueden correr en un hilo aparte sobre una copia del proyecto.
+simplekml y pandas solo se importan al generar una exportación.
+Las descripciones se llenan con una plantilla compilada una vez por combinación de
+atributos; su estilo es el CSS compartido del BalloonStyle de cada estilo.
+"""
+from io import BytesIO
+import base64
+import html
+import math
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+# Colores KML (aabbggrr) de simplekml.Color
+YELLOW = 'ff00ffff'
+GREEN = 'ff008000'
+ORANGE = 'ff00a5ff'
+BLUE = 'ffff0000'
+RED = 'ff0000ff'
+
+# Estilos KML compartidos: (color, escala, ícono) por tipo de elemento y (color, grosor) por tipo de construcción
+KML_ELEMENT_STYLES = {
+    'Poste': (YELLOW, 2.0, 'http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png'),
+    'Handhole': (YELLOW, 1.0, 'http://maps.google.com/mapfiles/kml/shapes/placemark_square.png'),
+    'Cierre de Empalme': (GREEN, 1.0, 'http://maps.google.com/mapfiles/kml/shapes/target.png'),
+    'Edificio': (ORANGE, 1.0, 'http://maps.google.com/mapfiles/kml/shapes/homegardenbusiness.png')
+}
+KML_CONNECTION_STYLES = {
+    'Ducto': (BLUE, 4),
+    'Aerial Route': (GREEN, 4),
+    'ADSS': (RED, 4)
+}
+
+# CSS de las descripciones (una vez por estilo en el BalloonStyle, no en cada Placemark)
+KML_DESCRIPTION_CSS = (
+    ".ss{font-family:Arial;font-size:20px;max-width:800px}"
+    ".ss h1{color:#2c3e50;margin-bottom:15px;font-size:28px}"
+    ".ss h2{color:#2c3e50;font-size:26px}"
+    ".ss img{max-width:600px;max-height:500px;margin:15px 0;border-radius:8px;box-shadow:0 4px 6px rgba(0,0,0,0.1)}"
+    ".ss table{border-collapse:collapse;width:100%;margin-top:15px}"
+    ".ss tr{border-bottom:2px solid #ddd}"
+    ".ss td{padding:12px;font-size:18px}"
+    ".ss td.k{font-weight:bold;background-color:#f2f2f2;width:40%}"
+    ".ss p{margin-top:20px;color:#7f8c8d;font-size:16px}"
+)
+KML_BALLOON = f"<style>{KML_DESCRIPTION_CSS}</style>$[description]"
+
+# Atributos que no van en la tabla de la descripción
+DESCRIPTION_SKIPPED_KEYS = ('lat', 'lon', 'name', 'type', 'photo', 'photo_ref')
+
+CONNECTION_TEMPLATE = (
+    "<div class='ss'><h2>Conexión</h2><table>"
+    "<tr><td class='k'>Tipo:</td><td>{}</td></tr>"
+    "<tr><td class='k'>Infraestructura:</td><td>{}</td></tr>"
+    "<tr><td class='k'>Distancia:</td><td>{}</td></tr>"
+    "</table></div>"
+)
+
+
+def format_distance(distance):
+    # Conexiones importadas o editadas pueden no tener distancia (None o NaN)
+    if distance is None or math.isnan(distance):
+        return 'N/D'
+    return f"{distance:.2f} metros"
+
+
+def element_template(keys):
+    """
+    Plantilla (format) de la descripción de los elementos con estos atributos:
+    tipo, foto (ya como <img> o ''), un valor por atributo y luego lat y lon
+    """
+    # Las llaves de los nombres se duplican para que format no las tome como campos
+    labels = [html.escape(str(key)).replace('{', '{{').replace('}', '}}') for key in keys]
+    rows = "".join(f"<tr><td class='k'>{label}:</td><td>{{}}</td></tr>" for label in labels)
+    return ("<div class='ss'><h1>{}</h1>{}<table>" + rows +
+            "</table><p><strong>Coordenadas:</strong><br/>Lat: {:.6f}<br/>Lon: {:.6f}</p></div>")
+
+
+def inline_photo_src(elem, photos):
+    # Miniatura embebida en base64 (o la foto en base64 de sesiones anteriores)
+    if elem.get('photo_ref') in photos:
+        data, mime = photos.get_thumbnail(elem['photo_ref'])
+        return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+    if elem.get('photo'):
+        return f"data:image/jpeg;base64,{elem['photo']}"
+    return None
+
+
+def export_to_kml(store, photos, photo_src=None, progress=None):
+    import simplekml
+    from .estilos import RegistroEstilos
+
+    if photo_src is None:
+        photo_src = lambda elem: inline_photo_src(elem, photos)
+    kml = simplekml.Kml()
+    styles = RegistroEstilos(globo=KML_BALLOON)
+    templates = {}
+    total = len(store.elements) + len(store.connections)
+    for i, elem in enumerate(store.elements):
+        if progress and i % 500 == 0:
+            progress(i / total)
+        pnt = kml.newpoint(name=elem['name'], coords=[(elem['lon'], elem['lat'])])
+        if elem['type'] in KML_ELEMENT_STYLES:
+            color, scale, href = KML_ELEMENT_STYLES[elem['type']]
+            styles.aplicar_icono(pnt, href, color, scale, escala_resaltado=scale * 1.3)
+        
+        keys = tuple(key for key in elem if key not in DESCRIPTION_SKIPPED_KEYS)
+        template = templates.get(keys)
+        if template is None:
+            template = templates[keys] = element_template(keys)
+        src = photo_src(elem)
+        pnt.description = template.format(html.escape(str(elem['type'])), f'<img src="{src}"/><br/>' if src else '',
+                                          *(html.escape(str(elem[key])) for key in keys), elem['lat'], elem['lon'])
+    
+    for i, conn in enumerate(store.connections, len(store.elements)):
+        if progress and i % 500 == 0:
+            progress(i / total)
+        elem_a, elem_b = store.endpoints(conn)
+        if elem_a and elem_b:
+            line = kml.newlinestring(name=f"{conn['element_a']} - {conn['element_b']}")
+            line.coords = [(elem_a['lon'], elem_a['lat']), (elem_b['lon'], elem_b['lat'])]
+            if conn['construction_type'] in KML_CONNECTION_STYLES:
+                color, width = KML_CONNECTION_STYLES[conn['construction_type']]
+                styles.aplicar_linea(line, color, width, ancho_resaltado=width + 2)
+            line.description = CONNECTION_TEMPLATE.format(html.escape(str(conn['construction_type'])),
+                                                          html.escape(str(conn.get('infraestructura', 'N/A'))),
+                                                          format_distance(conn.get('distance')))
+    return kml.kml()
+
+
+def export_to_kmz(store, photos, progress=None):
+    # KMZ con las fotos como archivos en files/ referenciados desde las descripciones
+    refs = {e['photo_ref'] for e in store.elements if e.get('photo_ref') in photos}
+    kml_progress = (lambda fraction: progress(fraction * 0.8)) if progress else None
+    kml_content = export_to_kml(store, photos, lambda elem: f"files/{elem['photo_ref']}" if elem.get('photo_ref') in refs else inline_photo_src(elem, photos), kml_progress)
+    buffer = BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as kmz:
+        kmz.writestr('doc.kml', kml_content)
+        for i, ref in enumerate(sorted(refs)):
+            if progress:
+                progress(0.8 + 0.2 * i / len(refs))
+            kmz.write(photos.path(ref), f"files/{ref}", compress_type=ZIP_STORED)
+    return buffer.getvalue()
+
+
+def build_export(kind, store, photos, progress=None):
+    import pandas as pd
+
+    if kind == 'elements_csv':
+        return pd.DataFrame(store.elements).to_csv(index=False)
+    if kind == 'connections_csv':
+        return pd.DataFrame(store.connections).to_csv(index=False)
+    if kind == 'kml':
+        return export_to_kml(store, photos, progress=progress)
+    return export_to_kmz(store, photos, progress)
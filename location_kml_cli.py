@@ -0,0 +1,249 @@
+"""
+Conversión CSV a KML/KMZ por lotes, sin Streamlit.
+
+Ejemplos:
+    python location_kml_cli.py regiones/ -o salida/ -j 8 --resumen resumen.json
+    python location_kml_cli.py "datos/*.csv" --kmz
+    python location_kml_cli.py enorme.csv --teselas
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Códigos de salida
+SALIDA_OK = 0
+SALIDA_CON_FALLOS = 1
+SALIDA_SIN_ARCHIVOS = 2
+# Dos entradas que irían al mismo archivo de salida
+SALIDA_SALIDAS_REPETIDAS = 3
+
+
+class SalidasRepetidas(ValueError):
+    """Dos o más entradas irían al mismo archivo de salida; repetidas es {salida: [entradas]}"""
+
+    def __init__(self, repetidas):
+        self.repetidas = repetidas
+        salida, entradas = next(iter(repetidas.items()))
+        super().__init__(f"{len(repetidas)} archivos de salida repetidos, p. ej. {salida}: {', '.join(entradas)}")
+
+
+def expandir_entradas(entradas, patron='*.csv', recursivo=False):
+    """
+    Expande archivos, directorios y globs a una lista ordenada de CSV sin duplicados
+    """
+    archivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            if recursivo:
+                encontrados = glob.glob(os.path.join(entrada, '**', patron), recursive=True)
+            else:
+                encontrados = glob.glob(os.path.join(entrada, patron))
+        elif os.path.isfile(entrada):
+            encontrados = [entrada]
+        else:
+            encontrados = glob.glob(entrada, recursive=recursivo)
+        archivos.extend(sorted(encontrados))
+
+    vistos = set()
+    unicos = []
+    for archivo in archivos:
+        ruta = os.path.abspath(archivo)
+        if ruta not in vistos and os.path.isfile(ruta):
+            vistos.add(ruta)
+            unicos.append(archivo)
+    return unicos
+
+
+def ruta_de_salida(archivo_csv, directorio_salida, kmz, raiz=None):
+    """
+    Calcula el archivo de salida para un CSV (junto al CSV si no hay directorio de salida).
+    Con raiz, la ruta del CSV relativa a raiz se repite dentro del directorio de salida
+    (norte/postes.csv y sur/postes.csv no van al mismo archivo)
+    """
+    base = os.path.splitext(os.path.basename(archivo_csv))[0]
+    extension = 'kmz' if kmz else 'kml'
+    carpeta = os.path.dirname(os.path.abspath(archivo_csv))
+    if not directorio_salida:
+        directorio = carpeta
+    elif raiz:
+        directorio = os.path.normpath(os.path.join(directorio_salida, os.path.relpath(carpeta, raiz)))
+    else:
+        directorio = directorio_salida
+    return os.path.join(directorio, f"{base}_mapa.{extension}")
+
+
+def salidas_repetidas(trabajos):
+    """Lanza SalidasRepetidas si algún archivo de salida corresponde a más de una entrada"""
+    por_salida = {}
+    for archivo, salida in trabajos:
+        por_salida.setdefault(os.path.normcase(os.path.abspath(salida)), []).append(archivo)
+    repetidas = {salida: archivos for salida, archivos in por_salida.items() if len(archivos) > 1}
+    if repetidas:
+        raise SalidasRepetidas(repetidas)
+
+
+def convertir_archivo(archivo_csv, archivo_salida, kmz=False, streaming=False, teselas=False,
+                      radio_duplicados=None, fusionar_duplicados=False, workers_descripciones=None):
+    """
+    Convierte un CSV y devuelve un resumen serializable a JSON.
+    Se ejecuta dentro de los procesos del pool (ahí con workers_descripciones=1:
+    los archivos ya se reparten entre procesos). Con un solo archivo, los -j
+    procesos renderizan sus descripciones.
+    """
+    # Import dentro del proceso hijo: pandas/simplekml solo se cargan donde se usan
+    from kml_core.conversion import ReporteValidacion, convertir_csv
+
+    resumen = {
+        'archivo': archivo_csv,
+        'salida': archivo_salida,
+        'filas': 0,
+        'puntos': 0,
+        'errores': 0,
+        'segundos': 0.0,
+        'bytes': 0,
+        'motivos': {},
+        'error': None
+    }
+    reporte = ReporteValidacion()
+    inicio = time.perf_counter()
+    try:
+        puntos, errores, error = convertir_csv(archivo_csv, archivo_salida, kmz=kmz, streaming=streaming, teselas=teselas, reporte=reporte,
+                                               radio_duplicados=radio_duplicados, fusionar_duplicados=fusionar_duplicados,
+                                               workers=workers_descripciones)
+        resumen['puntos'] = puntos
+        resumen['errores'] = errores
+        resumen['filas'] = puntos + errores
+        resumen['motivos'] = reporte.conteos()
+        resumen['error'] = error
+        if error is None and os.path.exists(archivo_salida):
+            resumen['bytes'] = os.path.getsize(archivo_salida)
+    except Exception as e:
+        resumen['error'] = f"{type(e).__name__}: {e}"
+    resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+
+def convertir_lote(archivos, directorio_salida=None, workers=None, kmz=False, streaming=False, teselas=False,
+                   radio_duplicados=None, fusionar_duplicados=False):
+    """
+    Convierte varios CSV en paralelo y devuelve la lista de resúmenes en el orden de entrada.
+    Con directorio de salida se conservan las subcarpetas de las entradas (relativas a su carpeta común).
+    SalidasRepetidas si dos entradas irían al mismo archivo de salida.
+    """
+    raiz = None
+    if directorio_salida and archivos:
+        raiz = os.path.commonpath([os.path.dirname(os.path.abspath(archivo)) for archivo in archivos])
+    trabajos = [(archivo, ruta_de_salida(archivo, directorio_salida, kmz or teselas, raiz)) for archivo in archivos]
+    salidas_repetidas(trabajos)
+    for carpeta in sorted({os.path.dirname(salida) for _, salida in trabajos}):
+        os.makedirs(carpeta, exist_ok=True)
+    resultados = [None] * len(trabajos)
+
+    if workers == 1 or len(trabajos) <= 1:
+        for i, (archivo, salida) in enumerate(trabajos):
+            resultados[i] = convertir_archivo(archivo, salida, kmz, streaming, teselas, radio_duplicados, fusionar_duplicados,
+                                              workers or 1)
+            _registrar(resultados[i])
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {
+            pool.submit(convertir_archivo, archivo, salida, kmz, streaming, teselas, radio_duplicados, fusionar_duplicados, 1): i
+            for i, (archivo, salida) in enumerate(trabajos)
+        }
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+            except Exception as e:
+                # El proceso hijo murió (p. ej. sin memoria)
+                archivo, salida = trabajos[i]
+                resultados[i] = {
+                    'archivo': archivo, 'salida': salida, 'filas': 0, 'puntos': 0, 'errores': 0,
+                    'segundos': 0.0, 'bytes': 0, 'motivos': {}, 'error': f"{type(e).__name__}: {e}"
+                }
+            _registrar(resultados[i])
+    return resultados
+
+
+def _registrar(resumen):
+    if resumen['error']:
+        logging.error("%s: %s", resumen['archivo'], resumen['error'])
+    else:
+        logging.info("%s: %d puntos, %d errores, %.2f s, %d bytes",
+                     resumen['archivo'], resumen['puntos'], resumen['errores'],
+                     resumen['segundos'], resumen['bytes'])
+
+
+def totales(resultados):
+    """Suma los resúmenes por archivo"""
+    return {
+        'archivos': len(resultados),
+        'fallidos': sum(1 for r in resultados if r['error']),
+        'filas': sum(r['filas'] for r in resultados),
+        'puntos': sum(r['puntos'] for r in resultados),
+        'errores': sum(r['errores'] for r in resultados),
+        'segundos': round(sum(r['segundos'] for r in resultados), 3),
+        'bytes': sum(r['bytes'] for r in resultados)
+    }
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Convierte archivos CSV a KML/KMZ por lotes")
+    parser.add_argument('entradas', nargs='+', help="Archivos CSV, directorios o patrones glob")
+    parser.add_argument('-o', '--salida', help="Directorio de salida; conserva las subcarpetas de las entradas (por defecto, junto a cada CSV)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="Procesos en paralelo")
+    parser.add_argument('--patron', default='*.csv', help="Patrón para buscar dentro de directorios")
+    parser.add_argument('-r', '--recursivo', action='store_true', help="Buscar en subdirectorios")
+    parser.add_argument('--streaming', action='store_true', help="Leer los CSV por bloques (memoria acotada)")
+    parser.add_argument('--kmz', action='store_true', help="Generar KMZ comprimido (implica --streaming)")
+    parser.add_argument('--teselas', action='store_true', help="KMZ de teselas con Region/Lod para archivos enormes (implica --kmz)")
+    parser.add_argument('--duplicados', type=float, metavar='METROS', help="Avisar puntos a menos de METROS de otro punto "
+                        "(guarda nombre y coordenadas de todas las filas: la memoria crece con el archivo, unos 300 bytes por fila, también con --streaming)")
+    parser.add_argument('--fusionar-duplicados', action='store_true', help="Omitir los duplicados en lugar de solo avisarlos")
+    parser.add_argument('--resumen', help="Archivo JSON para el resumen (por defecto, salida estándar)")
+    parser.add_argument('--estricto', action='store_true', help="Terminar con error si alguna fila fue rechazada")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="Más detalle en el log")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING - 10 * min(args.verbose, 2),
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    archivos = expandir_entradas(args.entradas, args.patron, args.recursivo)
+    if not archivos:
+        logging.error("No se encontraron archivos CSV en: %s", ", ".join(args.entradas))
+        return SALIDA_SIN_ARCHIVOS
+
+    try:
+        resultados = convertir_lote(archivos, args.salida, max(1, args.workers or 1), args.kmz, args.streaming, args.teselas,
+                                    args.duplicados, args.fusionar_duplicados)
+    except SalidasRepetidas as e:
+        logging.error("%s", e)
+        return SALIDA_SALIDAS_REPETIDAS
+    resumen = {'archivos': resultados, 'total': totales(resultados)}
+
+    texto = json.dumps(resumen, ensure_ascii=False, indent=2)
+    if args.resumen:
+        with open(args.resumen, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+    total = resumen['total']
+    if total['fallidos'] or (args.estricto and total['errores']):
+        return SALIDA_CON_FALLOS
+    return SALIDA_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import html
+
+import folium
+from folium.plugins import FastMarkerCluster
+
+from tile_proxy import TILE_SOURCES
+
+# Colores de las conexiones en el mapa por tipo de construcción
+CONNECTION_COLORS = {'Ducto': 'blue', 'Aerial Route': 'red'}
+DEFAULT_CONNECTION_COLOR = 'green'
+# Color e ícono del marcador por tipo de elemento
+ELEMENT_STYLES = {
+    'Poste': {'color': 'red', 'icon': 'plug'},
+    'Handhole': {'color': 'blue', 'icon': 'square'},
+    'Cierre de Empalme': {'color': 'green', 'icon': 'link'},
+    'Edificio': {'color': 'orange', 'icon': 'building'}
+}
+DEFAULT_ELEMENT_STYLE = {'color': 'gray', 'icon': 'circle'}
+
+# Marcador por fila [lat, lon, nombre, tipo, color] creado en el navegador
+CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 7, color: 'white', weight: 1, fillColor: row[4], fillOpacity: 0.9
+    });
+    marker.bindTooltip(row[2]);
+    marker.bindPopup('<b>' + row[2] + '</b><br>' + row[3]);
+    return marker;
+}
+"""
+
+
+def add_tile_layer(m, layer, tile_url=None):
+    """Capa base del mapa; tile_url es la URL del proxy local (None = directo del servidor de origen)"""
+    source = TILE_SOURCES.get(layer, TILE_SOURCES['hybrid'])
+    folium.TileLayer(tiles=tile_url or source['url'], attr=source['attr'], name=source['name']).add_to(m)
+
+
+def get_element_style(element_type):
+    return ELEMENT_STYLES.get(element_type, DEFAULT_ELEMENT_STYLE)
+
+
+def element_rows(elements, element_style):
+    """Filas compactas [lat, lon, nombre, tipo, color] para el cluster de marcadores"""
+    return [
+        [elem['lat'], elem['lon'], html.escape(str(elem['name'])), html.escape(str(elem['type'])), element_style(elem['type'])['color']]
+        for elem in elements
+    ]
+
+
+def connection_layers(store):
+    """
+    Un GeoJSON MultiLineString por tipo de construcción con todas sus conexiones
+    """
+    lines = {}
+    for conn in store.connections:
+        elem_a, elem_b = store.endpoints(conn)
+        if elem_a and elem_b:
+            lines.setdefault(conn['construction_type'], []).append(
+                ([[elem_a['lon'], elem_a['lat']], [elem_b['lon'], elem_b['lat']]], conn.get('distance') or 0)
+            )
+    return {
+        construction_type: {
+            'type': 'Feature',
+            'geometry': {'type': 'MultiLineString', 'coordinates': [coords for coords, _ in items]},
+            'properties': {
+                'construction_type': construction_type,
+                'count': len(items),
+                'distance': round(sum(distance for _, distance in items), 2)
+            }
+        }
+        for construction_type, items in lines.items()
+    }
+
+
+class LayerCache:
+    """
+    Datos de capas del mapa calculados una vez por revisión del proyecto.
+    Una capa se recalcula solo cuando la revisión cambia.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, key, revision, builder):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != revision:
+            entry = (revision, builder())
+            self._entries[key] = entry
+        return entry[1]
+
+
+def pad_bounds(bounds, margin=0.25):
+    """Amplía los límites del mapa (bounds de st_folium) un porcentaje por lado"""
+    south, west = bounds['_southWest']['lat'], bounds['_southWest']['lng']
+    north, east = bounds['_northEast']['lat'], bounds['_northEast']['lng']
+    d_lat = (north - south) * margin
+    d_lon = (east - west) * margin
+    return south - d_lat, west - d_lon, north + d_lat, east + d_lon
+
+
+def in_bounds(lat, lon, box):
+    south, west, north, east = box
+    return south <= lat <= north and west <= lon <= east
+
+
+def add_clustered_elements(m, rows, box=None):
+    if box is not None:
+        rows = [row for row in rows if in_bounds(row[0], row[1], box)]
+    if rows:
+        FastMarkerCluster(rows, callback=CLUSTER_CALLBACK, name='Elementos', options={'disableClusteringAtZoom': 19}).add_to(m)
+    return len(rows)
+
+
+def add_connection_layers(m, layers, box=None):
+    for construction_type, feature in layers.items():
+        if box is not None:
+            lines = [line for line in feature['geometry']['coordinates']
+                     if in_bounds(line[0][1], line[0][0], box) or in_bounds(line[1][1], line[1][0], box)]
+            if not lines:
+                continue
+            feature = dict(feature, geometry={'type': 'MultiLineString', 'coordinates': lines})
+        color = CONNECTION_COLORS.get(construction_type, DEFAULT_CONNECTION_COLOR)
+        folium.GeoJson(
+            feature,
+            name=construction_type,
+            style_function=lambda _, color=color: {'color': color, 'weight': 3, 'opacity': 0.7},
+            tooltip=folium.GeoJsonTooltip(fields=['construction_type', 'count', 'distance'], aliases=['Tipo', 'Conexiones', 'Distancia (m)'])
+        ).add_to(m)
+
+
+def add_element_markers(m, elements):
+    """Un folium.Marker por elemento (modo clásico, para proyectos chicos)"""
+    for elem in elements:
+        style = get_element_style(elem['type'])
+        folium.Marker([elem['lat'], elem['lon']], popup=f"<b>{elem['name']}</b><br>{elem['type']}", tooltip=elem['name'], icon=folium.Icon(color=style['color'], icon=style['icon'])).add_to(m)
+
+
+def add_connection_lines(m, store):
+    """Una folium.PolyLine por conexión (modo clásico)"""
+    for conn in store.connections:
+        elem_a, elem_b = store.endpoints(conn)
+        if elem_a and elem_b:
+            color = CONNECTION_COLORS.get(conn['construction_type'], DEFAULT_CONNECTION_COLOR)
+            folium.PolyLine([[elem_a['lat'], elem_a['lon']], [elem_b['lat'], elem_b['lon']]], color=color, weight=3, opacity=0.7, popup=f"{conn['construction_type']}<br>{conn.get('distance') or 0:.2f} m").add_to(m)
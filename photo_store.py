@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it thumbnails are the original image
+    Image = None
+
+DEFAULT_PHOTO_DIR = os.path.join(os.path.expanduser('~'), '.site_survey', 'photos')
+THUMBNAIL_SIZE = (640, 640)
+
+
+def detect_extension(data):
+    """Extensión del archivo según los primeros bytes de la imagen (jpg si no se reconoce)"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'jpg'
+
+
+def mime_type(ref):
+    return {'png': 'image/png', 'webp': 'image/webp'}.get(ref.rsplit('.', 1)[-1], 'image/jpeg')
+
+
+class PhotoStore:
+    """
+    Almacén de fotos en disco direccionado por contenido. Cada foto se guarda una
+    sola vez con su hash SHA-256 y los elementos guardan solo la referencia
+    ('<hash>.<ext>'). Las miniaturas se generan en un hilo aparte, fuera de la petición.
+    """
+
+    def __init__(self, root=None, thumbnail_size=THUMBNAIL_SIZE, workers=1):
+        self.root = root or os.environ.get('SURVEY_PHOTO_DIR', DEFAULT_PHOTO_DIR)
+        self.thumbnail_size = thumbnail_size
+        os.makedirs(os.path.join(self.root, 'thumbs'), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._pending = set()
+
+    def path(self, ref):
+        return os.path.join(self.root, ref[:2], ref)
+
+    def thumbnail_path(self, ref):
+        return os.path.join(self.root, 'thumbs', ref.rsplit('.', 1)[0] + '.jpg')
+
+    def __contains__(self, ref):
+        return bool(ref) and os.path.exists(self.path(ref))
+
+    def put(self, data):
+        """Guarda los bytes de la foto (sin duplicados, por hash) y devuelve su referencia"""
+        ref = f"{hashlib.sha256(data).hexdigest()}.{detect_extension(data)}"
+        destination = self.path(ref)
+        if not os.path.exists(destination):
+            self._write_atomic(destination, data)
+            future = self._executor.submit(self._make_thumbnail, ref)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+        return ref
+
+    def get(self, ref):
+        with open(self.path(ref), 'rb') as f:
+            return f.read()
+
+    def get_thumbnail(self, ref):
+        """Bytes de la miniatura si ya se generó, si no los de la foto original"""
+        thumb = self.thumbnail_path(ref)
+        if os.path.exists(thumb):
+            with open(thumb, 'rb') as f:
+                return f.read(), 'image/jpeg'
+        return self.get(ref), mime_type(ref)
+
+    def wait(self):
+        """Espera a que se escriban las miniaturas pendientes"""
+        wait(list(self._pending))
+
+    def _write_atomic(self, destination, data):
+        directory = os.path.dirname(destination)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _make_thumbnail(self, ref):
+        if Image is None:
+            return
+        thumb = self.thumbnail_path(ref)
+        if os.path.exists(thumb):
+            return
+        with Image.open(self.path(ref)) as img:
+            img = img.convert('RGB')
+            img.thumbnail(self.thumbnail_size)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(thumb), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format='JPEG', quality=80)
+        os.replace(tmp_path, thumb)
@@ -0,0 +1,218 @@
+"""
+Perfilado opcional de las ejecuciones de las apps de Streamlit: tiempo en cada
+etapa con nombre de la ejecución, tamaño del session state y bytes de fotos. Se
+muestra en un panel de la barra lateral y se agrega como líneas JSON a un log para
+analizarlo después.
+Se activa con APP_PROFILE=1 o con el parámetro ?profile=1 en la URL.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+PROFILE_ENV = 'APP_PROFILE'
+PROFILE_LOG_ENV = 'APP_PROFILE_LOG'
+DEFAULT_PROFILE_LOG = os.path.join(os.path.expanduser('~'), '.site_survey', 'profile.jsonl')
+# Ejecuciones que se guardan en la sesión para el gráfico del panel
+HISTORY_SIZE = 50
+# Claves del session state más grandes que se registran
+TOP_STATE_KEYS = 10
+
+_TRUE = ('1', 'true', 'yes', 'on')
+_PREFIX = '_profile'
+_log_lock = threading.Lock()
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def profiling_enabled():
+    if os.environ.get(PROFILE_ENV, '').lower() in _TRUE:
+        return True
+    return str(st.query_params.get('profile', '')).lower() in _TRUE
+
+
+def log_path():
+    return os.environ.get(PROFILE_LOG_ENV, DEFAULT_PROFILE_LOG)
+
+
+def deep_size(obj, seen=None):
+    """
+    Bytes aproximados que ocupan obj y todo lo que se alcanza desde él (contenedores,
+    atributos de objetos, DataFrames y arreglos); los objetos en 'seen' no se vuelven a contar
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        if hasattr(item, 'memory_usage') and hasattr(item, 'columns'):
+            total += int(item.memory_usage(deep=True).sum())
+            continue
+        if hasattr(item, 'nbytes') and hasattr(item, 'dtype'):
+            total += int(item.nbytes)
+            continue
+        total += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif hasattr(item, '__dict__'):
+            pending.append(vars(item))
+    return total
+
+
+def state_sizes(session_state):
+    """
+    Bytes por clave del session state. Los valores con 'revision' (el ProjectStore)
+    solo se vuelven a medir cuando cambia su revisión.
+    """
+    cache = session_state.get(f'{_PREFIX}_size_cache', {})
+    sizes = {}
+    seen = set()
+    for key in list(session_state.keys()):
+        if str(key).startswith(_PREFIX):
+            continue
+        value = session_state[key]
+        revision = getattr(value, 'revision', None)
+        if isinstance(revision, int) and cache.get(key, (None,))[0] == (id(value), revision):
+            sizes[key] = cache[key][1]
+            continue
+        sizes[key] = deep_size(value, seen)
+        if isinstance(revision, int):
+            cache[key] = ((id(value), revision), sizes[key])
+    session_state[f'{_PREFIX}_size_cache'] = cache
+    return sizes
+
+
+def append_record(record, path=None):
+    path = path or log_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _log_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+class RunProfiler:
+    """
+    Etapas de una ejecución del script. mark(name) cierra la etapa actual y empieza
+    la siguiente, así que un script plano solo necesita una línea por sección;
+    finish() registra la ejecución. Con el perfilado apagado ninguna llamada hace nada.
+    """
+
+    def __init__(self, app, enabled=True):
+        self.app = app
+        self.enabled = enabled
+        self.finished = False
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._stage = None
+        self._stage_start = self.started
+
+    def mark(self, name):
+        """Cierra la etapa actual y empieza 'name' (una etapa repetida en la ejecución se suma)"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._close(now)
+        self._stage, self._stage_start = name, now
+
+    def _close(self, now):
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + (now - self._stage_start) * 1000
+        self._stage = None
+
+    def finish(self, photos=None, interrupted=False, panel=True):
+        """
+        Registra la ejecución (log e historial de la sesión) y muestra el panel lateral.
+        'photos' es una función que devuelve un diccionario con los bytes de fotos.
+        """
+        if not self.enabled or self.finished:
+            return None
+        now = time.perf_counter()
+        self._close(now)
+        self.finished = True
+
+        state = st.session_state
+        run = state.get(f'{_PREFIX}_runs', 0) + 1
+        state[f'{_PREFIX}_runs'] = run
+        if f'{_PREFIX}_session' not in state:
+            state[f'{_PREFIX}_session'] = uuid.uuid4().hex[:8]
+        sizes = state_sizes(state)
+        largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:TOP_STATE_KEYS]
+        record = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'app': self.app,
+            'session': state[f'{_PREFIX}_session'],
+            'run': run,
+            'interrupted': interrupted,
+            'total_ms': round((now - self.started) * 1000, 1),
+            'stages': {name: round(ms, 1) for name, ms in self.stages.items()},
+            'state_bytes': sum(sizes.values()),
+            'state_keys': {str(key): size for key, size in largest}
+        }
+        if photos is not None:
+            record['photos'] = photos()
+        try:
+            append_record(record)
+        except OSError as e:
+            record['log_error'] = str(e)
+
+        history = state.get(f'{_PREFIX}_history', [])
+        history = (history + [record])[-HISTORY_SIZE:]
+        state[f'{_PREFIX}_history'] = history
+        if panel:
+            show_panel(record, history)
+        return record
+
+
+def start_profile(app):
+    """Profiler de esta ejecución del script (uno que no hace nada si el perfilado está apagado)"""
+    if not profiling_enabled():
+        return RunProfiler(app, enabled=False)
+    previous = st.session_state.get(f'{_PREFIX}_run')
+    if previous is not None and not previous.finished:
+        # La ejecución anterior terminó con st.rerun() o por una nueva interacción:
+        # su última etapa se cierra ahora
+        previous.finish(interrupted=True, panel=False)
+    profiler = RunProfiler(app)
+    st.session_state[f'{_PREFIX}_run'] = profiler
+    return profiler
+
+
+def _megabytes(size):
+    return f"{size / 2**20:.2f} MB"
+
+
+def show_panel(record, history):
+    import pandas as pd
+
+    with st.sidebar.expander("⏱️ Perfil de ejecución", expanded=True):
+        total = record['total_ms']
+        st.metric("Ejecución", f"{total:.0f} ms", delta=f"{total - history[-2]['total_ms']:+.0f} ms" if len(history) > 1 else None, delta_color="inverse")
+        stages = pd.DataFrame({
+            'Etapa': list(record['stages']),
+            'ms': list(record['stages'].values()),
+            '%': [round(100 * ms / total, 1) if total else 0 for ms in record['stages'].values()]
+        })
+        st.dataframe(stages, hide_index=True, use_container_width=True)
+        st.caption(f"Session state: {_megabytes(record['state_bytes'])}")
+        if record.get('photos'):
+            st.caption(" · ".join(f"{key}: {_megabytes(value) if key.endswith('bytes') else value}" for key, value in record['photos'].items()))
+        st.dataframe(pd.DataFrame({'Clave': list(record['state_keys']), 'Tamaño': [_megabytes(v) for v in record['state_keys'].values()]}),
+                     hide_index=True, use_container_width=True)
+        if len(history) > 1:
+            st.bar_chart(pd.DataFrame([h['stages'] for h in history]).fillna(0))
+        if record.get('log_error'):
+            st.warning(f"No se pudo escribir el registro: {record['log_error']}")
+        else:
+            st.caption(f"Registro: {log_path()}")
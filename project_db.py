@@ -0,0 +1,619 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from kml_core.project_store import ProjectStore
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser('~'), '.site_survey', 'survey.db')
+
+# Columnas propias de la tabla elements; el resto de atributos va en 'data' (JSON)
+ELEMENT_COLUMNS = ('name', 'type', 'lat', 'lon', 'photo_ref')
+CONNECTION_COLUMNS = ('element_a', 'element_b', 'construction_type', 'infraestructura', 'distance')
+# Con más cambios pendientes que esto es más rápido volver a abrir el proyecto
+MAX_PULL_CHANGES = 2000
+# Atributos extra vacíos: la mayoría de las filas, no hace falta decodificarlos al abrir
+EMPTY_DATA = '{}'
+# Nombres o ids por consulta IN (...)
+_IN_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    task TEXT NOT NULL DEFAULT '',
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS elements (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    photo_ref TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (project_id, name)
+);
+CREATE INDEX IF NOT EXISTS elements_seq ON elements (project_id, seq);
+CREATE TABLE IF NOT EXISTS connections (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    element_a TEXT NOT NULL,
+    element_b TEXT NOT NULL,
+    construction_type TEXT,
+    infraestructura TEXT,
+    distance REAL,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS connections_project ON connections (project_id);
+CREATE TABLE IF NOT EXISTS photos (
+    ref TEXT PRIMARY KEY,
+    size INTEGER,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    prefix TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (project_id, prefix)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    client TEXT NOT NULL,
+    op TEXT NOT NULL,
+    target TEXT,
+    data TEXT,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_project ON changes (project_id, seq);
+"""
+
+SELECT_ELEMENTS = "SELECT name, type, lat, lon, photo_ref, data FROM elements WHERE project_id = ?"
+SELECT_CONNECTIONS = (
+    "SELECT id, element_a, element_b, construction_type, infraestructura, distance, data "
+    "FROM connections WHERE project_id = ?"
+)
+
+
+class ElementConflict(ValueError):
+    """Otra sesión ya guardó un elemento con este nombre"""
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _json_default(value):
+    # Valores numpy que llegan desde los data editors
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+class ProjectDB:
+    """
+    Persistencia local en SQLite (WAL) de los proyectos del survey. Los cambios se
+    escriben fila por fila con ProjectWriter, el listener conectado a un ProjectStore.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SURVEY_DB_PATH', DEFAULT_DB_PATH)
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    @contextmanager
+    def batch(self):
+        """Toma el lock y entrega la conexión dentro de una transacción"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def transaction(self, statements):
+        """Ejecuta varias sentencias (sql, params) de forma atómica"""
+        with self.batch() as conn:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+
+    # Proyectos
+    def list_projects(self):
+        rows = self.execute(
+            "SELECT p.id, p.name, p.task, p.updated, "
+            "(SELECT COUNT(*) FROM elements e WHERE e.project_id = p.id) "
+            "FROM projects p ORDER BY p.updated DESC"
+        ).fetchall()
+        return [{'id': r[0], 'name': r[1], 'task': r[2], 'updated': r[3], 'elements': r[4]} for r in rows]
+
+    def find_project(self, name):
+        row = self.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def create_project(self, name, task=''):
+        now = _now()
+        cursor = self.execute(
+            "INSERT INTO projects (name, task, created, updated) VALUES (?, ?, ?, ?)",
+            (name, task, now, now)
+        )
+        return cursor.lastrowid
+
+    def update_project(self, project_id, name=None, task=None):
+        if name is not None:
+            self.execute("UPDATE projects SET name = ?, updated = ? WHERE id = ?", (name, _now(), project_id))
+        if task is not None:
+            self.execute("UPDATE projects SET task = ?, updated = ? WHERE id = ?", (task, _now(), project_id))
+
+    def project_info(self, project_id):
+        row = self.execute("SELECT name, task FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return {'name': row[0], 'task': row[1]} if row else None
+
+    def element_count(self, project_id):
+        return self.execute("SELECT COUNT(*) FROM elements WHERE project_id = ?", (project_id,)).fetchone()[0]
+
+    # Carga
+    def _load(self, project_id):
+        elements = [_element(row) for row in self.execute(SELECT_ELEMENTS + " ORDER BY seq", (project_id,))]
+        rows = self.execute(SELECT_CONNECTIONS + " ORDER BY id", (project_id,)).fetchall()
+        return ProjectStore(elements, [_connection(row) for row in rows]), [row[0] for row in rows]
+
+    def load_store(self, project_id):
+        """Arma un ProjectStore con el proyecto (las fotos quedan en disco, solo se cargan las referencias)"""
+        return self._load(project_id)[0]
+
+    def open(self, project_id):
+        """
+        Carga el proyecto y le conecta un writer que lo comparte con las otras
+        sesiones: el store y la posición en el registro de cambios salen de la misma
+        lectura, así que writer.pull() trae exactamente los cambios posteriores
+        """
+        with self.batch():
+            last_seq = self.last_seq(project_id)
+            store, row_ids = self._load(project_id)
+        writer = ProjectWriter(self, project_id, store, last_seq)
+        writer.map_connections(store.connections, row_ids)
+        store.listener = writer
+        return store
+
+    # Registro de cambios
+    def last_seq(self, project_id):
+        return self.execute("SELECT COALESCE(MAX(seq), 0) FROM changes WHERE project_id = ?", (project_id,)).fetchone()[0]
+
+    def changes_since(self, project_id, seq, limit=None):
+        """Entradas del registro de cambios posteriores a seq, de la más antigua a la más nueva"""
+        rows = self.execute(
+            "SELECT seq, client, op, target, data, created FROM changes WHERE project_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (project_id, seq, -1 if limit is None else limit)
+        ).fetchall()
+        return [{'seq': r[0], 'client': r[1], 'op': r[2], 'target': r[3], 'data': json.loads(r[4]) if r[4] else None,
+                 'created': r[5]} for r in rows]
+
+    def load_counters(self, project_id):
+        return dict(self.execute("SELECT prefix, value FROM counters WHERE project_id = ?", (project_id,)).fetchall())
+
+    def save_counter(self, project_id, prefix, value):
+        """Sube un contador hasta value (nunca lo baja: otras cuadrillas pueden ir más adelante)"""
+        self.execute(
+            "INSERT INTO counters (project_id, prefix, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (project_id, prefix) DO UPDATE SET value = MAX(value, excluded.value)",
+            (project_id, prefix, value)
+        )
+
+    def next_counter(self, project_id, prefix):
+        """Reserva el siguiente número de un prefijo; es atómico, así que dos sesiones nunca reciben el mismo"""
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT INTO counters (project_id, prefix, value) VALUES (?, ?, 1) "
+                "ON CONFLICT (project_id, prefix) DO UPDATE SET value = value + 1",
+                (project_id, prefix)
+            )
+            return conn.execute("SELECT value FROM counters WHERE project_id = ? AND prefix = ?", (project_id, prefix)).fetchone()[0]
+
+    def register_photo(self, ref, size):
+        self.execute("INSERT OR IGNORE INTO photos (ref, size, created) VALUES (?, ?, ?)", (ref, size, _now()))
+
+    def attach(self, store, project_id):
+        """Empieza a escribir en el proyecto cada cambio del store"""
+        writer = ProjectWriter(self, project_id, store, self.last_seq(project_id))
+        writer.map_connections(store.connections)
+        store.listener = writer
+        return writer
+
+    def save_snapshot(self, store, project_id):
+        """Escribe el store completo (una sola vez, al conectar un proyecto sin guardar)"""
+        writer = ProjectWriter(self, project_id)
+        with self.batch() as conn:
+            conn.execute("DELETE FROM elements WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM connections WHERE project_id = ?", (project_id,))
+            conn.executemany(ProjectWriter.INSERT_ELEMENT, [writer.element_row(elem, seq) for seq, elem in enumerate(store.elements)])
+            conn.executemany(ProjectWriter.INSERT_CONNECTION, [writer.connection_row(c) for c in store.connections])
+            # Las sesiones que ya tenían el proyecto abierto lo vuelven a cargar completo
+            writer.log(conn, 'snapshot')
+            writer.touch(conn)
+
+
+def _element(row):
+    name, elem_type, lat, lon, photo_ref, data = row
+    elem = {'type': elem_type, 'name': name, 'lat': lat, 'lon': lon}
+    if data != EMPTY_DATA:
+        elem.update(json.loads(data))
+    if photo_ref:
+        elem['photo_ref'] = photo_ref
+    return elem
+
+
+def _connection(row):
+    _, element_a, element_b, construction_type, infraestructura, distance, data = row
+    conn = {'element_a': element_a, 'element_b': element_b, 'construction_type': construction_type,
+            'infraestructura': infraestructura, 'distance': distance}
+    if data != EMPTY_DATA:
+        conn.update(json.loads(data))
+    return conn
+
+
+def _select_in(conn, sql, params, column, values):
+    """Filas de sql + 'AND column IN (values)', en tandas de _IN_CHUNK valores"""
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), _IN_CHUNK):
+        chunk = values[start:start + _IN_CHUNK]
+        rows.extend(conn.execute(f"{sql} AND {column} IN ({','.join('?' * len(chunk))})", params + tuple(chunk)))
+    return rows
+
+
+class ProjectWriter:
+    """
+    Listener del ProjectStore que escribe cada cambio por separado. Cada cambio se
+    agrega también al registro de cambios del proyecto (en la misma transacción), así
+    que las otras sesiones con el proyecto abierto traen solo lo que cambió (pull) en
+    lugar de volver a cargarlo. Entre sesiones, las conexiones se identifican por el id
+    de su fila.
+    """
+
+    INSERT_ELEMENT = (
+        "INSERT INTO elements (project_id, name, seq, type, lat, lon, photo_ref, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    INSERT_CONNECTION = (
+        "INSERT INTO connections (project_id, element_a, element_b, construction_type, infraestructura, distance, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    INSERT_CHANGE = "INSERT INTO changes (project_id, client, op, target, data, created) VALUES (?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, db, project_id, store=None, last_seq=0):
+        self.db = db
+        self.project_id = project_id
+        self.store = store
+        # Último cambio del log ya presente en el store
+        self.last_seq = last_seq
+        # Marca los cambios propios en el log para no aplicarlos dos veces
+        self.client_id = uuid.uuid4().hex
+        # id() de cada conexión del store -> id de su fila, y fila -> conexión
+        self._row_ids = {}
+        self._conns = {}
+
+    def map_connections(self, connections, row_ids=None):
+        """Asocia las conexiones del store con sus filas (ambas conservan el orden de inserción)"""
+        if row_ids is None:
+            row_ids = [r[0] for r in self.db.execute(
+                "SELECT id FROM connections WHERE project_id = ? ORDER BY id", (self.project_id,)
+            )]
+        self._row_ids = {}
+        self._conns = {}
+        for conn, row_id in zip(connections, row_ids):
+            self._map(conn, row_id)
+
+    def _map(self, conn, row_id):
+        self._row_ids[id(conn)] = row_id
+        self._conns[row_id] = conn
+
+    def _forget(self, connections):
+        for conn in connections:
+            self._conns.pop(self._row_ids.pop(id(conn), None), None)
+
+    def element_row(self, elem, seq):
+        data = {k: v for k, v in elem.items() if k not in ELEMENT_COLUMNS and k != 'photo'}
+        return (self.project_id, elem['name'], seq, elem['type'], float(elem['lat']), float(elem['lon']),
+                elem.get('photo_ref'), _dumps(data))
+
+    def connection_row(self, conn):
+        data = {k: v for k, v in conn.items() if k not in CONNECTION_COLUMNS}
+        distance = conn.get('distance')
+        return (self.project_id, conn['element_a'], conn['element_b'], conn.get('construction_type'),
+                conn.get('infraestructura'), float(distance) if distance is not None else None, _dumps(data))
+
+    def log(self, conn, op, target=None, data=None):
+        """Agrega un cambio al registro (dentro de la transacción que lo hace)"""
+        conn.execute(self.INSERT_CHANGE, (self.project_id, self.client_id, op, None if target is None else str(target),
+                                          None if data is None else _dumps(data), _now()))
+
+    def touch(self, conn=None):
+        (conn or self.db).execute("UPDATE projects SET updated = ? WHERE id = ?", (_now(), self.project_id))
+
+    def _next_seq(self, conn):
+        row = conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM elements WHERE project_id = ?", (self.project_id,)).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _logged(elem):
+        return {k: v for k, v in elem.items() if k != 'photo'}
+
+    def _undo(self, undo):
+        # Deshace en el store un cambio que la base rechazó, sin volver a escribirlo
+        if self.store is None:
+            return
+        self.store.listener = None
+        try:
+            undo()
+        finally:
+            self.store.listener = self
+
+    def _conflict(self, names):
+        with self.db.batch() as conn:
+            taken = [row[0] for row in _select_in(conn, "SELECT name FROM elements WHERE project_id = ?", (self.project_id,), 'name', names)]
+        shown = ', '.join(taken[:5]) + ('...' if len(taken) > 5 else '')
+        return ElementConflict(f"Otra cuadrilla ya guardó elementos con estos nombres: {shown or ', '.join(names[:5])}")
+
+    def element_added(self, elem):
+        try:
+            with self.db.batch() as conn:
+                conn.execute(self.INSERT_ELEMENT, self.element_row(elem, self._next_seq(conn)))
+                self.log(conn, 'element_added', elem['name'], self._logged(elem))
+                self.touch(conn)
+        except sqlite3.IntegrityError:
+            self._undo(lambda: self.store.delete_element(elem['name']))
+            raise self._conflict([elem['name']]) from None
+
+    def elements_added(self, elements):
+        try:
+            with self.db.batch() as conn:
+                start = self._next_seq(conn)
+                conn.executemany(self.INSERT_ELEMENT, [self.element_row(elem, start + i) for i, elem in enumerate(elements)])
+                self.log(conn, 'elements_added', data=[self._logged(elem) for elem in elements])
+                self.touch(conn)
+        except sqlite3.IntegrityError:
+            # Se rechaza el lote completo, como en el store cuando un nombre se repite
+            self._undo(lambda: [self.store.delete_element(elem['name']) for elem in elements])
+            raise self._conflict([elem['name'] for elem in elements]) from None
+
+    def element_updated(self, elem):
+        row = self.element_row(elem, 0)
+        with self.db.batch() as conn:
+            updated = conn.execute(
+                "UPDATE elements SET type = ?, lat = ?, lon = ?, photo_ref = ?, data = ? WHERE project_id = ? AND name = ?",
+                (row[3], row[4], row[5], row[6], row[7], self.project_id, elem['name'])
+            ).rowcount
+            if not updated:
+                # Otra cuadrilla lo borró; no hay cambio que registrar y el pull lo quita de este store
+                return
+            self.log(conn, 'element_updated', elem['name'], self._logged(elem))
+            self.touch(conn)
+
+    def element_renamed(self, old_name, new_name):
+        try:
+            with self.db.batch() as conn:
+                conn.execute("UPDATE elements SET name = ? WHERE project_id = ? AND name = ?", (new_name, self.project_id, old_name))
+                conn.execute("UPDATE connections SET element_a = ? WHERE project_id = ? AND element_a = ?", (new_name, self.project_id, old_name))
+                conn.execute("UPDATE connections SET element_b = ? WHERE project_id = ? AND element_b = ?", (new_name, self.project_id, old_name))
+                self.log(conn, 'element_renamed', new_name, {'old_name': old_name})
+                self.touch(conn)
+        except sqlite3.IntegrityError:
+            self._undo(lambda: self.store.rename_element(new_name, old_name))
+            raise self._conflict([new_name]) from None
+
+    def element_deleted(self, name):
+        # El store ya quitó las conexiones del elemento; la base las borra junto con él
+        self._forget([conn for conn in self._conns.values() if name in (conn['element_a'], conn['element_b'])])
+        with self.db.batch() as conn:
+            conn.execute("DELETE FROM elements WHERE project_id = ? AND name = ?", (self.project_id, name))
+            conn.execute("DELETE FROM connections WHERE project_id = ? AND (element_a = ? OR element_b = ?)", (self.project_id, name, name))
+            self.log(conn, 'element_deleted', name)
+            self.touch(conn)
+
+    def connection_added(self, conn):
+        self.connections_added([conn])
+
+    def connections_added(self, connections):
+        if not connections:
+            return
+        with self.db.batch() as db_conn:
+            added = []
+            for conn in connections:
+                if not self._ends_exist(db_conn, conn):
+                    # Otra cuadrilla borró uno de sus elementos; el pull la quita también de este store
+                    continue
+                row_id = db_conn.execute(self.INSERT_CONNECTION, self.connection_row(conn)).lastrowid
+                self._map(conn, row_id)
+                added.append([row_id, conn])
+            if not added:
+                return
+            if len(added) == 1:
+                self.log(db_conn, 'connection_added', added[0][0], added[0][1])
+            else:
+                self.log(db_conn, 'connections_added', data=added)
+            self.touch(db_conn)
+
+    def _ends_exist(self, db_conn, conn):
+        ends = {conn['element_a'], conn['element_b']}
+        row = db_conn.execute(
+            f"SELECT COUNT(*) FROM elements WHERE project_id = ? AND name IN ({','.join('?' * len(ends))})",
+            (self.project_id, *ends)
+        ).fetchone()
+        return row[0] == len(ends)
+
+    def connection_updated(self, conn):
+        row_id = self._row_ids.get(id(conn))
+        if row_id is None:
+            self.connection_added(conn)
+            return
+        row = self.connection_row(conn)
+        with self.db.batch() as db_conn:
+            updated = db_conn.execute(
+                "UPDATE connections SET element_a = ?, element_b = ?, construction_type = ?, infraestructura = ?, "
+                "distance = ?, data = ? WHERE id = ?",
+                row[1:] + (row_id,)
+            ).rowcount
+            if not updated:
+                return
+            self.log(db_conn, 'connection_updated', row_id, conn)
+            self.touch(db_conn)
+
+    def connection_deleted(self, conn):
+        row_id = self._row_ids.get(id(conn))
+        if row_id is not None:
+            self._forget([conn])
+            with self.db.batch() as db_conn:
+                db_conn.execute("DELETE FROM connections WHERE id = ?", (row_id,))
+                self.log(db_conn, 'connection_deleted', row_id)
+                self.touch(db_conn)
+
+    def connections_replaced(self, connections):
+        self._row_ids = {}
+        self._conns = {}
+        with self.db.batch() as db_conn:
+            db_conn.execute("DELETE FROM connections WHERE project_id = ?", (self.project_id,))
+            for conn in connections:
+                self._map(conn, db_conn.execute(self.INSERT_CONNECTION, self.connection_row(conn)).lastrowid)
+            # Las demás sesiones vuelven a leer todas las conexiones
+            self.log(db_conn, 'connections_replaced')
+            self.touch(db_conn)
+
+    # Sincronización con las otras sesiones
+    def pending(self):
+        """Si otras sesiones cambiaron el proyecto desde el último pull"""
+        row = self.db.execute(
+            "SELECT EXISTS (SELECT 1 FROM changes WHERE project_id = ? AND seq > ? AND client != ?)",
+            (self.project_id, self.last_seq, self.client_id)
+        ).fetchone()
+        return bool(row[0])
+
+    def pull(self):
+        """
+        Aplica al store los cambios de las otras sesiones desde last_seq. El registro
+        indica qué elementos y conexiones cambiaron y sus filas actuales se leen en la
+        misma transacción, así que cada sesión termina con lo que tiene la base.
+        Devuelve la cantidad de cambios aplicados, o None cuando hay que volver a abrir
+        el proyecto (reemplazado por un snapshot, o más de MAX_PULL_CHANGES pendientes).
+        """
+        with self.db.batch() as conn:
+            changes = conn.execute(
+                "SELECT seq, client, op, target, data FROM changes WHERE project_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (self.project_id, self.last_seq, MAX_PULL_CHANGES + 1)
+            ).fetchall()
+            if not changes:
+                return 0
+            remote = [change for change in changes if change[1] != self.client_id]
+            if len(changes) > MAX_PULL_CHANGES or any(change[2] == 'snapshot' for change in remote):
+                return None
+            # Nombres y filas tocados, en el orden del log
+            renames = []
+            names = {}
+            deleted = set()
+            row_ids = {}
+            all_connections = False
+            for _, _, op, target, data in remote:
+                if op == 'elements_added':
+                    names.update(dict.fromkeys(elem['name'] for elem in json.loads(data)))
+                elif op == 'element_renamed':
+                    old_name = json.loads(data)['old_name']
+                    renames.append((old_name, target))
+                    names.update(dict.fromkeys((old_name, target)))
+                elif op.startswith('element_'):
+                    names[target] = None
+                    if op == 'element_deleted':
+                        deleted.add(target)
+                elif op == 'connections_added':
+                    row_ids.update(dict.fromkeys(row_id for row_id, _ in json.loads(data)))
+                elif op == 'connections_replaced':
+                    all_connections = True
+                elif op.startswith('connection_'):
+                    row_ids[int(target)] = None
+            elements = {row[0]: _element(row) for row in _select_in(conn, SELECT_ELEMENTS, (self.project_id,), 'name', names)}
+            if all_connections:
+                connection_rows = conn.execute(SELECT_CONNECTIONS + " ORDER BY id", (self.project_id,)).fetchall()
+            else:
+                connection_rows = _select_in(conn, SELECT_CONNECTIONS, (self.project_id,), 'id', row_ids)
+
+        store = self.store
+        store.listener = None
+        try:
+            for old_name, new_name in renames:
+                if old_name in store and new_name not in store:
+                    store.rename_element(old_name, new_name)
+            for name in names:
+                self._apply_element(name, elements.get(name), name in deleted)
+            if all_connections:
+                store.set_connections([_connection(row) for row in connection_rows])
+                self.map_connections(store.connections, [row[0] for row in connection_rows])
+            else:
+                current = {row[0]: _connection(row) for row in connection_rows}
+                for row_id in row_ids:
+                    self._apply_connection(row_id, current.get(row_id))
+        finally:
+            store.listener = self
+        self.last_seq = changes[-1][0]
+        return len(remote)
+
+    def _apply_element(self, name, current, deleted=False):
+        store = self.store
+        local = store.get(name)
+        if deleted and local is not None:
+            # Borrado en otra sesión (aunque después se haya vuelto a crear con el mismo nombre):
+            # el elemento local y sus conexiones se van
+            self._forget(store.connections_of(name))
+            store.delete_element(name)
+            local = None
+        if current is None:
+            if local is not None:
+                self._forget(store.connections_of(name))
+                store.delete_element(name)
+        elif local is None:
+            store.add_element(current)
+        else:
+            changes = {key: value for key, value in current.items() if local.get(key) != value}
+            if changes:
+                store.update_element(name, changes)
+
+    def _apply_connection(self, row_id, current):
+        store = self.store
+        local = self._conns.get(row_id)
+        if local is not None and not any(conn is local for conn in store.connections_of(local['element_a'])):
+            # Se fue junto con uno de sus elementos
+            self._forget([local])
+            local = None
+        if current is None:
+            if local is not None:
+                self._forget([local])
+                store.delete_connection(local)
+        elif local is None:
+            if current['element_a'] in store and current['element_b'] in store:
+                self._map(store.add_connection(current), row_id)
+        else:
+            changes = {key: value for key, value in current.items() if local.get(key) != value}
+            if changes:
+                store.update_connection(local, changes)
@@ -3,23 +3,34 @@ import pandas as pd
 import folium
 from streamlit_folium import st_folium
 from datetime import datetime
-import math
-from io import BytesIO
-import base64
-import simplekml
+import os
+from kml_core.project_store import ProjectStore
+from photo_store import PhotoStore
+from project_db import ProjectDB
+from kml_core.geo import GridIndex, haversine
+from kml_core.connections import calculate_distance, suggest_construction_type, element_coordinates, element_types, eligible_for, build_connections, reconnect_pairs
+from export_jobs import ExportJobs
+from kml_core.plant_import import ELEMENT_PREFIXES, import_plant, update_counters
+from map_layers import LayerCache, get_element_style, element_rows, connection_layers, add_clustered_elements, add_connection_layers, add_element_markers, add_connection_lines, add_tile_layer, pad_bounds
+from tile_proxy import TILE_SOURCES, configured_zooms, count_tiles, project_bbox, start_tile_proxy
+from kml_core.survey_kml import KML_CONNECTION_STYLES, build_export
+from profiling import start_profile
 
 # Configuración de la página
 st.set_page_config(page_title="Site Survey - Telecomunicaciones", layout="wide", initial_sidebar_state="collapsed")
+# Perfil por ejecución (APP_PROFILE=1 o ?profile=1)
+profiler = start_profile('survey')
+profiler.mark('setup')
 
 # Inicialización de session state
 if 'project_name' not in st.session_state:
     st.session_state.project_name = ""
 if 'task_name' not in st.session_state:
     st.session_state.task_name = ""
-if 'elements' not in st.session_state:
-    st.session_state.elements = []
-if 'connections' not in st.session_state:
-    st.session_state.connections = []
+if 'store' not in st.session_state:
+    st.session_state.store = ProjectStore()
+if 'project_id' not in st.session_state:
+    st.session_state.project_id = None
 if 'temp_location' not in st.session_state:
     st.session_state.temp_location = None
 if 'element_counters' not in st.session_state:
@@ -30,47 +41,63 @@ if 'map_center' not in st.session_state:
     st.session_state.map_center = [31.6904, -106.4245]
 if 'auto_connect' not in st.session_state:
     st.session_state.auto_connect = True
+if 'auto_connect_mode' not in st.session_state:
+    st.session_state.auto_connect_mode = 'previous'
 if 'user_location' not in st.session_state:
     st.session_state.user_location = None
 if 'selected_map_layer' not in st.session_state:
     st.session_state.selected_map_layer = 'hybrid'
+if 'fast_map' not in st.session_state:
+    st.session_state.fast_map = False
+if 'viewport_only' not in st.session_state:
+    st.session_state.viewport_only = False
+if 'map_bounds' not in st.session_state:
+    st.session_state.map_bounds = None
+if 'map_layer_cache' not in st.session_state:
+    st.session_state.map_layer_cache = LayerCache()
+if 'editor_cache' not in st.session_state:
+    st.session_state.editor_cache = LayerCache()
+if 'export_jobs' not in st.session_state:
+    st.session_state.export_jobs = ExportJobs()
+if 'snap_radius' not in st.session_state:
+    st.session_state.snap_radius = 3.0
+if 'selected_element' not in st.session_state:
+    st.session_state.selected_element = None
+if 'last_click' not in st.session_state:
+    st.session_state.last_click = None
+if 'live_sync' not in st.session_state:
+    st.session_state.live_sync = True
+if 'reserved_names' not in st.session_state:
+    st.session_state.reserved_names = {}
 
-# Funciones
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+# A partir de este número de elementos el mapa usa siempre el modo agrupado
+FAST_MAP_THRESHOLD = 300
+# A partir de este número de elementos las exportaciones se generan en segundo plano
+BACKGROUND_EXPORT_THRESHOLD = 2000
+# Cada cuántos segundos se revisan los cambios de otras cuadrillas en un proyecto guardado
+SYNC_INTERVAL_S = float(os.environ.get('SURVEY_SYNC_INTERVAL_S', 10))
 
+# Funciones
 def get_next_element_name(element_type):
-    prefix_map = {'Poste': 'P', 'Handhole': 'HH', 'Cierre de Empalme': 'CE', 'Edificio': 'BLD'}
-    prefix = prefix_map[element_type]
-    st.session_state.element_counters[prefix] += 1
-    return f"{st.session_state.project_name}_{prefix}{st.session_state.element_counters[prefix]:03d}"
-
-def get_element_style(element_type):
-    styles = {
-        'Poste': {'color': 'red', 'icon': 'plug'},
-        'Handhole': {'color': 'blue', 'icon': 'square'},
-        'Cierre de Empalme': {'color': 'green', 'icon': 'link'},
-        'Edificio': {'color': 'orange', 'icon': 'building'}
-    }
-    return styles.get(element_type, {'color': 'gray', 'icon': 'circle'})
-
-def suggest_construction_type(elem_a_type, elem_b_type):
-    if elem_a_type == 'Handhole' and elem_b_type == 'Handhole':
-        return 'Ducto'
-    elif elem_a_type == 'Poste' and elem_b_type == 'Poste':
-        return 'Aerial Route'
-    elif ('Poste' in [elem_a_type, elem_b_type] and 'Handhole' in [elem_a_type, elem_b_type]):
-        return 'Ducto'
-    elif ('Edificio' in [elem_a_type, elem_b_type] and 'Handhole' in [elem_a_type, elem_b_type]):
-        return 'Ducto'
-    return 'Aerial Route'
+    prefix = ELEMENT_PREFIXES[element_type]
+    if st.session_state.project_id is None:
+        st.session_state.element_counters[prefix] += 1
+        return f"{st.session_state.project_name}_{prefix}{st.session_state.element_counters[prefix]:03d}"
+    # Proyecto guardado: el número se reserva en la base, compartido con las otras cuadrillas
+    while True:
+        value = get_project_db().next_counter(st.session_state.project_id, prefix)
+        st.session_state.element_counters[prefix] = value
+        name = f"{st.session_state.project_name}_{prefix}{value:03d}"
+        if name not in st.session_state.store:
+            return name
+
+def reserved_element_name(element_type):
+    # Nombre del formulario de nuevo elemento: se reserva una vez y no en cada ejecución de la app
+    key = (st.session_state.project_name, element_type)
+    name = st.session_state.reserved_names.get(key)
+    if name is None or name in st.session_state.store:
+        name = st.session_state.reserved_names[key] = get_next_element_name(element_type)
+    return name
 
 def create_auto_connection(prev_elem, curr_elem):
     distance = calculate_distance(prev_elem['lat'], prev_elem['lon'], curr_elem['lat'], curr_elem['lon'])
@@ -82,60 +109,362 @@ def create_auto_connection(prev_elem, curr_elem):
         'infraestructura': 'Nuevo',
         'distance': distance
     }
-    st.session_state.connections.append(new_connection)
+    st.session_state.store.add_connection(new_connection)
     return new_connection
 
-def export_to_kml():
-    kml = simplekml.Kml()
-    for elem in st.session_state.elements:
-        pnt = kml.newpoint(name=elem['name'], coords=[(elem['lon'], elem['lat'])])
-        if elem['type'] == 'Poste':
-            pnt.style.iconstyle.color = simplekml.Color.yellow
-            pnt.style.iconstyle.scale = 2.0
-            pnt.style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png'
-        elif elem['type'] == 'Handhole':
-            pnt.style.iconstyle.color = simplekml.Color.yellow
-            pnt.style.iconstyle.scale = 1.0
-            pnt.style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/shapes/placemark_square.png'
-        elif elem['type'] == 'Cierre de Empalme':
-            pnt.style.iconstyle.color = simplekml.Color.green
-            pnt.style.iconstyle.scale = 1.0
-            pnt.style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/shapes/target.png'
-        elif elem['type'] == 'Edificio':
-            pnt.style.iconstyle.color = simplekml.Color.orange
-            pnt.style.iconstyle.scale = 1.0
-            pnt.style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/shapes/homegardenbusiness.png'
-        
-        description_html = '<div style="font-family: Arial; font-size: 20px; max-width: 800px;">'
-        description_html += f'<h1 style="color: #2c3e50; margin-bottom: 15px; font-size: 28px;">{elem["type"]}</h1>'
-        if 'photo' in elem and elem['photo']:
-            description_html += f'<img src="data:image/jpeg;base64,{elem["photo"]}" style="max-width: 600px; max-height: 500px; margin: 15px 0; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);"/><br/>'
-        description_html += '<table style="border-collapse: collapse; width: 100%; margin-top: 15px;">'
-        for key, value in elem.items():
-            if key not in ['lat', 'lon', 'name', 'type', 'photo']:
-                description_html += f'<tr style="border-bottom: 2px solid #ddd;"><td style="padding: 12px; font-weight: bold; background-color: #f2f2f2; width: 40%; font-size: 18px;">{key}:</td><td style="padding: 12px; font-size: 18px;">{value}</td></tr>'
-        description_html += '</table>'
-        description_html += f'<p style="margin-top: 20px; color: #7f8c8d; font-size: 16px;"><strong>Coordenadas:</strong><br/>Lat: {elem["lat"]:.6f}<br/>Lon: {elem["lon"]:.6f}</p></div>'
-        pnt.description = description_html
+def element_index():
+    # Grilla sobre los elementos, reconstruida solo cuando cambia el proyecto
+    store = st.session_state.store
+    return st.session_state.map_layer_cache.get('element_index', store.revision, lambda: GridIndex(*element_coordinates(store.elements)))
+
+def find_nearest_element(elem):
+    # Elemento guardado más cercano a elem (aún sin guardar) con el que se puede conectar, vía la grilla
+    store = st.session_state.store
+    if not store.elements:
+        return None
+    types = st.session_state.map_layer_cache.get('element_types', store.revision, lambda: element_types(store.elements))
+    found, _ = element_index().nearest(elem['lat'], elem['lon'], k=1, accept=eligible_for(elem['type'], types))
+    return store.elements[int(found[0])] if len(found) else None
+
+def snap_to_element(lat, lon, radius_m):
+    # Elemento existente más cercano a menos de radius_m metros del punto (None si no hay)
+    store = st.session_state.store
+    if not store.elements or not radius_m:
+        return None
+    found, meters = element_index().nearest(lat, lon, k=1, max_distance=radius_m)
+    if len(found) and meters[0] <= radius_m:
+        return store.elements[int(found[0])]
+    return None
+
+def reconnect_all(mode):
+    elements = st.session_state.store.elements
+    st.session_state.store.set_connections(build_connections(elements, reconnect_pairs(elements, mode)))
+
+def connection_distance(conn):
+    elem_a, elem_b = st.session_state.store.endpoints(conn)
+    if elem_a is None or elem_b is None:
+        return None
+    return calculate_distance(elem_a['lat'], elem_a['lon'], elem_b['lat'], elem_b['lon'])
+
+def refresh_connection_distances(names):
+    # Recalcula las longitudes de las conexiones de los elementos movidos y guarda solo las que cambiaron
+    store = st.session_state.store
+    conns = list({id(c): c for name in names for c in store.connections_of(name)}.values())
+    ends = [store.endpoints(c) for c in conns]
+    valid = [i for i, (a, b) in enumerate(ends) if a and b]
+    if not valid:
+        return
+    lats_a, lons_a = element_coordinates([ends[i][0] for i in valid])
+    lats_b, lons_b = element_coordinates([ends[i][1] for i in valid])
+    distances = haversine(lats_a, lons_a, lats_b, lons_b)
+    for i, d in zip(valid, distances):
+        conn = conns[i]
+        if conn.get('distance') is None or abs(conn['distance'] - d) > 0.005:
+            store.update_connection(conn, {'distance': float(d)})
+
+# Tablas editables por tipo de elemento: (tipo, título, nombre corto, clave)
+ELEMENT_EDITORS = [
+    ('Poste', "🔴 Postes", "Postes", 'postes'),
+    ('Handhole', "🔵 Handholes", "Handholes", 'handholes'),
+    ('Cierre de Empalme', "🟢 Cierres de Empalme", "Cierres", 'cierres'),
+    ('Edificio', "🟠 Edificios", "Edificios", 'edificios')
+]
+CONNECTION_COLUMNS = ['element_a', 'element_b', 'construction_type', 'infraestructura', 'distance']
+
+def element_frame(element_type):
+    # Elementos del tipo y su tabla; se reconstruye solo cuando cambian los elementos de ese tipo
+    store = st.session_state.store
+    def build():
+        elements = store.by_type(element_type)
+        df = pd.DataFrame(elements)
+        display_cols = [col for col in df.columns if col not in ('photo', 'photo_ref')]
+        return elements, df[display_cols]
+    return st.session_state.editor_cache.get(element_type, store.type_revision(element_type), build)
+
+def connection_frame():
+    store = st.session_state.store
+    def build():
+        connections = list(store.connections)
+        df = pd.DataFrame(connections)
+        if 'infraestructura' not in df.columns:
+            df['infraestructura'] = 'Nuevo'
+        df = df.reindex(columns=CONNECTION_COLUMNS)
+        df['distance'] = df['distance'].astype(float).round(2)
+        return connections, df
+    return st.session_state.editor_cache.get('connections', store.connections_revision, build)
+
+def apply_element_edits(element_type, elements, delta):
+    # Aplica solo las filas editadas, agregadas o eliminadas en el data editor (no reescribe la tabla)
+    store = st.session_state.store
+    problems = []
+    moved = set()
+    deleted = {elements[i]['name'] for i in delta.get('deleted_rows', [])}
+    for row, changes in delta.get('edited_rows', {}).items():
+        elem = elements[int(row)]
+        if elem['name'] in deleted:
+            continue
+        changes = {col: value for col, value in changes.items() if not (col == 'name' and not value)}
+        try:
+            store.update_element(elem['name'], changes)
+        except ValueError as e:
+            problems.append(str(e))
+            continue
+        if 'lat' in changes or 'lon' in changes:
+            moved.add(elem['name'])
+    for name in deleted:
+        store.delete_element(name)
+    for row in delta.get('added_rows', []):
+        values = {col: value for col, value in row.items() if value is not None and value != ''}
+        if 'lat' not in values or 'lon' not in values:
+            problems.append("Fila nueva sin lat/lon: no se agregó")
+            continue
+        values['type'] = element_type
+        values.setdefault('timestamp', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if not values.get('name'):
+            values['name'] = get_next_element_name(element_type)
+        try:
+            store.add_element(values)
+        except ValueError as e:
+            problems.append(str(e))
+    refresh_connection_distances(moved)
+    return problems
+
+def apply_connection_edits(connections, delta):
+    store = st.session_state.store
+    problems = []
+    deleted = set(delta.get('deleted_rows', []))
+    for row, changes in delta.get('edited_rows', {}).items():
+        if int(row) in deleted:
+            continue
+        conn = connections[int(row)]
+        store.update_connection(conn, changes)
+        if 'element_a' in changes or 'element_b' in changes:
+            store.update_connection(conn, {'distance': connection_distance(conn)})
+    for i in sorted(deleted):
+        store.delete_connection(connections[i])
+    for row in delta.get('added_rows', []):
+        elem_a, elem_b = store.get(row.get('element_a')), store.get(row.get('element_b'))
+        if elem_a is None or elem_b is None:
+            problems.append("Conexión nueva con elementos inexistentes: no se agregó")
+            continue
+        conn = {
+            'element_a': elem_a['name'],
+            'element_b': elem_b['name'],
+            'construction_type': row.get('construction_type') or suggest_construction_type(elem_a['type'], elem_b['type']),
+            'infraestructura': row.get('infraestructura') or 'Nuevo'
+        }
+        conn['distance'] = connection_distance(conn)
+        store.add_connection(conn)
+    return problems
+
+@st.cache_resource
+def get_photo_store():
+    return PhotoStore()
+
+@st.cache_resource
+def get_project_db():
+    return ProjectDB()
+
+@st.cache_resource
+def get_tile_proxy():
+    # Un proxy de teselas por proceso del servidor, compartido por todas las sesiones
+    return start_tile_proxy()
+
+def running_tile_proxy():
+    # Con SURVEY_TILE_PROXY_URL el puerto es fijo: si está ocupado se avisa y el mapa va directo a los servidores
+    try:
+        return get_tile_proxy()
+    except OSError as e:
+        st.error(f"🛰️ No se pudo iniciar el proxy de teselas: {e}")
+        return None
+
+def tile_prefetch_panel():
+    # Descargar el área del proyecto antes de salir a campo
+    proxy = running_tile_proxy()
+    if proxy is None:
+        st.info("Proxy de teselas desactivado: el mapa carga las teselas directo de los servidores. Actívalo con SURVEY_TILE_PROXY_URL (la dirección del proxy para los navegadores) o SURVEY_TILE_PROXY=1 si el navegador está en el mismo equipo")
+        return
+    usage = proxy.cache.usage()
+    status = "" if usage['online'] else " · 📴 sin conexión, solo teselas guardadas"
+    st.caption(f"Caché: {usage['tiles']} teselas, {usage['bytes'] / 2**20:.1f} de {usage['max_bytes'] / 2**20:.0f} MB{status}")
     
-    for conn in st.session_state.connections:
-        elem_a = next((e for e in st.session_state.elements if e['name'] == conn['element_a']), None)
-        elem_b = next((e for e in st.session_state.elements if e['name'] == conn['element_b']), None)
-        if elem_a and elem_b:
-            line = kml.newlinestring(name=f"{conn['element_a']} - {conn['element_b']}")
-            line.coords = [(elem_a['lon'], elem_a['lat']), (elem_b['lon'], elem_b['lat'])]
-            if conn['construction_type'] == 'Ducto':
-                line.style.linestyle.color = simplekml.Color.blue
-                line.style.linestyle.width = 4
-            elif conn['construction_type'] == 'Aerial Route':
-                line.style.linestyle.color = simplekml.Color.green
-                line.style.linestyle.width = 4
-            elif conn['construction_type'] == 'ADSS':
-                line.style.linestyle.color = simplekml.Color.red
-                line.style.linestyle.width = 4
-            infra_status = conn.get('infraestructura', 'N/A')
-            line.description = f'<div style="font-family: Arial; font-size: 20px;"><h2 style="color: #2c3e50; font-size: 26px;">Conexión</h2><table style="border-collapse: collapse; width: 100%;"><tr style="border-bottom: 2px solid #ddd;"><td style="padding: 12px; font-weight: bold; background-color: #f2f2f2; font-size: 18px;">Tipo:</td><td style="padding: 12px; font-size: 18px;">{conn["construction_type"]}</td></tr><tr style="border-bottom: 2px solid #ddd;"><td style="padding: 12px; font-weight: bold; background-color: #f2f2f2; font-size: 18px;">Infraestructura:</td><td style="padding: 12px; font-size: 18px;">{infra_status}</td></tr><tr style="border-bottom: 2px solid #ddd;"><td style="padding: 12px; font-weight: bold; background-color: #f2f2f2; font-size: 18px;">Distancia:</td><td style="padding: 12px; font-size: 18px;">{conn["distance"]:.2f} metros</td></tr></table></div>'
-    return kml.kml()
+    if not proxy.cache.allow_prefetch:
+        st.info("El proxy guarda las teselas a medida que el mapa las muestra. Las capas públicas (Google, Esri, OpenStreetMap) no permiten descargar áreas completas: para eso configura un servidor de teselas propio con SURVEY_TILE_UPSTREAM")
+        return
+    layer = st.session_state.selected_map_layer
+    areas = {}
+    bbox = project_bbox(st.session_state.store.elements)
+    if bbox is not None:
+        areas['project'] = ("Elementos del proyecto", bbox)
+    if st.session_state.map_bounds:
+        areas['view'] = ("Zona visible del mapa", pad_bounds(st.session_state.map_bounds, margin=0))
+    if not areas:
+        st.info("Agrega elementos o importa la planta para definir el área a descargar")
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        area = st.radio("Área", list(areas), format_func=lambda key: areas[key][0], key="tile_area")
+    with col2:
+        zooms = st.multiselect("Niveles de zoom", list(range(10, 21)), default=configured_zooms(), key="tile_zooms")
+    total = count_tiles(areas[area][1], zooms)
+    problem = proxy.cache.check_prefetch(layer, total)
+    if problem:
+        st.warning(problem)
+    if st.button(f"⬇️ Descargar {TILE_SOURCES[layer]['name']} ({total} teselas)", use_container_width=True, disabled=not zooms or problem is not None):
+        bar = st.progress(0.0, text="Descargando teselas...")
+        summary = proxy.cache.prefetch(layer, areas[area][1], zooms, progress=lambda fraction: bar.progress(fraction, text=f"Descargando teselas... {fraction:.0%}"))
+        st.success(f"✅ {summary['fetched']} teselas descargadas ({summary['bytes'] / 2**20:.1f} MB), {summary['cached']} ya estaban guardadas")
+        if summary['failed']:
+            st.warning(f"⚠️ {summary['failed']} teselas no se pudieron descargar")
+
+def open_project(project_id):
+    # Cargar un proyecto guardado y seguir guardando cada cambio
+    db = get_project_db()
+    info = db.project_info(project_id)
+    store = db.open(project_id)
+    counters = {'P': 0, 'HH': 0, 'CE': 0, 'BLD': 0}
+    counters.update(db.load_counters(project_id))
+    st.session_state.store = store
+    st.session_state.project_id = project_id
+    st.session_state.project_name = info['name']
+    st.session_state.task_name = info['task']
+    st.session_state.element_counters = counters
+    st.session_state.map_layer_cache = LayerCache()
+    st.session_state.editor_cache = LayerCache()
+    st.session_state.export_jobs = ExportJobs()
+    st.session_state.selected_element = None
+    st.session_state.reserved_names = {}
+
+def sync_project():
+    # Trae solo los cambios que otras cuadrillas hicieron en el proyecto desde la última vez
+    writer = st.session_state.store.listener
+    if st.session_state.project_id is None or writer is None:
+        return
+    applied = writer.pull()
+    if applied is None:
+        open_project(st.session_state.project_id)
+        st.toast("🔄 Proyecto recargado con los cambios de otras cuadrillas")
+    elif applied:
+        if st.session_state.selected_element not in st.session_state.store:
+            st.session_state.selected_element = None
+        st.toast(f"🔄 {applied} cambios de otras cuadrillas")
+
+def sync_monitor():
+    # Revisión periódica (fragmento): si otra cuadrilla cambió el proyecto, se vuelve a ejecutar la app para traerlo
+    writer = st.session_state.store.listener
+    if writer is not None and writer.pending():
+        st.rerun()
+    st.caption(f"👥 Proyecto compartido · cambio #{writer.last_seq if writer else 0}")
+
+def new_project():
+    st.session_state.store = ProjectStore()
+    st.session_state.project_id = None
+    st.session_state.project_name = ""
+    st.session_state.task_name = ""
+    st.session_state.element_counters = {'P': 0, 'HH': 0, 'CE': 0, 'BLD': 0}
+    st.session_state.map_layer_cache = LayerCache()
+    st.session_state.editor_cache = LayerCache()
+    st.session_state.export_jobs = ExportJobs()
+    st.session_state.selected_element = None
+    st.session_state.reserved_names = {}
+
+def import_plant_file(uploaded_file, default_type):
+    # Agrega la planta existente del archivo al proyecto y continúa la numeración de sus nombres
+    line_styles = {color: construction_type for construction_type, (color, _) in KML_CONNECTION_STYLES.items()}
+    summary = import_plant(uploaded_file, uploaded_file.name, st.session_state.store, default_type,
+                           next_name=get_next_element_name, line_styles=line_styles, suggest_type=suggest_construction_type)
+    changed = update_counters(st.session_state.element_counters, summary['names'])
+    if st.session_state.project_id is not None:
+        for prefix, value in changed.items():
+            get_project_db().save_counter(st.session_state.project_id, prefix, value)
+    return summary
+
+def autosave_project(project_name, task_name):
+    # Enlaza la sesión con su proyecto en la base de datos (lo crea, reanuda o renombra)
+    db = get_project_db()
+    project_id = st.session_state.project_id
+    if project_id is not None:
+        if project_name and project_name != st.session_state.project_name:
+            other_id = db.find_project(project_name)
+            if other_id is None:
+                db.update_project(project_id, name=project_name)
+            elif other_id != project_id:
+                open_project(other_id)
+                return True
+        if task_name != st.session_state.task_name:
+            db.update_project(project_id, task=task_name)
+        return False
+    if not project_name:
+        return False
+    store = st.session_state.store
+    existing_id = db.find_project(project_name)
+    if existing_id is not None:
+        if store.elements:
+            st.warning(f"⚠️ Ya existe un proyecto guardado llamado '{project_name}'. Usa otro nombre para guardar esta sesión.")
+            return False
+        open_project(existing_id)
+        return True
+    project_id = db.create_project(project_name, task_name)
+    db.save_snapshot(store, project_id)
+    for prefix, value in st.session_state.element_counters.items():
+        db.save_counter(project_id, prefix, value)
+    db.attach(store, project_id)
+    st.session_state.project_id = project_id
+    return False
+
+def photo_usage():
+    # Bytes de fotos en la sesión (base64 de sesiones anteriores y archivos subidos) y de las fotos referenciadas en disco
+    elements = st.session_state.store.elements
+    session_bytes = sum(len(e['photo']) for e in elements if e.get('photo'))
+    for key in ('camera_input', 'photo_upload'):
+        uploaded = st.session_state.get(key)
+        if uploaded is not None:
+            session_bytes += uploaded.size
+    photos = get_photo_store()
+    refs = {e['photo_ref'] for e in elements if e.get('photo_ref') in photos}
+    return {
+        'session_bytes': session_bytes,
+        'referenced': len(refs),
+        'disk_bytes': sum(os.path.getsize(photos.path(ref)) for ref in refs)
+    }
+
+# Exportaciones: (clave, etiqueta, sufijo del archivo, mime)
+EXPORTS = [
+    ('elements_csv', "📄 CSV Elementos", "elementos.csv", "text/csv"),
+    ('connections_csv', "📄 CSV Conexiones", "conexiones.csv", "text/csv"),
+    ('kml', "🗺️ KML", "survey.kml", "application/vnd.google-earth.kml+xml"),
+    ('kmz', "🗜️ KMZ con fotos", "survey.kmz", "application/vnd.google-earth.kmz")
+]
+
+def export_panel(polling=False):
+    # Cada exportación se genera solo al pedirla y se reutiliza mientras el proyecto no cambie
+    store = st.session_state.store
+    jobs = st.session_state.export_jobs
+    if polling and not jobs.running():
+        st.rerun()
+    columns = st.columns(len(EXPORTS))
+    for column, (kind, label, suffix, mime) in zip(columns, EXPORTS):
+        with column:
+            if kind == 'connections_csv' and not store.connections:
+                continue
+            job = jobs.job(kind, store.revision)
+            if job is None or job.state == 'error':
+                if job is not None:
+                    st.error(f"❌ {job.error}")
+                if not st.button(f"⚙️ {label}", use_container_width=True, key=f"build_{kind}", help="Generar archivo"):
+                    continue
+                photos = get_photo_store()
+                if len(store) >= BACKGROUND_EXPORT_THRESHOLD:
+                    snapshot = store.snapshot()
+                    jobs.start(kind, store.revision, lambda progress: build_export(kind, snapshot, photos, progress))
+                    st.rerun()
+                job = jobs.run(kind, store.revision, lambda progress: build_export(kind, store, photos, progress))
+            if job.state == 'ready':
+                st.download_button(label, data=job.data, file_name=f"{st.session_state.project_name}_{suffix}", mime=mime, use_container_width=True, key=f"download_{kind}")
+            elif job.state == 'running':
+                st.progress(job.progress, text=f"{label}: {job.progress:.0%}")
+            else:
+                st.error(f"❌ {job.error}")
 
 # CSS
 st.markdown("""
@@ -147,7 +476,12 @@ st.markdown("""
 # Título
 st.title("📡 Site Survey")
 
+# Cambios de otras cuadrillas
+profiler.mark('sync')
+sync_project()
+
 # Información del proyecto
+profiler.mark('project')
 with st.expander("📋 Información del Proyecto", expanded=not st.session_state.project_name):
     col1, col2 = st.columns(2)
     with col1:
@@ -155,13 +489,25 @@ with st.expander("📋 Información del Proyecto", expanded=not st.session_state
     with col2:
         task_name = st.text_input("Tarea", value=st.session_state.task_name, placeholder="Nombre de la tarea")
     
-    st.session_state.auto_connect = st.checkbox("🔗 Crear conexiones automáticamente", value=st.session_state.auto_connect)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.session_state.auto_connect = st.checkbox("🔗 Crear conexiones automáticamente", value=st.session_state.auto_connect)
+    with col2:
+        auto_connect_modes = {'previous': "Al elemento anterior", 'nearest': "Al elemento más cercano"}
+        st.session_state.auto_connect_mode = st.selectbox("Conectar nuevo elemento", list(auto_connect_modes), index=list(auto_connect_modes).index(st.session_state.auto_connect_mode), format_func=auto_connect_modes.get, disabled=not st.session_state.auto_connect)
     
     # Selector de tipo de mapa
     map_layer_option = st.selectbox("🗺️ Tipo de Mapa", ["Híbrido (Satélite + Calles)", "Satélite", "Satélite Google", "Mapa Calles", "Terreno"], index=0, key="map_layer_selector")
     layer_map = {"Híbrido (Satélite + Calles)": "hybrid", "Satélite": "satellite", "Satélite Google": "satellite_google", "Mapa Calles": "streets", "Terreno": "terrain"}
     st.session_state.selected_map_layer = layer_map[map_layer_option]
     
+    col1, col2 = st.columns(2)
+    with col1:
+        st.session_state.fast_map = st.checkbox("⚡ Mapa rápido (elementos agrupados)", value=st.session_state.fast_map, help=f"Se activa solo con más de {FAST_MAP_THRESHOLD} elementos")
+    with col2:
+        st.session_state.viewport_only = st.checkbox("🔍 Dibujar solo la zona visible", value=st.session_state.viewport_only)
+    st.session_state.snap_radius = st.number_input("🧲 Radio para seleccionar un elemento existente (m)", min_value=0.0, max_value=50.0, value=float(st.session_state.snap_radius), step=1.0, help="Un click a menos de esta distancia de un elemento lo selecciona en lugar de crear uno nuevo (0 = desactivado)")
+    
     # Ubicación manual simple
     with st.expander("📍 Establecer Mi Ubicación"):
         st.info("Ingresa tus coordenadas GPS actuales para crear elementos en tu posición")
@@ -192,17 +538,62 @@ with st.expander("📋 Información del Proyecto", expanded=not st.session_state
                     st.session_state.user_location = None
                     st.rerun()
     
+    # Proyectos guardados
+    with st.expander("💾 Proyectos Guardados"):
+        saved_projects = get_project_db().list_projects()
+        if saved_projects:
+            project_labels = {p['id']: f"{p['name']} ({p['elements']} elementos, {p['updated']})" for p in saved_projects}
+            selected_project = st.selectbox("Proyecto guardado", list(project_labels), format_func=project_labels.get, key="saved_project")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📂 Abrir", use_container_width=True, disabled=selected_project == st.session_state.project_id):
+                    open_project(selected_project)
+                    st.rerun()
+            with col2:
+                if st.button("➕ Nuevo proyecto", use_container_width=True):
+                    new_project()
+                    st.rerun()
+        else:
+            st.info("Aún no hay proyectos guardados. Se guardan automáticamente al escribir el nombre del proyecto.")
+        if st.session_state.project_id is not None:
+            st.caption("✅ Guardado automático activo")
+            st.session_state.live_sync = st.checkbox("👥 Ver al momento los cambios de otras cuadrillas", value=st.session_state.live_sync, help=f"Revisa el proyecto cada {SYNC_INTERVAL_S:.0f} s; sin esta opción los cambios llegan con la siguiente acción")
+            st.fragment(sync_monitor, run_every=SYNC_INTERVAL_S if st.session_state.live_sync else None)()
+    
+    # Mapas sin conexión
+    with st.expander("🛰️ Mapas sin conexión"):
+        tile_prefetch_panel()
+    
+    # Planta existente (as-built)
+    with st.expander("📥 Importar Planta Existente"):
+        plant_file = st.file_uploader("KML, KMZ o CSV", type=['kml', 'kmz', 'csv'], key="plant_file")
+        default_type = st.selectbox("Tipo cuando no se puede deducir", list(ELEMENT_PREFIXES), key="plant_default_type")
+        if plant_file is not None and st.button("📥 Importar", use_container_width=True):
+            try:
+                with st.spinner("Importando..."):
+                    summary = import_plant_file(plant_file, default_type)
+                st.success(f"✅ {summary['elements']} elementos y {summary['connections']} conexiones importados")
+                if summary['skipped']:
+                    st.warning(f"⚠️ {summary['skipped']} elementos omitidos (nombre repetido o vacío)")
+                if summary['unmatched_lines']:
+                    st.warning(f"⚠️ {summary['unmatched_lines']} líneas sin elementos en sus extremos")
+            except Exception as e:
+                st.error(f"❌ Error al importar: {e}")
+    
+    if autosave_project(project_name, task_name):
+        st.rerun()
     if project_name != st.session_state.project_name:
         st.session_state.project_name = project_name
     if task_name != st.session_state.task_name:
         st.session_state.task_name = task_name
 
 # Mapa
+profiler.mark('map_build')
 st.subheader("🗺️ Mapa de Ubicaciones")
 
 # Centrar mapa
-if st.session_state.elements:
-    last_elem = st.session_state.elements[-1]
+if st.session_state.store.elements:
+    last_elem = st.session_state.store.elements[-1]
     st.session_state.map_center = [last_elem['lat'], last_elem['lon']]
 elif st.session_state.temp_location:
     st.session_state.map_center = [st.session_state.temp_location['lat'], st.session_state.temp_location['lon']]
@@ -213,34 +604,34 @@ elif st.session_state.user_location and isinstance(st.session_state.user_locatio
 # Crear mapa con capa seleccionada
 m = folium.Map(location=st.session_state.map_center, zoom_start=18, zoom_control=True, scrollWheelZoom=True, dragging=True, prefer_canvas=True)
 selected_layer = st.session_state.get('selected_map_layer', 'hybrid')
-if selected_layer == 'streets':
-    folium.TileLayer('OpenStreetMap', name='Mapa Calles').add_to(m)
-elif selected_layer == 'satellite':
-    folium.TileLayer(tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', attr='Esri', name='Satélite').add_to(m)
-elif selected_layer == 'satellite_google':
-    folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}', attr='Google', name='Satélite Google').add_to(m)
-elif selected_layer == 'terrain':
-    folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}', attr='Google', name='Terreno').add_to(m)
-else:
-    folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', attr='Google', name='Híbrido').add_to(m)
+# Teselas a través del proxy local con caché (funciona sin conexión en las zonas ya vistas o descargadas)
+tile_proxy = running_tile_proxy()
+add_tile_layer(m, selected_layer, tile_proxy.url_template(selected_layer) if tile_proxy else None)
 
-# Agregar elementos
-for elem in st.session_state.elements:
-    style = get_element_style(elem['type'])
-    folium.Marker([elem['lat'], elem['lon']], popup=f"<b>{elem['name']}</b><br>{elem['type']}", tooltip=elem['name'], icon=folium.Icon(color=style['color'], icon=style['icon'])).add_to(m)
+store = st.session_state.store
+use_fast_map = st.session_state.fast_map or len(store.elements) > FAST_MAP_THRESHOLD
+viewport_box = pad_bounds(st.session_state.map_bounds) if st.session_state.viewport_only and st.session_state.map_bounds else None
 
-# Agregar conexiones
-for conn in st.session_state.connections:
-    elem_a = next((e for e in st.session_state.elements if e['name'] == conn['element_a']), None)
-    elem_b = next((e for e in st.session_state.elements if e['name'] == conn['element_b']), None)
-    if elem_a and elem_b:
-        color = 'blue' if conn['construction_type'] == 'Ducto' else 'red' if conn['construction_type'] == 'Aerial Route' else 'green'
-        folium.PolyLine([[elem_a['lat'], elem_a['lon']], [elem_b['lat'], elem_b['lon']]], color=color, weight=3, opacity=0.7, popup=f"{conn['construction_type']}<br>{conn['distance']:.2f} m").add_to(m)
+if use_fast_map:
+    # Capas agrupadas, recalculadas solo cuando cambia la revisión del proyecto
+    layer_cache = st.session_state.map_layer_cache
+    rows = layer_cache.get('elements', store.revision, lambda: element_rows(store.elements, get_element_style))
+    layers = layer_cache.get('connections', store.revision, lambda: connection_layers(store))
+    add_connection_layers(m, layers, viewport_box)
+    add_clustered_elements(m, rows, viewport_box)
+else:
+    add_element_markers(m, store.elements)
+    add_connection_lines(m, store)
 
 # Marcador temporal
 if st.session_state.temp_location:
     folium.Marker([st.session_state.temp_location['lat'], st.session_state.temp_location['lon']], popup="📍 Nueva ubicación", tooltip="Nueva ubicación", icon=folium.Icon(color='lightgreen', icon='star', prefix='fa')).add_to(m)
 
+# Elemento seleccionado
+selected_elem = st.session_state.store.get(st.session_state.selected_element) if st.session_state.selected_element else None
+if selected_elem:
+    folium.CircleMarker([selected_elem['lat'], selected_elem['lon']], radius=16, color='yellow', weight=4, fill=False, tooltip=f"Seleccionado: {selected_elem['name']}").add_to(m)
+
 # Marcador ubicación usuario (azul)
 if st.session_state.user_location and isinstance(st.session_state.user_location, dict):
     if 'lat' in st.session_state.user_location and 'lon' in st.session_state.user_location:
@@ -249,23 +640,58 @@ if st.session_state.user_location and isinstance(st.session_state.user_location,
         if accuracy > 0:
             folium.Circle([st.session_state.user_location['lat'], st.session_state.user_location['lon']], radius=accuracy, color='blue', fill=True, fillColor='blue', fillOpacity=0.2, popup=f"Precisión: {accuracy:.1f} m").add_to(m)
 
-map_data = st_folium(m, width=None, height=400, returned_objects=["last_clicked"], key=f"map_{st.session_state.selected_map_layer}")
+returned_objects = ["last_clicked", "bounds"] if st.session_state.viewport_only else ["last_clicked"]
+profiler.mark('st_folium')
+map_data = st_folium(m, width=None, height=400, returned_objects=returned_objects, key=f"map_{st.session_state.selected_map_layer}")
 
-# Capturar click
+if st.session_state.viewport_only and map_data and map_data.get('bounds') and (map_data['bounds'].get('_southWest') or {}).get('lat') is not None:
+    if map_data['bounds'] != st.session_state.map_bounds:
+        st.session_state.map_bounds = map_data['bounds']
+        st.rerun()
+
+profiler.mark('map_events')
+# Capturar click (cada click se procesa una vez; cerca de un elemento existente lo selecciona)
 if map_data and map_data.get('last_clicked'):
     clicked_lat = map_data['last_clicked']['lat']
     clicked_lon = map_data['last_clicked']['lng']
-    is_new_click = True
-    if st.session_state.temp_location:
-        lat_diff = abs(st.session_state.temp_location['lat'] - clicked_lat)
-        lon_diff = abs(st.session_state.temp_location['lon'] - clicked_lon)
-        is_new_click = (lat_diff > 0.00001 or lon_diff > 0.00001)
+    is_new_click = st.session_state.last_click != (clicked_lat, clicked_lon)
     if is_new_click:
-        st.session_state.temp_location = {'lat': clicked_lat, 'lon': clicked_lon}
-        st.session_state.show_element_form = True
+        st.session_state.last_click = (clicked_lat, clicked_lon)
+        snapped = snap_to_element(clicked_lat, clicked_lon, st.session_state.snap_radius)
+        if snapped is not None:
+            st.session_state.selected_element = snapped['name']
+            st.session_state.temp_location = None
+            st.session_state.show_element_form = False
+        else:
+            st.session_state.selected_element = None
+            st.session_state.temp_location = {'lat': clicked_lat, 'lon': clicked_lon}
+            st.session_state.show_element_form = True
         st.rerun()
 
+# Elemento seleccionado con un click
+if selected_elem:
+    distance_to_click = calculate_distance(selected_elem['lat'], selected_elem['lon'], *st.session_state.last_click) if st.session_state.last_click else 0
+    st.info(f"📌 Elemento seleccionado: **{selected_elem['name']}** ({selected_elem['type']}) — click a {distance_to_click:.1f} m")
+    last_elem = st.session_state.store.elements[-1]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button(f"🔗 Conectar con {last_elem['name']}", use_container_width=True, disabled=last_elem is selected_elem):
+            create_auto_connection(last_elem, selected_elem)
+            st.session_state.selected_element = None
+            st.rerun()
+    with col2:
+        if st.button("➕ Nuevo elemento en el click", use_container_width=True, disabled=not st.session_state.last_click):
+            st.session_state.temp_location = {'lat': st.session_state.last_click[0], 'lon': st.session_state.last_click[1]}
+            st.session_state.show_element_form = True
+            st.session_state.selected_element = None
+            st.rerun()
+    with col3:
+        if st.button("✖️ Deseleccionar", use_container_width=True):
+            st.session_state.selected_element = None
+            st.rerun()
+
 # Formulario crear elemento
+profiler.mark('element_form')
 if st.session_state.show_element_form and st.session_state.temp_location:
     st.success(f"📍 Ubicación seleccionada: {st.session_state.temp_location['lat']:.6f}, {st.session_state.temp_location['lon']:.6f}")
     is_from_gps = False
@@ -283,7 +709,7 @@ if st.session_state.show_element_form and st.session_state.temp_location:
             st.warning("⚠️ Ingresa el nombre del proyecto primero")
         else:
             element_type = st.selectbox("Tipo de Elemento", ["Poste", "Handhole", "Cierre de Empalme", "Edificio"], key="elem_type")
-            new_element = {'type': element_type, 'name': get_next_element_name(element_type), 'lat': st.session_state.temp_location['lat'], 'lon': st.session_state.temp_location['lon'], 'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            new_element = {'type': element_type, 'name': reserved_element_name(element_type), 'lat': st.session_state.temp_location['lat'], 'lon': st.session_state.temp_location['lon'], 'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
             st.info(f"📝 Nombre: **{new_element['name']}**")
             
             if element_type == "Poste":
@@ -326,28 +752,43 @@ if st.session_state.show_element_form and st.session_state.temp_location:
             st.write("**📷 Capturar Foto**")
             camera_photo = st.camera_input("Tomar foto con cámara", key="camera_input")
             if camera_photo is not None:
-                new_element['photo'] = base64.b64encode(camera_photo.read()).decode()
+                photo_bytes = camera_photo.getvalue()
+                new_element['photo_ref'] = get_photo_store().put(photo_bytes)
+                get_project_db().register_photo(new_element['photo_ref'], len(photo_bytes))
                 st.success("✅ Foto capturada")
             else:
                 uploaded_photo = st.file_uploader("O subir foto existente", type=['png', 'jpg', 'jpeg'], key="photo_upload")
                 if uploaded_photo is not None:
-                    new_element['photo'] = base64.b64encode(uploaded_photo.read()).decode()
+                    photo_bytes = uploaded_photo.getvalue()
+                    new_element['photo_ref'] = get_photo_store().put(photo_bytes)
+                    get_project_db().register_photo(new_element['photo_ref'], len(photo_bytes))
                     st.success("✅ Foto subida")
             
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("✅ Guardar Elemento", type="primary", use_container_width=True):
-                    st.session_state.elements.append(new_element)
-                    if st.session_state.auto_connect and len(st.session_state.elements) > 1:
-                        prev_elem = st.session_state.elements[-2]
-                        curr_elem = st.session_state.elements[-1]
-                        create_auto_connection(prev_elem, curr_elem)
-                        st.success(f"✅ {element_type} guardado y conectado: {new_element['name']}")
+                    # El vecino se busca antes de guardar, con la grilla de los elementos existentes
+                    prev_elem = None
+                    if st.session_state.auto_connect and st.session_state.store.elements:
+                        if st.session_state.auto_connect_mode == 'nearest':
+                            prev_elem = find_nearest_element(new_element)
+                        else:
+                            prev_elem = st.session_state.store.elements[-1]
+                    try:
+                        st.session_state.store.add_element(new_element)
+                    except ValueError as e:
+                        # Otra cuadrilla guardó el mismo nombre: el formulario reserva otro
+                        st.session_state.reserved_names.pop((st.session_state.project_name, element_type), None)
+                        st.warning(f"⚠️ {e}. Vuelve a guardar para usar un nombre nuevo.")
                     else:
-                        st.success(f"✅ {element_type} guardado: {new_element['name']}")
-                    st.session_state.temp_location = None
-                    st.session_state.show_element_form = False
-                    st.rerun()
+                        if prev_elem is not None:
+                            create_auto_connection(prev_elem, st.session_state.store.elements[-1])
+                            st.success(f"✅ {element_type} guardado y conectado: {new_element['name']}")
+                        else:
+                            st.success(f"✅ {element_type} guardado: {new_element['name']}")
+                        st.session_state.temp_location = None
+                        st.session_state.show_element_form = False
+                        st.rerun()
             with col2:
                 if st.button("❌ Cancelar", use_container_width=True):
                     st.session_state.temp_location = None
@@ -355,108 +796,60 @@ if st.session_state.show_element_form and st.session_state.temp_location:
                     st.rerun()
 
 # Elementos capturados
-if st.session_state.elements:
+profiler.mark('editors')
+if st.session_state.store.elements:
     st.divider()
     st.subheader("📊 Elementos Capturados")
-    col1, col2 = st.columns([3, 1])
+    col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
-        st.metric("Total elementos", len(st.session_state.elements))
+        st.metric("Total elementos", len(st.session_state.store.elements))
     with col2:
+        reconnect_modes = {'sequential': "Orden de captura", 'nearest': "Vecino más cercano", 'mst': "Árbol mínimo (MST)"}
+        reconnect_mode = st.selectbox("Modo de reconexión", list(reconnect_modes), format_func=reconnect_modes.get, key="reconnect_mode")
+    with col3:
         if st.button("🔄 Reconectar Todo", use_container_width=True):
-            st.session_state.connections = []
-            for i in range(len(st.session_state.elements) - 1):
-                create_auto_connection(st.session_state.elements[i], st.session_state.elements[i + 1])
+            reconnect_all(reconnect_mode)
             st.success("✅ Conexiones recreadas")
             st.rerun()
     
-    postes = [e for e in st.session_state.elements if e['type'] == 'Poste']
-    handholes = [e for e in st.session_state.elements if e['type'] == 'Handhole']
-    cierres = [e for e in st.session_state.elements if e['type'] == 'Cierre de Empalme']
-    edificios = [e for e in st.session_state.elements if e['type'] == 'Edificio']
-    
-    if postes:
-        with st.expander(f"🔴 Postes ({len(postes)})", expanded=True):
-            df_postes = pd.DataFrame(postes)
-            display_cols = [col for col in df_postes.columns if col != 'photo']
-            edited_postes = st.data_editor(df_postes[display_cols], use_container_width=True, hide_index=True, num_rows="dynamic", key="postes_editor")
-            if st.button("💾 Guardar Cambios Postes", type="primary", use_container_width=True, key="save_postes"):
-                for idx, row in edited_postes.iterrows():
-                    elem_idx = next(i for i, e in enumerate(st.session_state.elements) if e['name'] == row['name'])
-                    for col in display_cols:
-                        if col in row:
-                            st.session_state.elements[elem_idx][col] = row[col]
-                st.success("✅ Cambios guardados")
-                st.rerun()
-    
-    if handholes:
-        with st.expander(f"🔵 Handholes ({len(handholes)})", expanded=True):
-            df_handholes = pd.DataFrame(handholes)
-            display_cols = [col for col in df_handholes.columns if col != 'photo']
-            edited_handholes = st.data_editor(df_handholes[display_cols], use_container_width=True, hide_index=True, num_rows="dynamic", key="handholes_editor")
-            if st.button("💾 Guardar Cambios Handholes", type="primary", use_container_width=True, key="save_handholes"):
-                for idx, row in edited_handholes.iterrows():
-                    elem_idx = next(i for i, e in enumerate(st.session_state.elements) if e['name'] == row['name'])
-                    for col in display_cols:
-                        if col in row:
-                            st.session_state.elements[elem_idx][col] = row[col]
-                st.success("✅ Cambios guardados")
-                st.rerun()
-    
-    if cierres:
-        with st.expander(f"🟢 Cierres de Empalme ({len(cierres)})", expanded=True):
-            df_cierres = pd.DataFrame(cierres)
-            display_cols = [col for col in df_cierres.columns if col != 'photo']
-            edited_cierres = st.data_editor(df_cierres[display_cols], use_container_width=True, hide_index=True, num_rows="dynamic", key="cierres_editor")
-            if st.button("💾 Guardar Cambios Cierres", type="primary", use_container_width=True, key="save_cierres"):
-                for idx, row in edited_cierres.iterrows():
-                    elem_idx = next(i for i, e in enumerate(st.session_state.elements) if e['name'] == row['name'])
-                    for col in display_cols:
-                        if col in row:
-                            st.session_state.elements[elem_idx][col] = row[col]
-                st.success("✅ Cambios guardados")
-                st.rerun()
-    
-    if edificios:
-        with st.expander(f"🟠 Edificios ({len(edificios)})", expanded=True):
-            df_edificios = pd.DataFrame(edificios)
-            display_cols = [col for col in df_edificios.columns if col != 'photo']
-            edited_edificios = st.data_editor(df_edificios[display_cols], use_container_width=True, hide_index=True, num_rows="dynamic", key="edificios_editor")
-            if st.button("💾 Guardar Cambios Edificios", type="primary", use_container_width=True, key="save_edificios"):
-                for idx, row in edited_edificios.iterrows():
-                    elem_idx = next(i for i, e in enumerate(st.session_state.elements) if e['name'] == row['name'])
-                    for col in display_cols:
-                        if col in row:
-                            st.session_state.elements[elem_idx][col] = row[col]
-                st.success("✅ Cambios guardados")
-                st.rerun()
+    for element_type, title, short_name, key in ELEMENT_EDITORS:
+        elements, df_elements = element_frame(element_type)
+        if not elements:
+            continue
+        with st.expander(f"{title} ({len(elements)})", expanded=True):
+            # La clave cambia con la revisión del tipo para descartar ediciones ya aplicadas
+            editor_key = f"{key}_editor_{st.session_state.store.type_revision(element_type)}"
+            st.data_editor(df_elements, use_container_width=True, hide_index=True, num_rows="dynamic", key=editor_key)
+            if st.button(f"💾 Guardar Cambios {short_name}", type="primary", use_container_width=True, key=f"save_{key}"):
+                problems = apply_element_edits(element_type, elements, st.session_state.get(editor_key, {}))
+                for problem in problems:
+                    st.warning(f"⚠️ {problem}")
+                if not problems:
+                    st.success("✅ Cambios guardados")
+                    st.rerun()
     
     with st.expander("🗑️ Eliminar Elemento"):
-        element_to_delete = st.selectbox("Seleccionar elemento", [""] + [e['name'] for e in st.session_state.elements])
+        element_to_delete = st.selectbox("Seleccionar elemento", [""] + st.session_state.store.names())
         if element_to_delete and st.button("Confirmar Eliminación", type="primary"):
-            st.session_state.elements = [e for e in st.session_state.elements if e['name'] != element_to_delete]
-            st.session_state.connections = [c for c in st.session_state.connections if c['element_a'] != element_to_delete and c['element_b'] != element_to_delete]
+            st.session_state.store.delete_element(element_to_delete)
             st.success(f"✅ {element_to_delete} eliminado")
             st.rerun()
 
 # Conexiones
-if st.session_state.connections:
+profiler.mark('connections')
+if st.session_state.store.connections:
     st.divider()
     st.subheader("🔗 Conexiones")
-    total_distance = sum(c['distance'] for c in st.session_state.connections)
+    total_distance = sum(c.get('distance') or 0 for c in st.session_state.store.connections)
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Total conexiones", len(st.session_state.connections))
+        st.metric("Total conexiones", len(st.session_state.store.connections))
     with col2:
         st.metric("Distancia total", f"{total_distance:.2f} m")
     
-    df_connections = pd.DataFrame(st.session_state.connections)
-    df_connections['distance'] = df_connections['distance'].round(2)
-    if 'infraestructura' not in df_connections.columns:
-        df_connections['infraestructura'] = 'Nuevo'
-    cols_order = ['element_a', 'element_b', 'construction_type', 'infraestructura', 'distance']
-    df_connections = df_connections[cols_order]
-    
-    edited_connections = st.data_editor(df_connections, use_container_width=True, hide_index=True, num_rows="dynamic", key="connections_editor",
+    connections, df_connections = connection_frame()
+    editor_key = f"connections_editor_{st.session_state.store.connections_revision}"
+    st.data_editor(df_connections, use_container_width=True, hide_index=True, num_rows="dynamic", key=editor_key,
         column_config={
             "element_a": st.column_config.TextColumn("Elemento A"),
             "element_b": st.column_config.TextColumn("Elemento B"),
@@ -468,27 +861,30 @@ if st.session_state.connections:
     col_save, col_delete = st.columns(2)
     with col_save:
         if st.button("💾 Guardar Cambios Conexiones", type="primary", use_container_width=True):
-            st.session_state.connections = edited_connections.to_dict('records')
-            st.success("✅ Cambios guardados")
-            st.rerun()
+            problems = apply_connection_edits(connections, st.session_state.get(editor_key, {}))
+            for problem in problems:
+                st.warning(f"⚠️ {problem}")
+            if not problems:
+                st.success("✅ Cambios guardados")
+                st.rerun()
     with col_delete:
         if st.button("🗑️ Limpiar todas", use_container_width=True):
-            st.session_state.connections = []
+            st.session_state.store.clear_connections()
             st.success("✅ Conexiones eliminadas")
             st.rerun()
 
 # Agregar conexión manual
-if len(st.session_state.elements) >= 2:
+if len(st.session_state.store.elements) >= 2:
     st.divider()
     with st.expander("➕ Agregar Conexión Manual"):
-        element_names = [e['name'] for e in st.session_state.elements]
+        element_names = st.session_state.store.names()
         col1, col2 = st.columns(2)
         with col1:
             elem_a_name = st.selectbox("Elemento A", element_names, key="manual_conn_a")
         with col2:
             elem_b_name = st.selectbox("Elemento B", [e for e in element_names if e != elem_a_name], key="manual_conn_b")
-        elem_a = next((e for e in st.session_state.elements if e['name'] == elem_a_name), None)
-        elem_b = next((e for e in st.session_state.elements if e['name'] == elem_b_name), None)
+        elem_a = st.session_state.store.get(elem_a_name)
+        elem_b = st.session_state.store.get(elem_b_name)
         suggested_type = suggest_construction_type(elem_a['type'], elem_b['type']) if elem_a and elem_b else "Aerial Route"
         col1, col2 = st.columns(2)
         with col1:
@@ -498,30 +894,20 @@ if len(st.session_state.elements) >= 2:
         if st.button("Crear Conexión Manual", type="primary", use_container_width=True, key="manual_conn_btn"):
             if elem_a and elem_b:
                 distance = calculate_distance(elem_a['lat'], elem_a['lon'], elem_b['lat'], elem_b['lon'])
-                st.session_state.connections.append({'element_a': elem_a_name, 'element_b': elem_b_name, 'construction_type': construction_type, 'infraestructura': infraestructura, 'distance': distance})
+                st.session_state.store.add_connection({'element_a': elem_a_name, 'element_b': elem_b_name, 'construction_type': construction_type, 'infraestructura': infraestructura, 'distance': distance})
                 st.success(f"✅ Conexión creada: {distance:.2f} m")
                 st.rerun()
 
 # Exportación
-if st.session_state.elements:
+profiler.mark('export')
+if st.session_state.store.elements:
     st.divider()
     st.subheader("📤 Exportar")
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        df_export = pd.DataFrame(st.session_state.elements)
-        csv = df_export.to_csv(index=False)
-        st.download_button("📄 CSV Elementos", data=csv, file_name=f"{st.session_state.project_name}_elementos.csv", mime="text/csv", use_container_width=True)
-    with col2:
-        if st.session_state.connections:
-            df_conn = pd.DataFrame(st.session_state.connections)
-            csv_conn = df_conn.to_csv(index=False)
-            st.download_button("📄 CSV Conexiones", data=csv_conn, file_name=f"{st.session_state.project_name}_conexiones.csv", mime="text/csv", use_container_width=True)
-    with col3:
-        try:
-            kml_content = export_to_kml()
-            st.download_button("🗺️ KML", data=kml_content, file_name=f"{st.session_state.project_name}_survey.kml", mime="application/vnd.google-earth.kml+xml", use_container_width=True)
-        except:
-            st.button("🗺️ KML", disabled=True, use_container_width=True)
+    # Mientras haya exportaciones en segundo plano, solo esta sección se actualiza cada segundo
+    polling = st.session_state.export_jobs.running()
+    st.fragment(export_panel, run_every=1.0 if polling else None)(polling)
 
 st.divider()
-st.caption(f"Site Survey - {st.session_state.project_name or 'Sin proyecto'} | {len(st.session_state.elements)} elementos | {len(st.session_state.connections)} conexiones")
+st.caption(f"Site Survey - {st.session_state.project_name or 'Sin proyecto'} | {len(st.session_state.store.elements)} elementos | {len(st.session_state.store.connections)} conexiones")
+
+profiler.finish(photos=photo_usage)
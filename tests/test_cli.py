@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import location_kml_cli
+from location_kml_cli import (SALIDA_CON_FALLOS, SALIDA_OK, SALIDA_SALIDAS_REPETIDAS, SALIDA_SIN_ARCHIVOS,
+                              SalidasRepetidas, main, salidas_repetidas)
+
+CSV = "nombre,latitud,longitud\nP1,31.69,-106.42\nP2,31.70,-106.43\n"
+
+
+def test_codigos_de_salida_distintos():
+    codigos = [SALIDA_OK, SALIDA_CON_FALLOS, SALIDA_SIN_ARCHIVOS, SALIDA_SALIDAS_REPETIDAS]
+    assert len(set(codigos)) == len(codigos)
+
+
+def test_salidas_repetidas_lanza_excepcion_propia(tmp_path):
+    trabajos = [('norte/postes.csv', str(tmp_path / 'postes_mapa.kml')), ('sur/postes.csv', str(tmp_path / 'postes_mapa.kml'))]
+    with pytest.raises(SalidasRepetidas) as info:
+        salidas_repetidas(trabajos)
+    assert list(info.value.repetidas.values()) == [['norte/postes.csv', 'sur/postes.csv']]
+    salidas_repetidas(trabajos[:1])
+
+
+def test_main_convierte_y_resume(tmp_path):
+    (tmp_path / 'postes.csv').write_text(CSV)
+    resumen = tmp_path / 'resumen.json'
+    assert main([str(tmp_path / 'postes.csv'), '-j', '1', '--resumen', str(resumen)]) == SALIDA_OK
+    assert json.loads(resumen.read_text())['total']['puntos'] == 2
+    assert (tmp_path / 'postes_mapa.kml').exists()
+
+
+def test_main_sin_archivos(tmp_path):
+    assert main([str(tmp_path / 'no_existe.csv')]) == SALIDA_SIN_ARCHIVOS
+
+
+def test_main_salidas_repetidas(tmp_path, monkeypatch):
+    for nombre in ('a.csv', 'b.csv'):
+        (tmp_path / nombre).write_text(CSV)
+    monkeypatch.setattr(location_kml_cli, 'ruta_de_salida', lambda *args: str(tmp_path / 'unica.kml'))
+    assert main([str(tmp_path), '-j', '1', '-o', str(tmp_path / 'salida')]) == SALIDA_SALIDAS_REPETIDAS
+
+
+def test_main_no_confunde_otros_value_error(tmp_path, monkeypatch):
+    (tmp_path / 'postes.csv').write_text(CSV)
+
+    def falla(*args, **kwargs):
+        raise ValueError("otro error")
+
+    monkeypatch.setattr(location_kml_cli, 'convertir_lote', falla)
+    with pytest.raises(ValueError, match="otro error"):
+        main([str(tmp_path / 'postes.csv'), '-j', '1'])
@@ -0,0 +1,82 @@
+import numpy as np
+
+from kml_core.connections import can_connect, element_types, eligible_for, reconnect_pairs
+from kml_core.geo import GridIndex, minimum_spanning_tree, nearest_neighbor_pairs
+
+
+def make_elements(n, seed=3):
+    rng = np.random.default_rng(seed)
+    types = ['Poste', 'Handhole', 'Cierre de Empalme', 'Edificio']
+    return [
+        {'name': f'E{i}', 'type': types[i % 4] if i % 3 else 'Edificio',
+         'lat': 31.69 + rng.random() * 0.01, 'lon': -106.42 + rng.random() * 0.01}
+        for i in range(n)
+    ]
+
+
+def brute_mst_weight(index, allowed):
+    # Prim sobre el grafo completo de aristas permitidas (suma de longitudes en la proyección del índice)
+    n = len(index)
+    d = np.hypot(index.x[:, None] - index.x[None, :], index.y[:, None] - index.y[None, :])
+    d[~allowed] = np.inf
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True
+    best = d[0].copy()
+    total = 0.0
+    for _ in range(n - 1):
+        best[in_tree] = np.inf
+        j = int(np.argmin(best))
+        total += best[j]
+        in_tree[j] = True
+        best = np.minimum(best, d[j])
+    return total
+
+
+def test_reconnect_never_pairs_ineligible_types():
+    elements = make_elements(300)
+    for mode in ('nearest', 'mst'):
+        pairs = reconnect_pairs(elements, mode)
+        assert pairs
+        assert all(can_connect(elements[i]['type'], elements[j]['type']) for i, j in pairs)
+
+
+def test_nearest_pairs_pick_closest_eligible():
+    elements = make_elements(200)
+    lats = np.array([e['lat'] for e in elements])
+    lons = np.array([e['lon'] for e in elements])
+    index = GridIndex(lats, lons)
+    types = element_types(elements)
+    allowed = np.array([[can_connect(a, b) for b in types] for a in types]) & ~np.eye(len(types), dtype=bool)
+    d = np.hypot(index.x[:, None] - index.x[None, :], index.y[:, None] - index.y[None, :])
+    d[~allowed] = np.inf
+    expected = sorted({(min(i, j), max(i, j)) for i, j in enumerate(np.argmin(d, axis=1))})
+    assert reconnect_pairs(elements, 'nearest') == expected
+
+
+def test_mst_with_eligibility_is_minimal_spanning_tree():
+    elements = make_elements(150)
+    index = GridIndex(np.array([e['lat'] for e in elements]), np.array([e['lon'] for e in elements]))
+    types = element_types(elements)
+    allowed = np.array([[can_connect(a, b) for b in types] for a in types])
+    tree = reconnect_pairs(elements, 'mst')
+    assert len(tree) == len(elements) - 1
+    weight = sum(np.hypot(index.x[i] - index.x[j], index.y[i] - index.y[j]) for i, j in tree)
+    assert np.isclose(weight, brute_mst_weight(index, allowed))
+
+
+def test_mst_stops_when_components_cannot_be_joined():
+    # Ningún par es elegible: no se agrega ninguna arista y el bucle termina
+    lats = np.array([31.69, 31.691, 31.692])
+    lons = np.array([-106.42, -106.42, -106.42])
+    index = GridIndex(lats, lons)
+    assert minimum_spanning_tree(index, eligible=lambda i, c: np.zeros(len(c), dtype=bool)) == []
+    assert nearest_neighbor_pairs(index, eligible=lambda i, c: np.zeros(len(c), dtype=bool)) == []
+
+
+def test_eligible_for_new_element():
+    elements = make_elements(50)
+    index = GridIndex(np.array([e['lat'] for e in elements]), np.array([e['lon'] for e in elements]))
+    types = element_types(elements)
+    found, _ = index.nearest(31.695, -106.415, k=1, accept=eligible_for('Edificio', types))
+    assert types[found[0]] != 'Edificio'
+    assert eligible_for('Poste', types) is None
@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+import simplekml.base
+
+from kml_core.conversion import convertir_csv, crear_kml_desde_dataframe
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+# Filas: folders anidados, color con '#', espacios, latitud inválida, sin nombre, HTML en un campo
+CSV_REFERENCIA = os.path.join(FIXTURES, 'referencia.csv')
+
+
+def leer(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(autouse=True)
+def ids_simplekml():
+    # simplekml numera los ids con un contador global: se reinicia para que la salida sea reproducible
+    simplekml.base.Kmlable._globalid = 0
+
+
+def test_crear_kml_desde_dataframe_igual_a_referencia(tmp_path):
+    salida = tmp_path / 'salida.kml'
+    assert crear_kml_desde_dataframe(pd.read_csv(CSV_REFERENCIA), str(salida)) == (5, 2, None)
+    assert leer(salida) == leer(os.path.join(FIXTURES, 'referencia.kml'))
+
+
+def test_convertir_csv_igual_a_referencia(tmp_path):
+    salida = tmp_path / 'salida.kml'
+    assert convertir_csv(CSV_REFERENCIA, str(salida)) == (5, 2, None)
+    assert leer(salida) == leer(os.path.join(FIXTURES, 'referencia.kml'))
+
+
+def test_convertir_csv_streaming_igual_a_referencia(tmp_path):
+    salida = tmp_path / 'salida.kml'
+    assert convertir_csv(CSV_REFERENCIA, str(salida), streaming=True) == (5, 2, None)
+    assert leer(salida) == leer(os.path.join(FIXTURES, 'referencia_streaming.kml'))
+
+
+MODOS = [{}, {'streaming': True}, {'kmz': True}, {'teselas': True}]
+
+
+@pytest.mark.parametrize('modo', MODOS)
+def test_csv_solo_con_encabezado_da_kml_vacio(tmp_path, modo):
+    entrada = tmp_path / 'vacio.csv'
+    entrada.write_text('nombre,latitud,longitud\n')
+    salida = tmp_path / 'salida.out'
+    assert convertir_csv(str(entrada), str(salida), **modo) == (0, 0, None)
+    assert salida.exists()
+
+
+@pytest.mark.parametrize('modo', MODOS)
+def test_csv_sin_columnas_requeridas_da_el_mismo_error(tmp_path, modo):
+    entrada = tmp_path / 'malo.csv'
+    entrada.write_text('nombre,x,y\n')
+    assert convertir_csv(str(entrada), str(tmp_path / 'salida.out'), **modo) == (0, 0, "No se encontró la columna: latitud")
@@ -0,0 +1,40 @@
+import numpy as np
+
+from kml_core.geo import duplicate_of, haversine
+
+
+def brute_duplicate_of(lats, lons, radius_m):
+    result = np.full(len(lats), -1)
+    kept = []
+    for k in range(len(lats)):
+        for i in kept:
+            if haversine(lats[i], lons[i], lats[k], lons[k]) <= radius_m:
+                result[k] = i
+                break
+        else:
+            kept.append(k)
+    return result
+
+
+def test_duplicate_of_matches_brute_force():
+    rng = np.random.default_rng(7)
+    lats = 31.69 + rng.random(600) * 0.002
+    lons = -106.42 + rng.random(600) * 0.002
+    assert (duplicate_of(lats, lons, 15.0) == brute_duplicate_of(lats, lons, 15.0)).all()
+
+
+def test_duplicate_of_does_not_merge_chains():
+    # Puntos cada 1 m con radio 1.5 m: se conserva uno de cada dos
+    lats = np.full(50, 31.69)
+    lons = -106.42 + np.arange(50) * (1.0 / 94_700)
+    result = duplicate_of(lats, lons, 1.5)
+    assert (result[::2] == -1).all()
+    assert (result[1::2] == np.arange(0, 50, 2)).all()
+
+
+def test_duplicate_of_identical_points():
+    # Muchas filas en la misma coordenada (0,0 o un centroide): sin lista de pares, tiempo y memoria lineales
+    n = 50_000
+    result = duplicate_of(np.zeros(n), np.zeros(n), 5.0)
+    assert result[0] == -1
+    assert (result[1:] == 0).all()
@@ -0,0 +1,56 @@
+import io
+
+from kml_core.plant_import import iter_kml_placemarks
+
+KML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+  <Style id="hh"><IconStyle><Icon><href>http://maps.google.com/mapfiles/kml/shapes/placemark_square.png</href></Icon></IconStyle></Style>
+  <Style id="adss"><LineStyle><color>ff0000ff</color></LineStyle></Style>
+  <StyleMap id="hh_map">
+    <Pair><key>normal</key><styleUrl>#hh</styleUrl></Pair>
+    <Pair><key>highlight</key><styleUrl>#adss</styleUrl></Pair>
+  </StyleMap>
+  <Folder>
+    <name>Registros</name>
+    <Placemark>
+      <name>HH-1</name>
+      <styleUrl>#hh_map</styleUrl>
+      <ExtendedData><Data name="origen"><name>no es el nombre</name><value>1</value></Data></ExtendedData>
+      <Point><coordinates>-106.42,31.69,0</coordinates></Point>
+    </Placemark>
+  </Folder>
+  <Placemark>
+    <name>Cierre inline</name>
+    <Style><IconStyle><Icon><href>http://maps.google.com/mapfiles/kml/shapes/target.png</href></Icon></IconStyle></Style>
+    <Point><coordinates>-106.41,31.70</coordinates></Point>
+  </Placemark>
+  <Placemark>
+    <name>Tramo</name>
+    <styleUrl>#adss</styleUrl>
+    <MultiGeometry><LineString><coordinates>-106.42,31.69 -106.41,31.70</coordinates></LineString></MultiGeometry>
+  </Placemark>
+  <Placemark>
+    <name>Sigue compartido</name>
+    <styleUrl>#hh</styleUrl>
+    <Point><coordinates>-106.40,31.71</coordinates></Point>
+  </Placemark>
+</Document>
+</kml>
+"""
+
+
+def test_kml_placemarks_read_shared_and_inline_styles():
+    placemarks = list(iter_kml_placemarks(io.BytesIO(KML)))
+    assert [(p['name'], p['kind'], p['folders']) for p in placemarks] == [
+        ('HH-1', 'point', ['Registros']),
+        ('Cierre inline', 'point', []),
+        ('Tramo', 'line', []),
+        ('Sigue compartido', 'point', []),
+    ]
+    assert placemarks[0]['style'].endswith('placemark_square.png')
+    assert placemarks[1]['style'].endswith('target.png')
+    assert placemarks[2]['style'] == 'ff0000ff'
+    assert placemarks[2]['coords'] == [(-106.42, 31.69), (-106.41, 31.70)]
+    # El Style inline no reemplaza a los compartidos
+    assert placemarks[3]['style'].endswith('placemark_square.png')
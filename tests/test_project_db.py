@@ -0,0 +1,62 @@
+import pytest
+
+from project_db import ElementConflict, ProjectDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    return ProjectDB(str(tmp_path / 'survey.db'))
+
+
+def seed(db):
+    project_id = db.create_project('Obra')
+    store = db.open(project_id)
+    store.add_element({'name': 'P001', 'type': 'Poste', 'lat': 31.69, 'lon': -106.42})
+    store.add_element({'name': 'BLD001', 'type': 'Edificio', 'lat': 31.691, 'lon': -106.421,
+                       'nombre_edificio': 'Torre A', 'photo_ref': 'abc123'})
+    store.add_connection({'element_a': 'P001', 'element_b': 'BLD001', 'construction_type': 'Aerial Route',
+                          'infraestructura': 'Nuevo', 'distance': 140.0, 'nota': 'cruce'})
+    return project_id, store
+
+
+def test_open_restores_elements_and_connections(db):
+    project_id, store = seed(db)
+    reopened = db.open(project_id)
+    assert reopened.elements == store.elements
+    assert reopened.connections == store.connections
+    assert reopened.get('P001') == {'type': 'Poste', 'name': 'P001', 'lat': 31.69, 'lon': -106.42}
+
+
+def test_duplicate_name_from_other_session_is_rejected(db):
+    project_id, store = seed(db)
+    other = db.open(project_id)
+    other.add_element({'name': 'P002', 'type': 'Poste', 'lat': 31.7, 'lon': -106.4})
+    with pytest.raises(ElementConflict):
+        store.add_element({'name': 'P002', 'type': 'Poste', 'lat': 31.71, 'lon': -106.41})
+    assert 'P002' not in store
+
+
+def test_pull_applies_changes_from_other_session(db):
+    project_id, store = seed(db)
+    other = db.open(project_id)
+    other.update_element('P001', {'lat': 31.6901})
+    other.add_element({'name': 'P002', 'type': 'Poste', 'lat': 31.7, 'lon': -106.4})
+    other.delete_element('BLD001')
+    assert store.listener.pending()
+    assert store.listener.pull() == 3
+    assert store.names() == ['P001', 'P002']
+    assert store.get('P001')['lat'] == 31.6901
+    assert store.connections == []
+    assert not store.listener.pending()
+
+
+def test_update_of_element_deleted_elsewhere_is_not_logged(db):
+    project_id, store = seed(db)
+    other = db.open(project_id)
+    other.delete_element('P001')
+    seq = db.last_seq(project_id)
+    store.update_element('P001', {'lat': 31.0})
+    assert db.last_seq(project_id) == seq
+    store.listener.pull()
+    assert 'P001' not in store
+    assert db.open(project_id).names() == ['BLD001']
@@ -0,0 +1,22 @@
+import xml.etree.ElementTree as ET
+
+from kml_core.project_store import ProjectStore
+from kml_core.survey_kml import export_to_kml
+
+NS = {'kml': 'http://www.opengis.net/kml/2.2'}
+
+
+def line_descriptions(distances):
+    elements = [{'name': f'P{i}', 'type': 'Poste', 'lat': 31.69 + i * 0.001, 'lon': -106.42} for i in range(len(distances) + 1)]
+    connections = [{'element_a': f'P{i}', 'element_b': f'P{i + 1}', 'construction_type': 'ADSS',
+                    'infraestructura': 'Nuevo', 'distance': d} for i, d in enumerate(distances)]
+    root = ET.fromstring(export_to_kml(ProjectStore(elements, connections), {}))
+    return [p.find('kml:description', NS).text for p in root.iter('{%s}Placemark' % NS['kml'])
+            if p.find('.//kml:LineString', NS) is not None]
+
+
+def test_connection_description_formats_distance():
+    descriptions = line_descriptions([111.1949, None, float('nan')])
+    assert '111.19 metros' in descriptions[0]
+    assert '<td>N/D</td>' in descriptions[1]
+    assert '<td>N/D</td>' in descriptions[2]
@@ -0,0 +1,87 @@
+import socket
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tile_proxy import PREFETCH_DISABLED, TileCache, TileProxy, count_tiles, tile_xy, upstream_sources
+
+BBOX = (31.689, -106.421, 31.691, -106.419)
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'\x89PNG\r\n\x1a\n' + self.path.encode() * 50
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    # Servidor de teselas propio (lo que SURVEY_TILE_UPSTREAM apunta en campo)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/{{source}}/{{z}}/{{x}}/{{y}}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_prefetch_disabled_for_public_layers(tmp_path, monkeypatch):
+    monkeypatch.delenv('SURVEY_TILE_UPSTREAM', raising=False)
+    cache = TileCache(str(tmp_path))
+    assert not cache.allow_prefetch
+    with pytest.raises(ValueError, match='no permiten descargas masivas'):
+        cache.prefetch('satellite', BBOX, [16])
+    assert cache.check_prefetch('hybrid', 1) == PREFETCH_DISABLED
+    assert cache.stats['fetched'] == 0
+
+
+def test_prefetch_from_self_hosted_upstream(tmp_path, upstream):
+    cache = TileCache(str(tmp_path), sources=upstream_sources(upstream), allow_prefetch=True)
+    summary = cache.prefetch('satellite', BBOX, [15, 16])
+    assert summary['fetched'] == summary['tiles'] == count_tiles(BBOX, [15, 16])
+    again = cache.prefetch('satellite', BBOX, [15, 16])
+    assert again['cached'] == again['tiles'] and again['fetched'] == 0
+
+
+def test_prefetch_refused_before_fetching_when_it_does_not_fit(tmp_path, upstream):
+    cache = TileCache(str(tmp_path), max_bytes=10 * 1024, sources=upstream_sources(upstream), allow_prefetch=True)
+    with pytest.raises(ValueError, match='no cabe en la caché'):
+        cache.prefetch('satellite', BBOX, [17, 18])
+    assert cache.stats['fetched'] == 0 and len(cache) == 0
+
+
+def test_cached_tiles_served_offline(tmp_path, upstream):
+    TileCache(str(tmp_path), sources=upstream_sources(upstream), allow_prefetch=True).prefetch('hybrid', BBOX, [16])
+    cache = TileCache(str(tmp_path), sources=upstream_sources(upstream), offline=True)
+    proxy = TileProxy(cache, port=0, public_url='http://127.0.0.1').start()
+    x, y = tile_xy(31.69, -106.42, 16)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{proxy.port}/tiles/hybrid/16/{x}/{y}") as response:
+            assert response.read().startswith(b'\x89PNG')
+        assert cache.stats['hits'] == 1
+    finally:
+        proxy.stop()
+
+
+def test_busy_port_fails_when_public_url_is_set(tmp_path, monkeypatch):
+    monkeypatch.delenv('SURVEY_TILE_PROXY_URL', raising=False)
+    busy = socket.socket()
+    busy.bind(('127.0.0.1', 0))
+    busy.listen()
+    port = busy.getsockname()[1]
+    try:
+        with pytest.raises(OSError, match='puerto configurado'):
+            TileProxy(TileCache(str(tmp_path)), port=port, public_url=f"http://127.0.0.1:{port}")
+        # Sin URL pública la URL se arma con el puerto que se obtuvo
+        proxy = TileProxy(TileCache(str(tmp_path)), port=port)
+        assert proxy.port != port and proxy.public_url.endswith(f":{proxy.port}")
+        proxy.server.server_close()
+    finally:
+        busy.close()
@@ -0,0 +1,512 @@
+"""
+Proxy local de teselas para el mapa del survey. Las teselas de los servidores de
+imágenes se guardan en disco (LRU con tamaño máximo) y se sirven desde ahí, así que
+las reejecuciones y las otras sesiones no las vuelven a descargar y las áreas en
+caché funcionan sin conexión. El área de un proyecto se puede descargar antes de
+salir a campo, en los niveles de zoom elegidos.
+
+Ejemplos:
+    python tile_proxy.py serve
+    python tile_proxy.py --upstream "http://teselas.local/{source}/{z}/{x}/{y}" serve
+    python tile_proxy.py --upstream "http://teselas.local/{source}/{z}/{x}/{y}" prefetch --project "Obra Norte" --zooms 15-18
+    python tile_proxy.py --upstream "http://teselas.local/{source}/{z}/{x}/{y}" prefetch --bbox 31.68 -106.44 31.70 -106.41 --source satellite
+
+Las capas públicas (Google, Esri, OpenStreetMap) solo se guardan a medida que el mapa
+las muestra: sus términos no permiten descargas masivas, así que prefetch necesita un
+servidor de teselas propio (--upstream o SURVEY_TILE_UPSTREAM).
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TILE_DIR = os.path.join(os.path.expanduser('~'), '.site_survey', 'tiles')
+DEFAULT_CACHE_MB = 2048
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_PREFETCH_ZOOMS = '15-18'
+# Margen alrededor de los elementos al descargar el área de un proyecto
+PREFETCH_MARGIN_M = 200
+# Una descarga previa mayor es casi siempre un bbox equivocado (un estado entero a zoom 18)
+MAX_PREFETCH_TILES = 50000
+# Tamaño supuesto de una tesela mientras la caché está vacía (JPEG/PNG de 256 px)
+TILE_BYTES_ESTIMATE = 25 * 1024
+PREFETCH_WORKERS = 4
+UPSTREAM_TIMEOUT_S = 5
+# Tras un error de red no se vuelve a intentar durante este tiempo: sin señal,
+# cada tesela esperaría el timeout completo
+OFFLINE_RETRY_S = 30
+USER_AGENT = 'site-survey-tile-proxy/1.0'
+MAX_LATITUDE = 85.05112878
+
+# Capas del mapa: URL de origen, atribución y nombre en el selector
+TILE_SOURCES = {
+    'hybrid': {'url': 'https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', 'attr': 'Google', 'name': 'Híbrido'},
+    'satellite': {'url': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}', 'attr': 'Esri', 'name': 'Satélite'},
+    'satellite_google': {'url': 'https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}', 'attr': 'Google', 'name': 'Satélite Google'},
+    'terrain': {'url': 'https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}', 'attr': 'Google', 'name': 'Terreno'},
+    'streets': {'url': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png', 'attr': '&copy; OpenStreetMap contributors', 'name': 'Mapa Calles'},
+}
+# Los términos de uso de Google, Esri y tile.openstreetmap.org no permiten descargas
+# masivas: las descargas previas solo se hacen desde un servidor de teselas propio
+# (SURVEY_TILE_UPSTREAM o --upstream); con las capas públicas solo se guarda lo que se ve
+PREFETCH_DISABLED = ("Las capas públicas (Google, Esri, OpenStreetMap) no permiten descargas masivas: "
+                     "configura un servidor de teselas propio con SURVEY_TILE_UPSTREAM")
+
+TILE_PATH = re.compile(r'^/tiles/(\w+)/(\d+)/(\d+)/(\d+)(?:\.\w+)?$')
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+def upstream_sources(template=None):
+    """
+    URL de origen por capa. Con template (o SURVEY_TILE_UPSTREAM), todas las capas
+    salen de ese servidor, p. ej. 'http://127.0.0.1:9000/{source}/{z}/{x}/{y}'
+    """
+    template = template or os.environ.get('SURVEY_TILE_UPSTREAM')
+    if template:
+        return {source: template.replace('{source}', source) for source in TILE_SOURCES}
+    return {source: info['url'] for source, info in TILE_SOURCES.items()}
+
+
+def parse_zooms(text):
+    """'15-18' o '14,16,18' -> lista de niveles de zoom"""
+    zooms = set()
+    for part in str(text).split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            zooms.update(range(int(first), int(last) + 1))
+        elif part:
+            zooms.add(int(part))
+    return sorted(zooms)
+
+
+def configured_zooms():
+    """Niveles de zoom de las descargas previas (SURVEY_TILE_ZOOMS, p. ej. '15-18')"""
+    return parse_zooms(os.environ.get('SURVEY_TILE_ZOOMS', DEFAULT_PREFETCH_ZOOMS))
+
+
+def tile_xy(lat, lon, zoom):
+    """Tesela (x, y) que contiene el punto en este zoom (Web Mercator / slippy map)"""
+    n = 2 ** zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_ranges(bbox, zooms):
+    """(zoom, rango x, rango y) que cubren bbox = (sur, oeste, norte, este) en cada zoom"""
+    south, west, north, east = bbox
+    for zoom in zooms:
+        x0, y0 = tile_xy(north, west, zoom)
+        x1, y1 = tile_xy(south, east, zoom)
+        yield zoom, range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def count_tiles(bbox, zooms):
+    return sum(len(xs) * len(ys) for _, xs, ys in tile_ranges(bbox, zooms))
+
+
+def iter_tiles(bbox, zooms):
+    for zoom, xs, ys in tile_ranges(bbox, zooms):
+        for x in xs:
+            for y in ys:
+                yield zoom, x, y
+
+
+def project_bbox(elements, margin_m=PREFETCH_MARGIN_M):
+    """(sur, oeste, norte, este) de los elementos más un margen en metros (None sin elementos)"""
+    if not elements:
+        return None
+    lats = [elem['lat'] for elem in elements]
+    lons = [elem['lon'] for elem in elements]
+    dlat = margin_m / 111320.0
+    dlon = margin_m / (111320.0 * max(math.cos(math.radians(sum(lats) / len(lats))), 0.01))
+    return min(lats) - dlat, min(lons) - dlon, max(lats) + dlat, max(lons) + dlon
+
+
+def tile_mime(data):
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class TileCache:
+    """
+    Teselas en disco bajo root/<source>/<z>/<x>/<y> con un índice LRU en memoria
+    (se reconstruye al iniciar con las fechas de modificación de los archivos, así
+    que el orden se conserva entre reinicios). Cada acierto toca el archivo; cuando
+    el total pasa de max_bytes se borran las teselas usadas hace más tiempo. Las que
+    faltan se piden al servidor de origen, salvo con 'offline'. Las descargas previas
+    (prefetch) solo se permiten con allow_prefetch: por defecto, cuando las capas salen
+    de SURVEY_TILE_UPSTREAM.
+    """
+
+    def __init__(self, root=None, max_bytes=None, sources=None, offline=False, timeout=UPSTREAM_TIMEOUT_S,
+                 allow_prefetch=None):
+        self.root = root or os.environ.get('SURVEY_TILE_DIR', DEFAULT_TILE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('SURVEY_TILE_CACHE_MB', DEFAULT_CACHE_MB)) * 2**20)
+        self.max_bytes = max_bytes
+        self.sources = sources or upstream_sources()
+        if allow_prefetch is None:
+            allow_prefetch = sources is None and bool(os.environ.get('SURVEY_TILE_UPSTREAM'))
+        self.allow_prefetch = allow_prefetch
+        self.offline = offline
+        self.timeout = timeout
+        self.stats = {'hits': 0, 'misses': 0, 'fetched': 0, 'failed': 0, 'evicted': 0}
+        self.total_bytes = 0
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                parts = os.path.relpath(path, self.root).split(os.sep)
+                if len(parts) != 4 or not all(part.isdigit() for part in parts[1:]):
+                    continue  # temporales de escrituras interrumpidas y archivos ajenos
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, (parts[0], *map(int, parts[1:])), stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.total_bytes += size
+
+    def path(self, source, z, x, y):
+        return os.path.join(self.root, source, str(z), str(x), str(y))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def online(self):
+        return not self.offline and time.monotonic() >= self._down_until
+
+    def get(self, source, z, x, y, fetch=True):
+        """Bytes de la tesela desde la caché, o del servidor de origen si falta (None si no hay)"""
+        key = (source, z, x, y)
+        data = self._read(key)
+        if data is not None:
+            return data
+        if not fetch or not self.online:
+            self._count('misses')
+            return None
+        data = self._fetch(key)
+        if data is not None:
+            self.put(key, data)
+        return data
+
+    def _read(self, key):
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        path = self.path(*key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Borrada por fuera del proxy
+            with self._lock:
+                self.total_bytes -= self._index.pop(key, 0)
+            return None
+        self._count('hits')
+        return data
+
+    def _count(self, stat):
+        # Los hilos del servidor y de las descargas comparten los contadores
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _fetch(self, key):
+        source, z, x, y = key
+        template = self.sources.get(source)
+        if template is None:
+            return None
+        request = urllib.request.Request(template.format(x=x, y=y, z=z), headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            # El servidor respondió: la tesela no existe o fue rechazada, pero hay red
+            logging.debug("Tesela %s: HTTP %s", key, e.code)
+            self._count('failed')
+            return None
+        except (urllib.error.URLError, OSError) as e:
+            logging.info("Sin conexión con el servidor de teselas (%s); se reintenta en %d s", e, OFFLINE_RETRY_S)
+            self._down_until = time.monotonic() + OFFLINE_RETRY_S
+            self._count('failed')
+            return None
+        self._count('fetched')
+        return data
+
+    def put(self, key, data):
+        path = self.path(*key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        # Siempre se conserva la tesela recién escrita
+        while self.total_bytes > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            self.stats['evicted'] += 1
+            try:
+                os.remove(self.path(*key))
+            except OSError:
+                pass
+
+    def usage(self):
+        with self._lock:
+            return {'tiles': len(self._index), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                    'online': self.online, **self.stats}
+
+    def estimated_bytes(self, tiles):
+        """Bytes aproximados de tantas teselas (tamaño medio de la caché, o TILE_BYTES_ESTIMATE si está vacía)"""
+        with self._lock:
+            average = self.total_bytes / len(self._index) if self._index else TILE_BYTES_ESTIMATE
+        return int(tiles * average)
+
+    def check_prefetch(self, source, total):
+        """Mensaje de por qué no se puede descargar el área (None si se puede)"""
+        if not self.allow_prefetch:
+            return PREFETCH_DISABLED
+        if source not in self.sources:
+            return f"Capa desconocida: {source}"
+        if total > MAX_PREFETCH_TILES:
+            return f"El área tiene {total} teselas (máximo {MAX_PREFETCH_TILES}): reduce el área o los niveles de zoom"
+        # Toda el área tiene que caber: si no, las primeras teselas se descartan antes de terminar
+        estimate = self.estimated_bytes(total)
+        if estimate > self.max_bytes:
+            return (f"El área tiene {total} teselas (unos {estimate / 2**20:.0f} MB) y no cabe en la caché "
+                    f"({self.max_bytes / 2**20:.0f} MB): reduce el área o los niveles de zoom")
+        return None
+
+    def prefetch(self, source, bbox, zooms, progress=None, workers=PREFETCH_WORKERS):
+        """
+        Descarga las teselas que faltan de bbox = (sur, oeste, norte, este) en estos
+        niveles de zoom. Devuelve los conteos de teselas, ya en caché, descargadas y fallidas.
+        ValueError (sin descargar nada) si check_prefetch no lo permite.
+        """
+        total = count_tiles(bbox, zooms)
+        error = self.check_prefetch(source, total)
+        if error:
+            raise ValueError(error)
+        summary = {'tiles': total, 'cached': 0, 'fetched': 0, 'failed': 0, 'bytes': 0}
+        missing = []
+        for z, x, y in iter_tiles(bbox, zooms):
+            if (source, z, x, y) in self:
+                summary['cached'] += 1
+            else:
+                missing.append((z, x, y))
+        done = summary['cached']
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tile_prefetch') as pool:
+            for data in pool.map(lambda tile: self.get(source, *tile), missing):
+                if data is None:
+                    summary['failed'] += 1
+                else:
+                    summary['fetched'] += 1
+                    summary['bytes'] += len(data)
+                done += 1
+                if progress and done % 25 == 0:
+                    progress(done / total)
+        if progress:
+            progress(1.0)
+        if summary['bytes'] > self.max_bytes:
+            # Teselas más grandes que lo estimado
+            logging.warning("La descarga (%d bytes) supera el tamaño de la caché: se descartaron teselas", summary['bytes'])
+        return summary
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        cache = self.server.cache
+        path = self.path.split('?', 1)[0]
+        if path == '/status':
+            return self._send(200, json.dumps(cache.usage()).encode(), 'application/json')
+        match = TILE_PATH.match(path)
+        if match is None or match.group(1) not in cache.sources:
+            return self._send(404, b'not found', 'text/plain')
+        data = cache.get(match.group(1), *map(int, match.groups()[1:]))
+        if data is None:
+            return self._send(504, b'tile not available', 'text/plain')
+        self._send(200, data, tile_mime(data), {'Cache-Control': 'max-age=86400'})
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("tile_proxy: " + format, *args)
+
+
+class TileProxy:
+    """
+    Servidor HTTP (en un hilo daemon) de /tiles/<source>/<z>/<x>/<y> desde una
+    TileCache. url_template(source) es la URL para la capa del mapa; el navegador
+    llega al proxy en public_url (SURVEY_TILE_PROXY_URL cuando la app no se abre en
+    el mismo equipo).
+    """
+
+    def __init__(self, cache, host=DEFAULT_HOST, port=DEFAULT_PORT, public_url=None):
+        self.cache = cache
+        public_url = public_url or os.environ.get('SURVEY_TILE_PROXY_URL')
+        try:
+            self.server = ThreadingHTTPServer((host, port), _TileHandler)
+        except OSError as e:
+            if public_url:
+                # Los navegadores buscan el proxy en public_url: otro puerto dejaría el mapa sin teselas
+                raise OSError(f"No se puede escuchar en {host}:{port} ({e.strerror or e}), "
+                              f"el puerto configurado para {public_url}") from e
+            # Puerto ocupado (otra instancia de la app): cualquier puerto libre, la URL usa el puerto real
+            self.server = ThreadingHTTPServer((host, 0), _TileHandler)
+        self.server.daemon_threads = True
+        self.server.cache = cache
+        self.port = self.server.server_address[1]
+        self.public_url = (public_url or f"http://{host}:{self.port}").rstrip('/')
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='tile_proxy', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url_template(self, source):
+        return f"{self.public_url}/tiles/{source}/{{z}}/{{x}}/{{y}}"
+
+
+def start_tile_proxy():
+    """
+    Proxy configurado desde el entorno, o None (por defecto): el mapa carga entonces
+    las teselas directo de los servidores. Se activa con SURVEY_TILE_PROXY=1, que solo
+    sirve para un navegador en el mismo equipo, o con SURVEY_TILE_PROXY_URL, la
+    dirección del proxy tal como la ven los navegadores (mismo esquema que la app: un
+    despliegue HTTPS necesita una URL HTTPS). Escucha en
+    SURVEY_TILE_HOST:SURVEY_TILE_PORT y usa SURVEY_TILE_DIR, SURVEY_TILE_CACHE_MB y
+    SURVEY_TILE_UPSTREAM.
+    """
+    public_url = os.environ.get('SURVEY_TILE_PROXY_URL')
+    if not public_url and os.environ.get('SURVEY_TILE_PROXY', '0').lower() not in _TRUE:
+        return None
+    cache = TileCache()
+    return TileProxy(cache, host=os.environ.get('SURVEY_TILE_HOST', DEFAULT_HOST),
+                     port=int(os.environ.get('SURVEY_TILE_PORT', DEFAULT_PORT)), public_url=public_url).start()
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Proxy local de teselas con caché en disco para el mapa del survey")
+    parser.add_argument('--dir', help="Directorio de la caché (por defecto SURVEY_TILE_DIR o ~/.site_survey/tiles)")
+    parser.add_argument('--max-mb', type=float, help="Tamaño máximo de la caché en MB")
+    parser.add_argument('--upstream', help="URL de origen para todas las capas, p. ej. http://127.0.0.1:9000/{source}/{z}/{x}/{y}")
+    parser.add_argument('-v', '--verbose', action='count', default=1, help="Más detalle en el log")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    serve = comandos.add_parser('serve', help="Servir teselas desde la caché")
+    serve.add_argument('--host', default=os.environ.get('SURVEY_TILE_HOST', DEFAULT_HOST))
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--offline', action='store_true', help="No pedir teselas al servidor de origen")
+
+    prefetch = comandos.add_parser('prefetch', help="Descargar un área a la caché")
+    area = prefetch.add_mutually_exclusive_group(required=True)
+    area.add_argument('--bbox', type=float, nargs=4, metavar=('SUR', 'OESTE', 'NORTE', 'ESTE'))
+    area.add_argument('--project', help="Nombre de un proyecto guardado del survey")
+    prefetch.add_argument('--zooms', help="Niveles de zoom, p. ej. 15-18 o 14,16,18 (por defecto SURVEY_TILE_ZOOMS o 15-18)")
+    prefetch.add_argument('--source', nargs='+', default=['hybrid'], choices=sorted(TILE_SOURCES))
+    prefetch.add_argument('--margen', type=float, default=PREFETCH_MARGIN_M, help="Metros alrededor de los elementos del proyecto")
+    prefetch.add_argument('-j', '--workers', type=int, default=PREFETCH_WORKERS)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING - 10 * min(args.verbose, 2),
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+    cache = TileCache(args.dir, int(args.max_mb * 2**20) if args.max_mb else None, upstream_sources(args.upstream),
+                      offline=getattr(args, 'offline', False),
+                      allow_prefetch=bool(args.upstream or os.environ.get('SURVEY_TILE_UPSTREAM')))
+
+    if args.comando == 'serve':
+        proxy = TileProxy(cache, args.host, args.port)
+        logging.warning("Sirviendo teselas en %s/tiles/<capa>/{z}/{x}/{y}", proxy.public_url)
+        try:
+            proxy.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.project:
+        from project_db import ProjectDB
+        db = ProjectDB()
+        project_id = db.find_project(args.project)
+        if project_id is None:
+            logging.error("No existe el proyecto %s", args.project)
+            return 2
+        bbox = project_bbox(db.load_store(project_id).elements, args.margen)
+        if bbox is None:
+            logging.error("El proyecto %s no tiene elementos", args.project)
+            return 2
+    else:
+        bbox = tuple(args.bbox)
+    zooms = parse_zooms(args.zooms) if args.zooms else configured_zooms()
+    resumen = {}
+    try:
+        for source in args.source:
+            resumen[source] = cache.prefetch(source, bbox, zooms, workers=args.workers)
+    except ValueError as e:
+        logging.error("%s", e)
+        return 2
+    print(json.dumps({'bbox': bbox, 'zooms': zooms, 'capas': resumen, 'cache': cache.usage()}, indent=2))
+    return 1 if any(r['failed'] for r in resumen.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())